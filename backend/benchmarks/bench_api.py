@@ -0,0 +1,303 @@
+"""
+End-to-end load test: drives the real FastAPI routes in-process (httpx ASGI transport, with a
+real login and Bearer token) against a simulated fleet on the local SSH device farm.
+
+Phases, each at --concurrency requests in flight:
+    add      POST /devices/add/ for --devices devices (a PAN-OS, Gaia and FortiGate mix), then
+             waits for their identification jobs to drain through the embedded job runner
+    list     GET /devices/list, paging through the whole inventory, --list-passes times
+    execute  POST /devices/execute/{name} --requests times over random devices
+
+For each phase it reports requests/s, p50/p99 latency and errors, plus the process's peak RSS.
+Storage is an in-memory Mongo stand-in (mongomock-motor) unless --mongo-url points at a real
+server, whose --mongo-db is dropped first. The farm runs in its own process; see fake_ssh.py.
+
+Baselines: --save-baseline writes the results; --baseline compares against a saved run and
+exits 1 if any phase's throughput dropped, or its p99 or the peak RSS grew, by more than
+--tolerance (a fraction). Compare runs made with the same options on the same machine.
+
+Usage (from backend/, with the usual environment for src.settings):
+    python -m benchmarks.bench_api --devices 300 --requests 1000 --concurrency 50 --latency 0.02 --jitter 0.01 \\
+        [--backend asyncssh] [--mongo-url mongodb://localhost:27017] [--save-baseline base.json | --baseline base.json] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.fake_ssh import PASSWORD, VENDORS, add_farm_arguments, farm_arguments
+
+COMMANDS = {
+    "palo_alto": ["show system info"],
+    "check_point": ["show version all"],
+    "fortinet": ["get system status"],
+}
+# Checked against a baseline: (key, higher is better)
+COMPARED = (("requests_per_s", True), ("p99_s", False))
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _start_farm(args):
+    command = [sys.executable, "-m", "benchmarks.fake_ssh", "--port", "0", *farm_arguments(args)]
+    farm = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = farm.stdout.readline().split()
+    if len(line) != 3 or line[0] != "listening":
+        farm.kill()
+        raise RuntimeError("Fake SSH farm did not start")
+    return farm, int(line[2])
+
+
+async def _phase(name, total, concurrency, request):
+    """
+    Run request(index) for every index in range(total), concurrency at a time, and time each.
+    request returns the response; anything but a 2xx counts as an error.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one(index):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await request(index)
+                if response.status_code >= 300:
+                    errors.append(f"{response.status_code} {response.text[:200]}")
+                    return
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "phase": name,
+        "requests": total,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": elapsed,
+        "requests_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": _percentile(latencies, 0.5),
+        "p99_s": _percentile(latencies, 0.99),
+    }
+
+
+async def _wait_for_jobs(db, timeout):
+    from src.utils.jobs import JOBS_COLLECTION
+
+    deadline = time.monotonic() + timeout
+    while await db[JOBS_COLLECTION].count_documents({"status": {"$in": ["queued", "running"]}}):
+        if time.monotonic() > deadline:
+            raise TimeoutError("Identification jobs did not drain")
+        await asyncio.sleep(0.2)
+
+
+async def _run(args):
+    # Imported here: SSH_PORT, SSH_BACKEND and the Mongo settings must be in the environment first
+    import httpx
+    from src.dependencies import close_mongo_connection, connect_to_mongo, get_database, get_db
+    from src.main import app
+    from src.settings import settings
+    from src.utils.indexes import ensure_indexes
+    from src.utils.jobs import job_runner
+    from src.utils.ssh import ssh_backend
+    from src.utils.topology import topology_index
+
+    if args.mongo_url:
+        connect_to_mongo()
+        db = get_db()
+        await db.client.drop_database(db.name)
+        await ensure_indexes(db)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        db = AsyncMongoMockClient()["bench"]
+
+        async def database():
+            return db
+
+        app.dependency_overrides[get_database] = database
+
+    await db["users"].insert_one({"username": "bench", "password": PASSWORD})
+    await topology_index.rebuild(db)
+    await job_runner.start(db)
+    vendors = list(VENDORS)
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            response = await client.post("/auth/login", json={"username": "bench", "password": PASSWORD})
+            response.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+
+            def add(index):
+                vendor = vendors[index % len(vendors)]
+                return client.post("/devices/add/", json={
+                    "name": f"bench-{index:06d}",
+                    "ip": args.ip,
+                    "device_type": vendor,
+                    "username": f"{vendor}-{index}",
+                    "password": PASSWORD,
+                })
+
+            results.append(await _phase("add", args.devices, args.concurrency, add))
+            identify_started = time.perf_counter()
+            await _wait_for_jobs(db, args.identify_timeout)
+            results[-1]["identify_drain_s"] = time.perf_counter() - identify_started
+            identified = await db["Devices"].count_documents({"identified_type": {"$nin": ["pending", "unknown"]}})
+            results[-1]["identified"] = identified
+
+            pages = 0
+
+            async def list_pass(index):
+                nonlocal pages
+                cursor = None
+                while True:
+                    params = {"limit": args.page_size, **({"cursor": cursor} if cursor else {})}
+                    response = await client.get("/devices/list", params=params)
+                    pages += 1
+                    if response.status_code >= 300:
+                        return response
+                    cursor = response.json()["next_cursor"]
+                    if not cursor:
+                        return response
+
+            list_result = await _phase("list", args.list_passes, args.concurrency, list_pass)
+            list_result["pages"] = pages
+            list_result["pages_per_s"] = pages / list_result["elapsed_s"] if list_result["elapsed_s"] else 0.0
+            results.append(list_result)
+
+            rng = random.Random(args.seed)
+            targets = [rng.randrange(args.devices) for _ in range(args.requests)]
+
+            def execute(index):
+                device = targets[index]
+                vendor = vendors[device % len(vendors)]
+                return client.post(f"/devices/execute/bench-{device:06d}", json={"commands": COMMANDS[vendor], "mode": args.mode})
+
+            results.append(await _phase("execute", args.requests, args.concurrency, execute))
+    finally:
+        await job_runner.stop()
+        await ssh_backend.close()
+        if args.mongo_url:
+            close_mongo_connection()
+    return {
+        "options": {
+            "backend": settings.SSH_BACKEND,
+            "storage": "mongo" if args.mongo_url else "memory",
+            "devices": args.devices,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mode": args.mode,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "output_bytes": args.output_bytes,
+        },
+        "phases": results,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _regressions(current, baseline, tolerance):
+    found = []
+    previous = {phase["phase"]: phase for phase in baseline["phases"]}
+    for phase in current["phases"]:
+        before = previous.get(phase["phase"])
+        if not before:
+            continue
+        for key, higher_is_better in COMPARED:
+            old, new = before[key], phase[key]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                found.append(f"{phase['phase']} {key}: {old:.4g} -> {new:.4g} ({change:+.0%})")
+    old_rss, new_rss = baseline["peak_rss_mb"], current["peak_rss_mb"]
+    if old_rss and (new_rss - old_rss) / old_rss > tolerance:
+        found.append(f"peak_rss_mb: {old_rss:.1f} -> {new_rss:.1f} ({(new_rss - old_rss) / old_rss:+.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=1000, help="Execute requests")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mode", choices=("exec", "shell"), default="exec")
+    parser.add_argument("--list-passes", type=int, default=20, help="Full paged walks of /devices/list")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--backend", default=None, help="SSH_BACKEND for the API (default: the configured one)")
+    parser.add_argument("--ip", default="127.0.0.1", help="Address the farm listens on; every device uses it")
+    parser.add_argument("--mongo-url", default=None, help="Use this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--mongo-db", default="bench_api", help="Database for --mongo-url; dropped before the run")
+    parser.add_argument("--identify-timeout", type=float, default=300.0)
+    parser.add_argument("--save-baseline", default=None, help="Write results here as the new baseline")
+    parser.add_argument("--baseline", default=None, help="Compare against this baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative change before it counts as a regression")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    add_farm_arguments(parser)
+    parser.set_defaults(latency=0.02)
+    args = parser.parse_args()
+
+    farm, port = _start_farm(args)
+    os.environ["SSH_PORT"] = str(port)
+    # Every device shares the farm's address, so the per-host SSH pool is sized per username
+    os.environ.setdefault("SSH_POOL_MAX_SESSIONS_PER_DEVICE", "1")
+    # ...and the per-IP fingerprint cache would give every device the first one's identity
+    os.environ["FINGERPRINT_CACHE_TTL"] = "0"
+    # ...and the governor's per-device limits and circuit breaker would treat the fleet as one device
+    os.environ.setdefault("GOVERNOR_DEVICE_CONCURRENCY", "100000")
+    os.environ.setdefault("GOVERNOR_DEVICE_RATE", "0")
+    os.environ.setdefault("GOVERNOR_SUBNET_CONCURRENCY", "100000")
+    os.environ.setdefault("GOVERNOR_FAILURE_THRESHOLD", "1000000")
+    if args.backend:
+        os.environ["SSH_BACKEND"] = args.backend
+    if args.mongo_url:
+        os.environ["MONGODB_URL"] = args.mongo_url
+        os.environ["DATABASE_NAME"] = args.mongo_db
+    else:
+        # mongomock cannot run the bulk writes the history store batches its inserts with
+        os.environ["HISTORY_ENABLED"] = "false"
+    try:
+        result = asyncio.run(_run(args))
+    finally:
+        farm.kill()
+
+    print(f"{'phase':<8} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in result["phases"]:
+        print(f"{r['phase']:<8} {r['requests']:>8} {r['errors']:>6} {r['requests_per_s']:>9.1f} {r['p50_s'] * 1e3:>8.1f} {r['p99_s'] * 1e3:>8.1f}")
+        if r["first_error"]:
+            print(f"  first error: {r['first_error']}")
+    add = result["phases"][0]
+    print(f"identified {add['identified']}/{add['requests']} in {add['identify_drain_s']:.2f}s; peak RSS {result['peak_rss_mb']:.1f} MB")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(result, indent=2))
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(result, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        regressions = _regressions(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Decrypt throughput of PasswordEncryptor before and after the key cache / envelope scheme.
+
+Runs three scenarios over the same set of records:
+  uncached   - per-record keys, cache cleared before every decrypt (one credentials_keys query each)
+  cached     - per-record keys served from the key cache
+  envelope   - master-key envelope tokens, no database access
+
+Usage (from backend/):
+    python -m benchmarks.bench_decrypt --records 2000 [--mongo-url mongodb://localhost:27017]
+
+Without --mongo-url an in-memory mongomock_motor database is used if it is installed; its
+round-trips are far cheaper than a real server, so the uncached numbers are a lower bound.
+"""
+import argparse
+import asyncio
+import time
+
+from cryptography.fernet import Fernet
+
+from src.settings import settings
+from src.utils import encryptor as encryptor_module
+from src.utils.encryptor import PasswordEncryptor
+
+
+def _database(mongo_url):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(mongo_url)["bench_decrypt"]
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()["bench_decrypt"]
+
+
+async def _run(label, encryptor, records, clear_cache):
+    started = time.perf_counter()
+    for token, record_id in records:
+        if clear_cache:
+            encryptor_module.key_cache.clear()
+        await encryptor.decrypt(token, record_id)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {len(records) / elapsed:>12,.0f} decrypts/s  ({elapsed * 1e6 / len(records):,.1f} us each)")
+
+
+async def main(record_count, mongo_url):
+    db = _database(mongo_url)
+    await db["credentials_keys"].drop()
+    encryptor = PasswordEncryptor(db)
+
+    settings.ENCRYPTION_MODE = "per_record"
+    legacy = [(await encryptor.encrypt(f"secret-{i}", f"bench-{i}"), f"bench-{i}") for i in range(record_count)]
+
+    settings.ENCRYPTION_MODE = "envelope"
+    settings.MASTER_KEY = settings.MASTER_KEY or Fernet.generate_key().decode()
+    envelope = [(await encryptor.encrypt(f"secret-{i}"), f"bench-{i}") for i in range(record_count)]
+
+    await _run("uncached", encryptor, legacy, clear_cache=True)
+    # Warm the cache so the timed pass measures hits only
+    for token, record_id in legacy:
+        await encryptor.decrypt(token, record_id)
+    await _run("cached", encryptor, legacy, clear_cache=False)
+    await _run("envelope", encryptor, envelope, clear_cache=False)
+    await db["credentials_keys"].drop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--mongo-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.records, args.mongo_url))
@@ -0,0 +1,74 @@
+"""
+Parse throughput of the vendor parser registry against the generic fallback parser.
+
+The corpus lives in benchmarks/corpus/<identified_type>/<command>.txt; add a file there to
+cover a new command. For every sample this reports parses/s and MB/s for the registered
+parser and for parse_generic, plus the serialised response size with raw_output="full"
+and raw_output="drop".
+
+Usage (from backend/):
+    python -m benchmarks.bench_parsers [--iterations 200] [--json results.json]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from src.utils.parsers import get_parser, parse_generic, parse_output_to_json
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+def _throughput(func, output, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(output)
+    elapsed = time.perf_counter() - started
+    return iterations / elapsed, len(output.encode()) * iterations / elapsed / 1e6
+
+
+def run(iterations):
+    results = []
+    for sample in sorted(CORPUS_DIR.glob("*/*.txt")):
+        identified_type, command = sample.parent.name, sample.stem
+        output = sample.read_text()
+        parser = get_parser(identified_type, command)
+        registry_rate, registry_mbps = _throughput(parser, output, iterations)
+        generic_rate, generic_mbps = _throughput(parse_generic, output, iterations)
+        full_size = len(json.dumps(parse_output_to_json(output, command, identified_type, "full")))
+        drop_size = len(json.dumps(parse_output_to_json(output, command, identified_type, "drop")))
+        results.append({
+            "identified_type": identified_type,
+            "command": command,
+            "parser": parser.__name__,
+            "bytes": len(output.encode()),
+            "registry_parses_per_s": registry_rate,
+            "registry_mb_per_s": registry_mbps,
+            "generic_parses_per_s": generic_rate,
+            "generic_mb_per_s": generic_mbps,
+            "response_bytes_full": full_size,
+            "response_bytes_drop": drop_size,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print(f"{'sample':<52} {'parser':<26} {'registry MB/s':>14} {'generic MB/s':>13} {'full B':>9} {'drop B':>9}")
+    for r in results:
+        sample = f"{r['identified_type']}/{r['command']}"
+        print(
+            f"{sample:<52} {r['parser']:<26} {r['registry_mb_per_s']:>14.1f} {r['generic_mb_per_s']:>13.1f}"
+            f" {r['response_bytes_full']:>9} {r['response_bytes_drop']:>9}"
+        )
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+SSH backend comparison: Paramiko (blocking sessions on the SSH thread pool) against asyncssh
+(coroutines on the event loop), both through ssh_execute_raw against a local fake SSH server.
+
+Every simulated device is a distinct username, so each gets its own pooled session. All
+devices run their commands at once, up to --concurrency; the server answers each command
+after --latency seconds, which is what makes thread-bound concurrency visible. Each backend
+runs in a fresh subprocess so peak RSS and thread counts are its own.
+
+Usage (from backend/, with the usual environment for src.settings):
+    python -m benchmarks.bench_ssh_backends --devices 500 --concurrency 500 --latency 0.05 [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.fake_ssh import PASSWORD, FakeSSHServer
+
+BACKENDS = ("paramiko", "asyncssh")
+COMMANDS = ("show version", "show system info")
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def _measure(port, devices, concurrency, commands):
+    # Imported here: SSH_PORT and SSH_BACKEND must be in the environment before src.settings loads
+    from src.utils.ssh import ssh_backend, ssh_execute_raw
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+    peak_threads = threading.active_count()
+
+    async def device(index):
+        nonlocal peak_threads
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await ssh_execute_raw("127.0.0.1", f"bench-{index}", PASSWORD, commands)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                failures.append(str(e))
+            peak_threads = max(peak_threads, threading.active_count())
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    await asyncio.gather(*(device(i) for i in range(devices)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "backend": ssh_backend.name,
+        "devices": devices,
+        "succeeded": len(latencies),
+        "failed": len(failures),
+        "first_error": failures[0] if failures else None,
+        "elapsed_s": elapsed,
+        "devices_per_s": len(latencies) / elapsed,
+        "p50_s": _percentile(latencies, 0.5),
+        "p99_s": _percentile(latencies, 0.99),
+        "mean_s": statistics.fmean(latencies) if latencies else 0.0,
+        "peak_threads": peak_threads,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }
+    await ssh_backend.close()
+    return result
+
+
+def _run_backend(backend, port, args):
+    env = {**os.environ, "SSH_BACKEND": backend, "SSH_PORT": str(port), "SSH_POOL_MAX_SESSIONS_PER_DEVICE": "1"}
+    command = [
+        sys.executable, "-m", "benchmarks.bench_ssh_backends", "--child",
+        "--port", str(port), "--devices", str(args.devices), "--concurrency", str(args.concurrency),
+        "--commands", str(args.commands),
+    ]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--commands", type=int, default=2, help="Commands per device")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server delay per command in seconds")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    parser.add_argument("--port", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    commands = [COMMANDS[i % len(COMMANDS)] for i in range(args.commands)]
+    if args.child:
+        print(json.dumps(asyncio.run(_measure(args.port, args.devices, args.concurrency, commands))))
+        return
+
+    _, port = FakeSSHServer(latency=args.latency).start()
+    results = [_run_backend(backend, port, args) for backend in args.backends.split(",")]
+    print(f"{'backend':<10} {'ok':>6} {'fail':>5} {'devices/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'threads':>8} {'peak RSS MB':>12}")
+    for r in results:
+        print(
+            f"{r['backend']:<10} {r['succeeded']:>6} {r['failed']:>5} {r['devices_per_s']:>10.1f} {r['p50_s'] * 1e3:>8.1f}"
+            f" {r['p99_s'] * 1e3:>8.1f} {r['peak_threads']:>8} {r['peak_rss_mb']:>12.1f}"
+        )
+        if r["first_error"]:
+            print(f"  first error: {r['first_error']}")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+A local SSH device farm for benchmarks. It accepts password "bench" for any username and
+answers exec requests and interactive shells like a PAN-OS, Gaia or FortiGate firewall. The
+vendor is the username prefix ("palo_alto-17", "check_point-3", "fortinet-0"; anything else
+is PAN-OS), so one listening port serves a whole mixed fleet with distinct pooled sessions.
+
+Knobs: per-command latency with uniform jitter, a minimum output size (outputs are padded
+with filler lines), and failure rates for authentication and for commands (the connection
+is dropped mid-command, as a device reboot or a firewall session timeout would).
+
+In-process: FakeSSHServer(...).start() serves from a daemon thread with its own event loop.
+Standalone, so the farm does not share a GIL with the process under test:
+    python -m benchmarks.fake_ssh --port 2222 --latency 0.05 --jitter 0.02 --output-bytes 4096
+It prints "listening <host> <port>" once ready. Needs asyncssh.
+"""
+import argparse
+import asyncio
+import random
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import asyncssh
+
+PASSWORD = "bench"
+
+
+@dataclass(frozen=True)
+class VendorProfile:
+    prompt: str
+    outputs: Dict[str, str]
+
+
+VENDORS: Dict[str, VendorProfile] = {
+    "palo_alto": VendorProfile(
+        prompt="admin@PA-BENCH> ",
+        outputs={
+            "show version": "PAN-OS 10.2.4\nPalo Alto Networks\n",
+            "show system info": "hostname: PA-BENCH\nip-address: 192.0.2.10\nmodel: PA-3220\nsw-version: 10.2.4\nserial: 012801000001\n",
+            "set cli pager off": "",
+        },
+    ),
+    "check_point": VendorProfile(
+        prompt="gw-bench:0> ",
+        outputs={
+            "show version": "Product version Check Point Gaia R81.20\nOS build 631\nOS kernel version 3.10.0-957.21.3cpx86_64\nOS edition 64-bit\n",
+            "show version all": "Product Name: Check Point Gaia\nOS Major: R81.20\nOS build 631\n",
+            "set clienv rows 0": "",
+        },
+    ),
+    "fortinet": VendorProfile(
+        prompt="FGT-BENCH # ",
+        outputs={
+            "show version": "FortiGate-VM64 v7.2.5,build1517,230606 (GA.F)\nFortinet\n",
+            "get system status": "Version: FortiGate-VM64 v7.2.5,build1517,230606 (GA.F)\nSerial-Number: FGVM01TM00000001\nHostname: FGT-BENCH\n",
+            "config system console": "",
+            "set output standard": "",
+            "set output more": "",
+            "end": "",
+        },
+    ),
+}
+
+
+def vendor_for(username: str) -> str:
+    prefix = username.rsplit("-", 1)[0]
+    return prefix if prefix in VENDORS else "palo_alto"
+
+
+class FakeSSHServer:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        output_bytes: int = 0,
+        auth_failure_rate: float = 0.0,
+        command_failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_bytes = output_bytes
+        self.auth_failure_rate = auth_failure_rate
+        self.command_failure_rate = command_failure_rate
+        self.random = random.Random(seed)
+        self.loop = asyncio.new_event_loop()
+        self._server = None
+        self._padding: Dict[int, str] = {}
+
+    def _output(self, vendor: str, command: str) -> str:
+        command = command.strip()
+        output = VENDORS[vendor].outputs.get(command)
+        if output is None:
+            output = f"Unknown command: {command}\n"
+        if output and len(output) < self.output_bytes:
+            output += self._filler(self.output_bytes - len(output))
+        return output
+
+    def _filler(self, size: int) -> str:
+        if size not in self._padding:
+            line = "filler 0123456789 abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ\n"
+            # Whole lines only, so the prompt after the output still starts a line of its own
+            self._padding[size] = line * (size // len(line) + 1)
+        return self._padding[size]
+
+    async def _delay(self):
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _fails(self, process: asyncssh.SSHServerProcess) -> bool:
+        if self.random.random() >= self.command_failure_rate:
+            return False
+        process.channel.get_connection().abort()
+        return True
+
+    def _server_factory(self) -> asyncssh.SSHServer:
+        farm = self
+
+        class Server(asyncssh.SSHServer):
+            def begin_auth(self, username: str) -> bool:
+                return True
+
+            def password_auth_supported(self) -> bool:
+                return True
+
+            def validate_password(self, username: str, password: str) -> bool:
+                return password == PASSWORD and farm.random.random() >= farm.auth_failure_rate
+
+        return Server()
+
+    async def _handle(self, process: asyncssh.SSHServerProcess):
+        vendor = vendor_for(process.get_extra_info("username"))
+        if process.command is not None:
+            await self._delay()
+            if self._fails(process):
+                return
+            process.stdout.write(self._output(vendor, process.command))
+            process.exit(0)
+            return
+        prompt = VENDORS[vendor].prompt
+        try:
+            process.stdout.write(prompt)
+            async for line in process.stdin:
+                command = line.rstrip("\r\n")
+                if command == "exit":
+                    break
+                await self._delay()
+                if self._fails(process):
+                    return
+                process.stdout.write(self._output(vendor, command).replace("\n", "\r\n") + prompt)
+            process.exit(0)
+        except asyncssh.BreakReceived:
+            process.exit(0)
+        except BrokenPipeError:
+            # Clients usually close the channel rather than typing exit; a handler that raises
+            # would take the whole connection down with it
+            pass
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> Tuple[str, int]:
+        """
+        Start serving in a background thread; port 0 picks a free port. Returns (host, port).
+        """
+        key = asyncssh.generate_private_key("ssh-ed25519")
+
+        async def listen():
+            return await asyncssh.create_server(
+                self._server_factory, host, port, server_host_keys=[key], process_factory=self._handle, encoding="utf-8"
+            )
+
+        self._server = self.loop.run_until_complete(listen())
+        threading.Thread(target=self.loop.run_forever, name="fake-ssh", daemon=True).start()
+        return host, self._server.sockets[0].getsockname()[1]
+
+
+def add_farm_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds added to the latency")
+    parser.add_argument("--output-bytes", type=int, default=0, help="Pad command outputs with filler lines to at least this size")
+    parser.add_argument("--auth-failure-rate", type=float, default=0.0)
+    parser.add_argument("--command-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def farm_arguments(args: argparse.Namespace) -> list:
+    return [
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--output-bytes", str(args.output_bytes),
+        "--auth-failure-rate", str(args.auth_failure_rate), "--command-failure-rate", str(args.command_failure_rate),
+        *(["--seed", str(args.seed)] if args.seed is not None else []),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    add_farm_arguments(parser)
+    args = parser.parse_args()
+    server = FakeSSHServer(args.latency, args.jitter, args.output_bytes, args.auth_failure_rate, args.command_failure_rate, args.seed)
+    host, port = server.start(args.host, args.port)
+    print(f"listening {host} {port}", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
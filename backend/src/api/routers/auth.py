@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from src.dependencies import get_database
+from src.dependencies import cache_user, get_database
 from src.utils.logging import logger
 from pydantic import BaseModel
 import jwt
@@ -30,11 +30,15 @@ async def login(request: LoginRequest, db: AsyncIOMotorDatabase = Depends(get_da
         token = jwt.encode(
             {
                 "sub": request.username,
+                "uid": str(user["_id"]),
+                "roles": user.get("roles", []),
                 "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
             },
             SECRET_KEY,
             algorithm=ALGORITHM
         )
+        # Prime the cache so the first authenticated request does not hit the users collection
+        cache_user(user)
         logger.info(f"User {request.username} logged in successfully")
         return {"token": token}
     except Exception as e:
@@ -1,5 +1,6 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from src.dependencies import get_current_user, get_database
 from src.schemas import (
@@ -9,8 +10,10 @@ from src.schemas import (
     CredentialsListResponse,
     DeleteCredentialsResponse,
 )
-from src.utils.encryptor import PasswordEncryptor
+from src.utils.encryptor import PasswordEncryptor, invalidate_key
 from src.utils.logging import logger
+from src.utils.pagination import apply_cursor, split_page
+from src.utils.read_cache import read_cache
 
 router = APIRouter()
 
@@ -31,6 +34,7 @@ async def add_credentials(
             "encrypted_password": encrypted_password,
         }
         await db["credentials"].insert_one(credential_doc)
+        read_cache.bump("credentials")
         logger.info(f"Added credentials for username: {credentials.username}")
         return {"user_id": user_id, "username": credentials.username}
     except Exception as e:
@@ -58,11 +62,28 @@ async def get_credentials(
 
 
 @router.get("/list", response_model=CredentialsListResponse)
-async def list_credentials(current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+async def list_credentials(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    try:
+        query = apply_cursor({}, "user_id", cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+    async def build():
+        credentials = await (
+            db["credentials"].find(query, {"_id": 0, "user_id": 1, "username": 1}).sort("user_id", 1).limit(limit + 1).to_list(None)
+        )
+        page, next_cursor = split_page(credentials, limit, "user_id")
+        usernames = [cred["username"] for cred in page]
+        return {"credentials": usernames, "count": len(usernames), "next_cursor": next_cursor}
+
     try:
-        credentials = await db["credentials"].find().to_list(None)
-        usernames = [cred["username"] for cred in credentials]
-        return {"credentials": usernames, "count": len(usernames)}
+        return await read_cache.respond(request, ("credentials_list", limit, cursor), ("credentials",), build, model=CredentialsListResponse)
     except Exception as e:
         logger.error(f"Error listing credentials: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to list credentials")
@@ -78,6 +99,8 @@ async def delete_credentials(
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Credentials not found")
         delete_result = await db["credentials"].delete_one({"username": username})
         await db["credentials_keys"].delete_one({"user_id": credential["user_id"]})
+        invalidate_key(credential["user_id"])
+        read_cache.bump("credentials")
         logger.info(f"Deleted credentials for username: {username}")
         return {"deleted_count": delete_result.deleted_count}
     except Exception as e:
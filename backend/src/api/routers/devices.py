@@ -1,39 +1,170 @@
+import json
 import uuid
 import re
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from src.dependencies import get_current_user, get_database
-from src.schemas import Device, DeviceResponse, DeviceListResponse, DeleteDeviceResponse, ExecuteCommands, ExecuteResponse
-from src.utils.encryptor import PasswordEncryptor
+from src.schemas import (
+    Device,
+    DeviceResponse,
+    DeviceListResponse,
+    DeleteDeviceResponse,
+    ExecuteCommands,
+    ExecuteResponse,
+    BulkExecuteRequest,
+    BulkExecuteResponse,
+    BulkStreamExecuteRequest,
+    StreamExecuteRequest,
+    QueueExecuteRequest,
+    BulkQueueExecuteRequest,
+    BulkQueueExecuteResponse,
+    JobQueuedResponse,
+    BulkIdentifyRequest,
+    BulkIdentifyResponse,
+    DeviceImportResponse,
+)
+from src.settings import settings
+from src.utils.device_identifier import fingerprinter
+from src.utils.device_import import DeviceImporter, iter_rows
+from src.utils.bulk import DEVICE_PROJECTION, CommandRunner, bulk_execute, execute_with_history, resolve_targets, run_commands
+from src.utils.encryptor import PasswordEncryptor, invalidate_key
+from src.utils.governor import DeviceUnavailableError, ssh_governor
+from src.utils.history import OutputHistoryStore
 from src.utils.logging import logger
-from src.utils.ssh import ssh_execute_commands
-from src.utils.device_identifier import identify_device_via_ssh
-import ipaddress
+from src.utils.jobs import job_runner, run_commands_on_worker
+from src.utils.networks import ips_in_cidr
+from src.utils.pagination import apply_cursor, split_page
+from src.utils.read_cache import read_cache
+from src.utils.streaming import SSE_HEADERS, sse_event, stream_execute
+from src.utils.topology import topology_index
 
 router = APIRouter(tags=["devices"])
 
+EXPORT_BATCH_SIZE = 500
+
+DEVICE_LIST_PROJECTION = {
+    "_id": 0,
+    "device_id": 1,
+    "name": 1,
+    "ip": 1,
+    "device_type": 1,
+    "username": 1,
+    "identified_type": 1,
+    "model": 1,
+    "version": 1,
+    "health": 1,
+}
+
+def _device_detail(device: dict) -> dict:
+    return {
+        "device_id": device["device_id"],
+        "name": device["name"],
+        "ip": device["ip"],
+        "device_type": device["device_type"],
+        "username": device["username"],
+        "identified_type": device.get("identified_type", "unknown"),
+        "model": device.get("model", "unknown"),
+        "version": device.get("version", "unknown"),
+        "health": _health(device.get("health")),
+    }
+
+def _health(health: Optional[dict]) -> dict:
+    # Devices the governor never saw fail have no health yet; timestamps as ISO strings so exports can json.dumps them
+    if not health:
+        return {"state": "closed", "failures": 0}
+    shown = {key: value.isoformat() if isinstance(value, datetime) else value for key, value in health.items()}
+    # Stored at transitions only: once retry_at has passed an open breaker lets the next call through
+    retry_at = health.get("retry_at")
+    if health.get("state") == "open" and isinstance(retry_at, datetime) and retry_at <= datetime.utcnow():
+        shown["state"] = "half_open"
+    return shown
+
+def _command_runner() -> CommandRunner:
+    # With embedded workers SSH runs in this process; otherwise commands go to a worker node as execute jobs
+    return run_commands if settings.JOB_WORKER_EMBEDDED else run_commands_on_worker
+
+async def _device_filter(
+    db: AsyncIOMotorDatabase,
+    device_type: Optional[str],
+    identified_type: Optional[str],
+    model: Optional[str],
+    version: Optional[str],
+    cidr: Optional[str],
+) -> dict:
+    query = {}
+    if device_type:
+        query["device_type"] = device_type
+    if identified_type:
+        query["identified_type"] = identified_type
+    if model:
+        query["model"] = model
+    if version:
+        query["version"] = version
+    if cidr:
+        try:
+            query["ip"] = {"$in": await ips_in_cidr(db, cidr)}
+        except ValueError as ve:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    return query
+
 @router.get("/list", response_model=DeviceListResponse)
-async def list_devices(current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+async def list_devices(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    device_type: Optional[str] = None,
+    identified_type: Optional[str] = None,
+    model: Optional[str] = None,
+    version: Optional[str] = None,
+    cidr: Optional[str] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    query = await _device_filter(db, device_type, identified_type, model, version, cidr)
+    try:
+        query = apply_cursor(query, "name", cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+    async def build():
+        devices = await db["Devices"].find(query, DEVICE_LIST_PROJECTION).sort("name", 1).limit(limit + 1).to_list(None)
+        page, next_cursor = split_page(devices, limit, "name")
+        device_list = [_device_detail(device) for device in page]
+        return {"devices": device_list, "count": len(device_list), "next_cursor": next_cursor}
+
+    key = ("devices_list", limit, cursor, device_type, identified_type, model, version, cidr)
     try:
-        devices = await db["Devices"].find().to_list(length=100)
-        device_list = [
-            {
-                "device_id": device["device_id"],
-                "name": device["name"],
-                "ip": device["ip"],
-                "device_type": device["device_type"],
-                "username": device["username"],
-                "identified_type": device.get("identified_type", "unknown"),
-                "model": device.get("model", "unknown"),
-                "version": device.get("version", "unknown")
-            }
-            for device in devices
-        ]
-        return {"devices": device_list, "count": len(device_list)}
+        # Listings show breaker health, so governor transitions make them stale as well
+        return await read_cache.respond(request, key, ("devices",), build, (ssh_governor.generation,), model=DeviceListResponse)
     except Exception as e:
         logger.error(f"Error listing devices: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to list devices")
 
+@router.get("/export")
+async def export_devices(
+    device_type: Optional[str] = None,
+    identified_type: Optional[str] = None,
+    model: Optional[str] = None,
+    version: Optional[str] = None,
+    cidr: Optional[str] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Stream the matching inventory as NDJSON, one device per line, without buffering it.
+    """
+    query = await _device_filter(db, device_type, identified_type, model, version, cidr)
+
+    async def generate():
+        cursor = db["Devices"].find(query, DEVICE_LIST_PROJECTION).sort("name", 1).batch_size(EXPORT_BATCH_SIZE)
+        async for device in cursor:
+            yield json.dumps(_device_detail(device)) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.post("/add/", response_model=DeviceResponse)
 async def add_device(
     device: Device, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)
@@ -49,19 +180,11 @@ async def add_device(
             "device_type": device.device_type,
             "username": device.username,
             "encrypted_password": encrypted_password,
+            # Filled in by the background identification job
+            "identified_type": "pending",
+            "model": "unknown",
+            "version": "unknown",
         }
-        try:
-            device_info = identify_device_via_ssh(str(device.ip), device.username, device.password)
-            device_doc.update({
-                "identified_type": device_info["type"],
-                "model": device_info["model"],
-                "version": device_info["version"]
-            })
-        except Exception as e:
-            logger.warning(f"Device identification failed for {device.name}: {e}")
-            device_doc["identified_type"] = "unknown"
-            device_doc["model"] = "unknown"
-            device_doc["version"] = "unknown"
 
         await db["Devices"].insert_one(device_doc)
         await db["Credentials"].insert_one({
@@ -69,32 +192,175 @@ async def add_device(
             "username": device.username,
             "encrypted_password": encrypted_password
         })
-        network_cidr = str(ipaddress.IPv4Interface(f"{device.ip}/24").network)
-        await db["Networks"].update_one(
-            {"network_cidr": network_cidr},
-            {"$push": {"assets": {"$each": [str(device.ip)], "$sort": 1}}},
-            upsert=True
-        )
+        topology_index.add_device(device_doc)
+        read_cache.bump("devices")
+        # refresh: the IP may have belonged to another device whose fingerprint a worker still caches
+        job = await job_runner.enqueue(db, "identify", {"device_id": device_id, "refresh": True})
         logger.info(f"Added device: {device.name}")
-        return {"device_id": device_id, "name": device.name, "ip": str(device.ip), "device_type": device.device_type, "username": device.username}
+        return {
+            "device_id": device_id,
+            "name": device.name,
+            "ip": str(device.ip),
+            "device_type": device.device_type,
+            "username": device.username,
+            "identified_type": "pending",
+            "job_id": job["job_id"],
+        }
     except Exception as e:
         logger.error(f"Error adding device: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add device")
 
+@router.post("/import", response_model=DeviceImportResponse)
+async def import_devices(
+    file: UploadFile = File(...),
+    file_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    identify: bool = True,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Import devices from a CSV (with a header row) or NDJSON upload, one device per row.
+    The format is taken from the format parameter, else from the file extension.
+    """
+    if file_format is None:
+        filename = (file.filename or "").lower()
+        if filename.endswith(".csv"):
+            file_format = "csv"
+        elif filename.endswith((".ndjson", ".jsonl")):
+            file_format = "ndjson"
+        else:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot infer format; pass format=csv or format=ndjson")
+    importer = DeviceImporter(db, identify)
+    try:
+        async for row_number, row in iter_rows(file, file_format):
+            await importer.add(row_number, row)
+        await importer.flush()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload is not valid UTF-8")
+    except Exception as e:
+        logger.error(f"Error importing devices: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to import devices")
+    summary = importer.summary()
+    logger.info(f"Imported {summary['imported']} devices, {summary['failed']} rows failed")
+    return summary
+
 @router.post("/execute/{name}", response_model=ExecuteResponse)
 async def execute_commands(name: str, commands: ExecuteCommands, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    device = await db["Devices"].find_one({"name": name}, DEVICE_PROJECTION)
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
     try:
-        device = await db["Devices"].find_one({"name": name})
-        if not device:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
-        encryptor = PasswordEncryptor(db)
-        decrypted_password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
-        outputs = await ssh_execute_commands(device["ip"], device["username"], decrypted_password, commands.commands)
+        outputs = await execute_with_history(
+            db, device, commands.commands, commands.mode, commands.raw_output, commands.max_age, _command_runner()
+        )
         return {"output": outputs}
+    except DeviceUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         logger.error(f"Error executing commands on {name}: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to execute commands")
 
+@router.post("/bulk/execute", response_model=BulkExecuteResponse)
+async def bulk_execute_commands(request: BulkExecuteRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        devices = await resolve_targets(db, request.names, request.network_cidr, request.identified_type)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    if not devices:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No devices matched the target selector")
+    try:
+        logger.info(f"Bulk execute of {len(request.commands)} commands on {len(devices)} devices")
+        return await bulk_execute(
+            db, devices, request.commands, request.mode, request.raw_output, request.max_concurrency, request.device_timeout, _command_runner()
+        )
+    except Exception as e:
+        logger.error(f"Error in bulk execute: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to execute commands")
+
+@router.post("/execute/{name}/stream")
+async def stream_execute_commands(name: str, request: StreamExecuteRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Like /execute/{name}, but stream raw output as Server-Sent Events while it arrives.
+    Events: device_start, command_start, chunk, command_end, device_end and a final done.
+    """
+    device = await db["Devices"].find_one({"name": name}, DEVICE_PROJECTION)
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    events = stream_execute(db, [device], request.commands, request.mode)
+    return StreamingResponse((sse_event(event) async for event in events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/bulk/execute/stream")
+async def bulk_stream_execute_commands(request: BulkStreamExecuteRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Stream the output of the same commands on many devices as Server-Sent Events,
+    interleaved as it arrives; each event names its device.
+    """
+    try:
+        devices = await resolve_targets(db, request.names, request.network_cidr, request.identified_type)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    if not devices:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No devices matched the target selector")
+    logger.info(f"Streaming execute of {len(request.commands)} commands on {len(devices)} devices")
+    events = stream_execute(db, devices, request.commands, request.mode, request.max_concurrency, request.device_timeout)
+    return StreamingResponse((sse_event(event) async for event in events), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.post("/execute/{name}/async", response_model=JobQueuedResponse)
+async def queue_execute_commands(name: str, request: QueueExecuteRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Queue commands for a worker and return at once. Poll /jobs/{job_id}; on success its result
+    maps each command to an output hash, readable from /history/blob/{hash}. With
+    HISTORY_ENABLED off there is no history to read from, and result.raw_outputs holds the
+    outputs themselves.
+    """
+    device = await db["Devices"].find_one({"name": name}, {"_id": 0, "device_id": 1})
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    try:
+        job = await job_runner.enqueue(db, "execute", {"device_id": device["device_id"], "commands": request.commands, "mode": request.mode})
+        return {"job_id": job["job_id"], "status": job["status"]}
+    except Exception as e:
+        logger.error(f"Error queueing commands for {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to queue commands")
+
+@router.post("/bulk/execute/async", response_model=BulkQueueExecuteResponse)
+async def queue_bulk_execute_commands(request: BulkQueueExecuteRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Queue the same commands on many devices as one job batch; track it with /jobs/batch/{batch_id}.
+    """
+    try:
+        devices = await resolve_targets(db, request.names, request.network_cidr, request.identified_type)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    if not devices:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No devices matched the target selector")
+    try:
+        payloads = [{"device_id": device["device_id"], "commands": request.commands, "mode": request.mode} for device in devices]
+        batch_id = await job_runner.enqueue_batch(db, "execute", payloads)
+        logger.info(f"Queued {len(request.commands)} commands on {len(devices)} devices as batch {batch_id}")
+        return {"batch_id": batch_id, "count": len(devices)}
+    except Exception as e:
+        logger.error(f"Error queueing bulk execute: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to queue commands")
+
+@router.post("/identify", response_model=BulkIdentifyResponse)
+async def bulk_identify(request: BulkIdentifyRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Queue re-identification for the selected devices, or the whole inventory if no selector is given.
+    Cached fingerprints are bypassed, so devices are probed again.
+    """
+    try:
+        devices = await resolve_targets(db, request.names, request.network_cidr, request.identified_type, allow_all=True)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    try:
+        batch_id = await job_runner.enqueue_batch(db, "identify", [{"device_id": device["device_id"], "refresh": True} for device in devices])
+        logger.info(f"Queued identification of {len(devices)} devices as batch {batch_id}")
+        return {"batch_id": batch_id, "count": len(devices)}
+    except Exception as e:
+        logger.error(f"Error queueing identification: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to queue identification")
+
 @router.delete("/{device_id}", response_model=DeleteDeviceResponse)
 async def delete_device(device_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
     try:
@@ -103,11 +369,12 @@ async def delete_device(device_id: str, current_user=Depends(get_current_user),
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
         await db["Devices"].delete_one({"device_id": device_id})
         await db["Credentials"].delete_one({"device_id": device_id})
-        network_cidr = str(ipaddress.IPv4Interface(f"{device['ip']}/24").network)
-        await db["Networks"].update_one(
-            {"network_cidr": network_cidr},
-            {"$pull": {"assets": device["ip"]}}
-        )
+        await db["credentials_keys"].delete_one({"user_id": device_id})
+        invalidate_key(device_id)
+        fingerprinter.invalidate(device["ip"])
+        await OutputHistoryStore(db).delete_device(device_id)
+        topology_index.remove_device(device)
+        read_cache.bump("devices")
         logger.info(f"Deleted device: {device_id}")
         return {"deleted_count": 1}
     except Exception as e:
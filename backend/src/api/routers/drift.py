@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.dependencies import get_current_user, get_database
+from src.schemas import DriftChangesResponse, DriftCheckRequest, DriftCheckResponse, DriftDeltaResponse, DriftStatusResponse
+from src.utils.bulk import resolve_targets
+from src.utils.drift import CONFIG_COMMANDS, DELTAS_COLLECTION, SNAPSHOTS_COLLECTION, DriftStore
+from src.utils.jobs import job_runner
+from src.utils.logging import logger
+
+router = APIRouter(tags=["drift"])
+
+DELTA_SUMMARY_PROJECTION = {"_id": 0, "device": 1, "version": 1, "captured_at": 1, "changes.section": 1}
+
+def _summary(delta: dict) -> dict:
+    return {
+        "device": delta["device"],
+        "version": delta["version"],
+        "captured_at": delta["captured_at"],
+        "sections": [change["section"] for change in delta["changes"]],
+    }
+
+async def _get_device_id(db: AsyncIOMotorDatabase, name: str) -> str:
+    device = await db["Devices"].find_one({"name": name}, {"_id": 0, "device_id": 1})
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    return device["device_id"]
+
+@router.post("/check", response_model=DriftCheckResponse)
+async def check_drift(request: DriftCheckRequest, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Queue a config capture for the selected devices, or the whole inventory if no selector is given.
+    Devices whose identified_type has no known config command are skipped.
+    """
+    try:
+        devices = await resolve_targets(db, request.names, request.network_cidr, request.identified_type, allow_all=True)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    supported = [device for device in devices if device.get("identified_type") in CONFIG_COMMANDS]
+    try:
+        batch_id = await job_runner.enqueue_batch(db, "drift", [{"device_id": device["device_id"]} for device in supported])
+        logger.info(f"Queued drift check of {len(supported)} devices as batch {batch_id}")
+        return {"batch_id": batch_id, "count": len(supported), "skipped": len(devices) - len(supported)}
+    except Exception as e:
+        logger.error(f"Error queueing drift check: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to queue drift check")
+
+@router.get("/changes", response_model=DriftChangesResponse)
+async def get_fleet_changes(
+    since: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    List config changes across the fleet, newest first.
+    """
+    query = {"captured_at": {"$gte": since}} if since else {}
+    try:
+        deltas = await db[DELTAS_COLLECTION].find(query, DELTA_SUMMARY_PROJECTION).sort("captured_at", -1).limit(limit).to_list(None)
+    except Exception as e:
+        logger.error(f"Error listing drift changes: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to list drift changes")
+    changes = [_summary(delta) for delta in deltas]
+    return {"changes": changes, "count": len(changes)}
+
+@router.get("/{name}", response_model=DriftStatusResponse)
+async def get_drift_status(
+    name: str,
+    limit: int = Query(20, ge=1, le=1000),
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Return the current config version of a device and its most recent changes.
+    """
+    device_id = await _get_device_id(db, name)
+    try:
+        snapshot = await db[SNAPSHOTS_COLLECTION].find_one(
+            {"device_id": device_id}, {"_id": 0, "version": 1, "hash": 1, "captured_at": 1, "checked_at": 1}
+        )
+        deltas = await db[DELTAS_COLLECTION].find({"device_id": device_id}, DELTA_SUMMARY_PROJECTION).sort("version", -1).limit(limit).to_list(None)
+    except Exception as e:
+        logger.error(f"Error getting drift status for {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get drift status")
+    if not snapshot:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No config captured for this device")
+    return {**snapshot, "device": name, "recent": [_summary(delta) for delta in deltas]}
+
+@router.get("/{name}/versions/{version}", response_model=DriftDeltaResponse)
+async def get_drift_delta(name: str, version: int, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Return the section diff that produced a config version.
+    """
+    device_id = await _get_device_id(db, name)
+    try:
+        delta = await db[DELTAS_COLLECTION].find_one({"device_id": device_id, "version": version}, {"_id": 0, "previous_layout": 0})
+    except Exception as e:
+        logger.error(f"Error getting drift version {version} for {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get drift version")
+    if not delta:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Version not found")
+    return delta
+
+@router.get("/{name}/config", response_class=PlainTextResponse)
+async def get_config(
+    name: str,
+    version: Optional[int] = Query(None, ge=1),
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Return the normalised config of a device at a version (default: latest).
+    """
+    device_id = await _get_device_id(db, name)
+    try:
+        snapshot = await DriftStore(db).snapshot(device_id, version)
+    except Exception as e:
+        logger.error(f"Error rebuilding config of {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get config")
+    if not snapshot:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Config version not found")
+    return snapshot["config"]
@@ -0,0 +1,76 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.dependencies import get_current_user, get_database
+from src.schemas import HistoryLatestResponse, HistoryListResponse
+from src.utils.history import OutputHistoryStore
+from src.utils.logging import logger
+from src.utils.parsers import parse_output_to_json
+from src.settings import settings
+
+router = APIRouter(tags=["history"])
+
+async def _get_device(db: AsyncIOMotorDatabase, name: str):
+    device = await db["Devices"].find_one({"name": name}, {"_id": 0, "device_id": 1, "name": 1, "identified_type": 1})
+    if not device:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Device not found")
+    return device
+
+@router.get("/blob/{digest}", response_class=PlainTextResponse)
+async def get_output_blob(digest: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Return a stored output by its content hash, e.g. one referenced by a history entry.
+    """
+    try:
+        output = await OutputHistoryStore(db).load(digest)
+    except Exception as e:
+        logger.error(f"Error loading output {digest}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to load output")
+    if output is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Output not found")
+    return output
+
+@router.get("/{name}/latest", response_model=HistoryLatestResponse)
+async def get_latest_output(
+    name: str,
+    command: str,
+    raw_output: str = Query("full", pattern="^(full|truncate|drop)$"),
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Return the most recent stored output of command on a device, parsed like /devices/execute.
+    """
+    device = await _get_device(db, name)
+    try:
+        entry = await OutputHistoryStore(db).latest(device["device_id"], command)
+    except Exception as e:
+        logger.error(f"Error getting latest output of '{command}' on {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get output history")
+    if not entry:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No stored output for this command")
+    output = parse_output_to_json(entry.pop("output"), command, device.get("identified_type"), raw_output, settings.RAW_OUTPUT_LIMIT)
+    return {**entry, "device": name, "output": output}
+
+@router.get("/{name}", response_model=HistoryListResponse)
+async def get_output_history(
+    name: str,
+    command: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    List stored runs for a device, newest first, optionally for one command.
+    """
+    device = await _get_device(db, name)
+    try:
+        entries, next_cursor = await OutputHistoryStore(db).entries(device["device_id"], command, limit, cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    except Exception as e:
+        logger.error(f"Error getting output history for {name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get output history")
+    return {"device": name, "entries": entries, "next_cursor": next_cursor}
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.dependencies import get_current_user, get_database
+from src.schemas import JobBatchResponse, JobResponse, WorkerListResponse
+from src.settings import settings
+from src.utils.jobs import JOBS_COLLECTION, WORKERS_COLLECTION
+from src.utils.logging import logger
+
+router = APIRouter(tags=["jobs"])
+
+@router.get("/workers", response_model=WorkerListResponse)
+async def list_workers(current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    List registered worker nodes and the number of queued and running jobs.
+    A node is alive if it sent a heartbeat within three heartbeat intervals.
+    """
+    try:
+        workers = await db[WORKERS_COLLECTION].find({}, {"_id": 0}).sort("started_at", 1).to_list(None)
+        queue = {
+            group["_id"]: group["count"]
+            async for group in db[JOBS_COLLECTION].aggregate([
+                {"$match": {"status": {"$in": ["queued", "running"]}}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ])
+        }
+    except Exception as e:
+        logger.error(f"Error listing workers: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to list workers")
+    cutoff = datetime.utcnow() - timedelta(seconds=3 * settings.JOB_HEARTBEAT_INTERVAL)
+    for worker in workers:
+        worker["alive"] = worker["heartbeat_at"] >= cutoff
+    return {"workers": workers, "queue": {"queued": queue.get("queued", 0), "running": queue.get("running", 0)}}
+
+@router.get("/batch/{batch_id}", response_model=JobBatchResponse)
+async def get_job_batch(batch_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        counts = {
+            group["_id"]: group["count"]
+            async for group in db[JOBS_COLLECTION].aggregate([
+                {"$match": {"batch_id": batch_id}},
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ])
+        }
+    except Exception as e:
+        logger.error(f"Error getting job batch {batch_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get job batch")
+    if not counts:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    return {"batch_id": batch_id, "total": sum(counts.values()), "counts": counts}
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        job = await db[JOBS_COLLECTION].find_one({"job_id": job_id}, {"_id": 0, "payload": 0})
+    except Exception as e:
+        logger.error(f"Error getting job {job_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get job")
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
@@ -1,20 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from src.dependencies import get_current_user, get_database
+from src.schemas import TopologyDevicesResponse, TopologyLookupResponse, TopologyNetworksResponse
 from src.utils.logging import logger
+from src.utils.pagination import apply_cursor, split_page
+from src.utils.read_cache import read_cache
+from src.utils.topology import topology_index
 
 router = APIRouter(tags=["network"])
 
 @router.get("/info", tags=["network"])
-async def get_network_info(current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+async def get_network_info(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user=Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
     """
-    Retrieve network information for all devices.
+    Retrieve network information for all devices, one page at a time.
     """
     try:
-        devices = await db["devices"].find().to_list(None)
-        network_info = [{"name": dev["name"], "ip": dev["ip"]} for dev in devices]
+        query = apply_cursor({}, "name", cursor)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+    async def build():
+        devices = await db["Devices"].find(query, {"_id": 0, "name": 1, "ip": 1}).sort("name", 1).limit(limit + 1).to_list(None)
+        page, next_cursor = split_page(devices, limit, "name")
+        network_info = [{"name": dev["name"], "ip": dev["ip"]} for dev in page]
         logger.info("Retrieved network info")
-        return {"network_info": network_info, "count": len(network_info)}
+        return {"network_info": network_info, "count": len(network_info), "next_cursor": next_cursor}
+
+    try:
+        return await read_cache.respond(request, ("network_info", limit, cursor), ("devices",), build)
     except Exception as e:
         logger.error(f"Error retrieving network info: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve network info")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve network info")
+
+@router.get("/lookup/{ip}", response_model=TopologyLookupResponse)
+async def lookup_ip(ip: str, current_user=Depends(get_current_user)):
+    """
+    Longest-prefix match of an IP against the known networks, plus the devices using that IP.
+    Served from the in-memory topology index.
+    """
+    try:
+        return topology_index.lookup(ip)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+@router.get("/devices", response_model=TopologyDevicesResponse)
+async def devices_in_prefix(
+    cidr: str = Query(..., examples=["10.0.0.0/8"]),
+    limit: int = Query(1000, ge=1, le=100000),
+    current_user=Depends(get_current_user),
+):
+    """
+    Devices whose IP falls inside a prefix of any length, in address order.
+    """
+    try:
+        devices = topology_index.devices_in(cidr, limit + 1)
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    return {"cidr": cidr, "devices": devices[:limit], "count": min(len(devices), limit), "truncated": len(devices) > limit}
+
+@router.get("/subnets", response_model=TopologyNetworksResponse)
+async def subnets_of_prefix(cidr: str = Query(..., examples=["10.0.0.0/8"]), current_user=Depends(get_current_user)):
+    """
+    Known networks inside a prefix (the prefix itself included), in address order.
+    """
+    try:
+        return {"cidr": cidr, "networks": topology_index.subnets(cidr)}
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+
+@router.get("/supernets", response_model=TopologyNetworksResponse)
+async def supernets_of_prefix(cidr: str = Query(..., examples=["10.0.0.0/28"]), current_user=Depends(get_current_user)):
+    """
+    Known networks containing a prefix (the prefix itself included), most specific first.
+    """
+    try:
+        return {"cidr": cidr, "networks": topology_index.supernets(cidr)}
+    except ValueError as ve:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
@@ -0,0 +1,112 @@
+import ipaddress
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from src.dependencies import get_current_user, get_database
+from src.schemas import ScheduleCreate, ScheduleListResponse, ScheduleResponse, ScheduleUpdate
+from src.settings import settings
+from src.utils.logging import logger
+from src.utils.scheduler import SCHEDULES_COLLECTION, new_schedule
+
+router = APIRouter(tags=["schedules"])
+
+SCHEDULE_PROJECTION = {"_id": 0, "created_at": 0, "updated_at": 0}
+
+def _check_interval(interval: float):
+    if interval < settings.SCHEDULER_MIN_INTERVAL:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"interval must be at least {settings.SCHEDULER_MIN_INTERVAL:g} seconds")
+
+@router.post("", response_model=ScheduleResponse)
+async def create_schedule(request: ScheduleCreate, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Poll the selected devices (the whole inventory if no selector is given) every interval seconds.
+    The first run starts on the next scheduler tick.
+    """
+    _check_interval(request.interval)
+    if request.network_cidr:
+        try:
+            ipaddress.IPv4Network(request.network_cidr, strict=False)
+        except ValueError as ve:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
+    selector = {"names": request.names, "network_cidr": request.network_cidr, "identified_type": request.identified_type}
+    schedule = new_schedule(request.name, request.commands, request.interval, selector, request.mode, request.enabled)
+    try:
+        await db[SCHEDULES_COLLECTION].insert_one(schedule)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A schedule with this name already exists")
+    except Exception as e:
+        logger.error(f"Error creating schedule {request.name}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create schedule")
+    logger.info(f"Created schedule {request.name} every {request.interval:g}s")
+    return schedule
+
+@router.get("", response_model=ScheduleListResponse)
+async def list_schedules(current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        schedules = await db[SCHEDULES_COLLECTION].find({}, SCHEDULE_PROJECTION).sort("name", 1).to_list(None)
+    except Exception as e:
+        logger.error(f"Error listing schedules: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to list schedules")
+    return {"schedules": schedules, "count": len(schedules)}
+
+@router.get("/{schedule_id}", response_model=ScheduleResponse)
+async def get_schedule(schedule_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        schedule = await db[SCHEDULES_COLLECTION].find_one({"schedule_id": schedule_id}, SCHEDULE_PROJECTION)
+    except Exception as e:
+        logger.error(f"Error getting schedule {schedule_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to get schedule")
+    if not schedule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+    return schedule
+
+@router.patch("/{schedule_id}", response_model=ScheduleResponse)
+async def update_schedule(schedule_id: str, request: ScheduleUpdate, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    changes = request.model_dump(exclude_none=True)
+    if "interval" in changes:
+        _check_interval(changes["interval"])
+    try:
+        schedule = await db[SCHEDULES_COLLECTION].find_one_and_update(
+            {"schedule_id": schedule_id},
+            {"$set": {**changes, "updated_at": datetime.utcnow()}},
+            projection=SCHEDULE_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        logger.error(f"Error updating schedule {schedule_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update schedule")
+    if not schedule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+    return schedule
+
+@router.post("/{schedule_id}/run", response_model=ScheduleResponse)
+async def run_schedule_now(schedule_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """
+    Make a schedule due now; it starts on the next scheduler tick if enabled.
+    """
+    try:
+        schedule = await db[SCHEDULES_COLLECTION].find_one_and_update(
+            {"schedule_id": schedule_id},
+            {"$set": {"next_run_at": datetime.utcnow()}},
+            projection=SCHEDULE_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+        )
+    except Exception as e:
+        logger.error(f"Error triggering schedule {schedule_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to trigger schedule")
+    if not schedule:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+    return schedule
+
+@router.delete("/{schedule_id}")
+async def delete_schedule(schedule_id: str, current_user=Depends(get_current_user), db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        result = await db[SCHEDULES_COLLECTION].delete_one({"schedule_id": schedule_id})
+    except Exception as e:
+        logger.error(f"Error deleting schedule {schedule_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to delete schedule")
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Schedule not found")
+    return {"deleted_count": result.deleted_count}
@@ -1,13 +1,26 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from src.utils.cache import TTLCache
 from src.utils.logging import logger
+from src.utils.mongo import CommandTimingListener, PoolStatsListener
 import jwt
 from pydantic_settings import BaseSettings
+from src.settings import settings as app_settings
 
 class Settings(BaseSettings):
     mongodb_url: str = "mongodb://localhost:27017"
     database_name: str = "app"
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 0
+    mongodb_max_idle_time_ms: int = 60000
+    mongodb_connect_timeout_ms: int = 5000
+    mongodb_server_selection_timeout_ms: int = 5000
+    mongodb_socket_timeout_ms: Optional[int] = None
+    # Authenticated users are cached briefly so a valid token does not cost a users lookup per request
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 60.0
 
 settings = Settings()
 
@@ -16,9 +29,57 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 SECRET_KEY = "your-secret-key"  # Must match auth.py
 ALGORITHM = "HS256"
 
+# One client per process, created and closed by the app lifespan in main.py
+mongo_client: Optional[AsyncIOMotorClient] = None
+mongo_pool_stats = PoolStatsListener()
+
+# username -> users document (without the password hash)
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl)
+USER_PROJECTION = {"password": 0}
+
+def invalidate_user(username: str):
+    """
+    Drop a cached user; must be called whenever the users document is changed or deleted,
+    otherwise the old document is served for up to user_cache_ttl seconds.
+    """
+    user_cache.invalidate(username)
+
+def cache_user(user: dict):
+    user_cache.set(user["username"], {key: value for key, value in user.items() if key not in USER_PROJECTION})
+
+def connect_to_mongo() -> AsyncIOMotorClient:
+    global mongo_client
+    if mongo_client is None:
+        mongo_client = AsyncIOMotorClient(
+            settings.mongodb_url,
+            maxPoolSize=settings.mongodb_max_pool_size,
+            minPoolSize=settings.mongodb_min_pool_size,
+            maxIdleTimeMS=settings.mongodb_max_idle_time_ms,
+            connectTimeoutMS=settings.mongodb_connect_timeout_ms,
+            serverSelectionTimeoutMS=settings.mongodb_server_selection_timeout_ms,
+            socketTimeoutMS=settings.mongodb_socket_timeout_ms,
+            event_listeners=[mongo_pool_stats, *([CommandTimingListener()] if app_settings.METRICS_ENABLED else [])],
+        )
+        logger.info(f"MongoDB client created (maxPoolSize={settings.mongodb_max_pool_size})")
+    return mongo_client
+
+def close_mongo_connection():
+    global mongo_client
+    if mongo_client is not None:
+        mongo_client.close()
+        mongo_client = None
+        logger.info("MongoDB client closed")
+
+def get_db() -> AsyncIOMotorDatabase:
+    """
+    Return the shared database handle, for code that runs outside a request (background jobs).
+    """
+    if mongo_client is None:
+        raise RuntimeError("MongoDB client is not initialised; connect_to_mongo() must run at startup")
+    return mongo_client[settings.database_name]
+
 async def get_database() -> AsyncIOMotorDatabase:
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    return client[settings.database_name]
+    return get_db()
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotorDatabase = Depends(get_database)):
     try:
@@ -26,10 +87,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotor
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
-        user = await db["users"].find_one({"username": username})
+        user = user_cache.get(username)
         if user is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
-        return user
+            user = await db["users"].find_one({"username": username}, USER_PROJECTION)
+            if user is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+            cache_user(user)
+        # Authorization claims come from the signed token; older tokens fall back to the stored roles
+        return {**user, "roles": payload.get("roles", user.get("roles", []))}
     except jwt.PyJWTError as e:
         logger.error(f"Token validation failed: {e}")
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
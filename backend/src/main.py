@@ -1,11 +1,44 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from src.api.routers import auth, credentials, devices, network
-from src.dependencies import get_database
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.api.routers import auth, credentials, devices, drift, history, jobs, network, schedules
+from src.dependencies import close_mongo_connection, connect_to_mongo, get_database, get_db, mongo_pool_stats, settings as db_settings, user_cache
+from src.settings import settings
+from src.utils.device_identifier import fingerprinter
+from src.utils.governor import ssh_governor
+from src.utils.indexes import ensure_indexes, verify_query_plans
+from src.utils.jobs import JOBS_COLLECTION, job_runner
 from src.utils.logging import logger
+from src.utils.metrics import CONTENT_TYPE_LATEST, JOB_QUEUE_DEPTH, MetricsMiddleware, render
+from src.utils.read_cache import read_cache
+from src.utils.scheduler import poll_scheduler
+from src.utils.ssh import ssh_backend
+from src.utils.topology import topology_index
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_to_mongo()
+    if settings.ENSURE_INDEXES:
+        await ensure_indexes(get_db())
+    if settings.VERIFY_QUERY_PLANS:
+        await verify_query_plans(get_db())
+    await topology_index.start(get_db(), settings.TOPOLOGY_REFRESH_INTERVAL)
+    await ssh_governor.attach(get_db())
+    if settings.JOB_WORKER_EMBEDDED:
+        await job_runner.start(get_db())
+        if settings.SCHEDULER_ENABLED:
+            await poll_scheduler.start(get_db())
+    yield
+    await poll_scheduler.stop()
+    await job_runner.stop()
+    await topology_index.stop()
+    await ssh_backend.close()
+    close_mongo_connection()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,6 +47,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 logger.info("Including auth router")
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -21,14 +56,46 @@ logger.info("Including credentials router")
 app.include_router(credentials.router, prefix="/credentials", tags=["credentials"])
 logger.info("Including devices router")
 app.include_router(devices.router, prefix="/devices", tags=["devices"])
+logger.info("Including drift router")
+app.include_router(drift.router, prefix="/drift", tags=["drift"])
+logger.info("Including history router")
+app.include_router(history.router, prefix="/history", tags=["history"])
+logger.info("Including jobs router")
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 logger.info("Including network router")
 app.include_router(network.router, prefix="/network", tags=["network"])
+logger.info("Including schedules router")
+app.include_router(schedules.router, prefix="/schedules", tags=["schedules"])
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics(db: AsyncIOMotorDatabase = Depends(get_database)):
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    # Queue depth is shared by all nodes, so it is sampled from Mongo rather than counted locally
+    try:
+        for job_status in ("queued", "running"):
+            JOB_QUEUE_DEPTH.labels(status=job_status).set(await db[JOBS_COLLECTION].count_documents({"status": job_status}))
+    except Exception as e:
+        logger.warning(f"Could not sample job queue depth: {e}")
+    return Response(render(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/health", tags=["health"])
-async def health_check(db: AsyncIOMotorClient = Depends(get_database)):
+async def health_check(db: AsyncIOMotorDatabase = Depends(get_database)):
     try:
         await db.command("ping")
-        return {"status": "healthy", "database": "connected"}
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "mongo_pool": {"max_pool_size": db_settings.mongodb_max_pool_size, **mongo_pool_stats.stats()},
+            "ssh_pool": {"backend": ssh_backend.name, **ssh_backend.stats()},
+            "user_cache": user_cache.stats(),
+            "scheduler": poll_scheduler.stats(),
+            "jobs": job_runner.stats(),
+            "topology": topology_index.stats(),
+            "fingerprint": fingerprinter.stats(),
+            "governor": ssh_governor.stats(),
+            "read_cache": read_cache.stats(),
+        }
     except Exception as e:
         logger.error(f"Database connection failed: {e}")
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database connection failed")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Database connection failed")
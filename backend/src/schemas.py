@@ -1,6 +1,7 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from pydantic.networks import IPv4Address
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 
 class Credentials(BaseModel):
     username: str
@@ -17,6 +18,7 @@ class DecryptedCredentials(BaseModel):
 class CredentialsListResponse(BaseModel):
     credentials: List[str]
     count: int
+    next_cursor: Optional[str] = None
 
 class DeleteCredentialsResponse(BaseModel):
     deleted_count: int
@@ -35,6 +37,15 @@ class Device(BaseModel):
     username: str
     password: str
 
+class DeviceHealth(BaseModel):
+    # Circuit breaker state of the SSH governor: closed (reachable), open (failing fast until
+    # retry_at) or half_open (one trial connection allowed)
+    state: Literal["closed", "open", "half_open"] = "closed"
+    failures: int = 0
+    last_error: Optional[str] = None
+    retry_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 class DeviceDetail(BaseModel):
     device_id: str
     name: str
@@ -44,6 +55,7 @@ class DeviceDetail(BaseModel):
     identified_type: Optional[str] = "unknown"
     model: Optional[str] = "unknown"
     version: Optional[str] = "unknown"
+    health: DeviceHealth = DeviceHealth()
 
 class DeviceResponse(BaseModel):
     device_id: str
@@ -51,16 +63,251 @@ class DeviceResponse(BaseModel):
     ip: str
     device_type: str
     username: str
+    identified_type: Optional[str] = None
+    job_id: Optional[str] = None
 
 class DeviceListResponse(BaseModel):
     devices: List[DeviceDetail]
     count: int
+    next_cursor: Optional[str] = None
+
+class TopologyDevice(BaseModel):
+    device_id: str
+    name: str
+    ip: str
+
+class TopologyNetwork(BaseModel):
+    network_cidr: str
+    devices: int
+
+class TopologyLookupResponse(BaseModel):
+    ip: str
+    network: Optional[TopologyNetwork] = None
+    supernets: List[TopologyNetwork]
+    devices: List[TopologyDevice]
+
+class TopologyDevicesResponse(BaseModel):
+    cidr: str
+    devices: List[TopologyDevice]
+    count: int
+    truncated: bool
+
+class TopologyNetworksResponse(BaseModel):
+    cidr: str
+    networks: List[TopologyNetwork]
 
 class DeleteDeviceResponse(BaseModel):
     deleted_count: int
 
 class ExecuteCommands(BaseModel):
     commands: List[str]
+    mode: Literal["exec", "shell"] = "exec"
+    raw_output: Literal["full", "truncate", "drop"] = "full"
+    # Serve commands from the output history if their latest output is younger than this many seconds
+    max_age: Optional[float] = Field(None, gt=0)
 
 class ExecuteResponse(BaseModel):
-    output: Dict[str, Dict[str, Any]]
\ No newline at end of file
+    output: Dict[str, Dict[str, Any]]
+
+class BulkExecuteRequest(BaseModel):
+    commands: List[str]
+    mode: Literal["exec", "shell"] = "exec"
+    raw_output: Literal["full", "truncate", "drop"] = "full"
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="palo_alto")
+    max_concurrency: Optional[int] = Field(None, gt=0)
+    device_timeout: Optional[float] = Field(None, gt=0)
+
+class DeviceExecuteResult(BaseModel):
+    status: str
+    output: Dict[str, Dict[str, Any]]
+    error: Optional[str] = None
+    elapsed: float
+
+class BulkExecuteSummary(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    timed_out: int
+    elapsed: float
+    min_device_elapsed: float
+    max_device_elapsed: float
+    avg_device_elapsed: float
+
+class BulkExecuteResponse(BaseModel):
+    results: Dict[str, DeviceExecuteResult]
+    summary: BulkExecuteSummary
+
+class StreamExecuteRequest(BaseModel):
+    commands: List[str]
+    mode: Literal["exec", "shell"] = "exec"
+
+class BulkStreamExecuteRequest(StreamExecuteRequest):
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="palo_alto")
+    max_concurrency: Optional[int] = Field(None, gt=0)
+    device_timeout: Optional[float] = Field(None, gt=0)
+
+
+class QueueExecuteRequest(BaseModel):
+    commands: List[str] = Field(..., min_length=1)
+    mode: Literal["exec", "shell"] = "exec"
+
+class BulkQueueExecuteRequest(QueueExecuteRequest):
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="palo_alto")
+
+class JobQueuedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class BulkQueueExecuteResponse(BaseModel):
+    batch_id: str
+    count: int
+
+class BulkIdentifyRequest(BaseModel):
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="unknown")
+
+class BulkIdentifyResponse(BaseModel):
+    batch_id: str
+    count: int
+
+class JobResponse(BaseModel):
+    job_id: str
+    type: str
+    status: str
+    batch_id: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = None
+    retry_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    updated_at: datetime
+
+class JobBatchResponse(BaseModel):
+    batch_id: str
+    total: int
+    counts: Dict[str, int]
+
+class WorkerResponse(BaseModel):
+    node_id: str
+    host: str
+    pid: int
+    concurrency: int
+    job_types: List[str]
+    running: int
+    started_at: datetime
+    heartbeat_at: datetime
+    alive: bool
+
+class WorkerListResponse(BaseModel):
+    workers: List[WorkerResponse]
+    queue: Dict[str, int]
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class DeviceImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    identify_batch_id: Optional[str] = None
+
+
+class HistoryEntry(BaseModel):
+    command: str
+    hash: str
+    size: int
+    executed_at: datetime
+
+class HistoryListResponse(BaseModel):
+    device: str
+    entries: List[HistoryEntry]
+    next_cursor: Optional[str] = None
+
+class HistoryLatestResponse(HistoryEntry):
+    device: str
+    output: Dict[str, Any]
+
+
+class DriftCheckRequest(BaseModel):
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="fortinet")
+
+class DriftCheckResponse(BaseModel):
+    batch_id: str
+    count: int
+    skipped: int
+
+class DriftSectionChange(BaseModel):
+    section: str
+    change: Literal["added", "removed", "modified"]
+    hunks: List[Dict[str, Any]]
+
+class DriftDeltaSummary(BaseModel):
+    device: str
+    version: int
+    captured_at: datetime
+    sections: List[str]
+
+class DriftDeltaResponse(BaseModel):
+    device: str
+    version: int
+    captured_at: datetime
+    from_hash: str
+    to_hash: str
+    changes: List[DriftSectionChange]
+
+class DriftStatusResponse(BaseModel):
+    device: str
+    version: int
+    hash: str
+    captured_at: datetime
+    checked_at: datetime
+    recent: List[DriftDeltaSummary]
+
+class DriftChangesResponse(BaseModel):
+    changes: List[DriftDeltaSummary]
+    count: int
+
+
+class ScheduleCreate(BaseModel):
+    name: str
+    commands: List[str] = Field(..., min_length=1)
+    mode: Literal["exec", "shell"] = "exec"
+    interval: float = Field(..., example=900, description="Seconds between runs")
+    names: Optional[List[str]] = None
+    network_cidr: Optional[str] = Field(None, example="10.0.0.0/24")
+    identified_type: Optional[str] = Field(None, example="palo_alto")
+    enabled: bool = True
+
+class ScheduleUpdate(BaseModel):
+    commands: Optional[List[str]] = Field(None, min_length=1)
+    mode: Optional[Literal["exec", "shell"]] = None
+    interval: Optional[float] = None
+    enabled: Optional[bool] = None
+
+class ScheduleResponse(BaseModel):
+    schedule_id: str
+    name: str
+    commands: List[str]
+    mode: str
+    interval: float
+    selector: Dict[str, Any]
+    enabled: bool
+    next_run_at: datetime
+    last_run_at: Optional[datetime] = None
+    last_summary: Optional[Dict[str, Any]] = None
+
+class ScheduleListResponse(BaseModel):
+    schedules: List[ScheduleResponse]
+    count: int
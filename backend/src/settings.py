@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,7 +11,107 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Credential encryption: "per_record" stores one key document per secret,
+    # "envelope" wraps per-record data keys with MASTER_KEY and stores them inline
+    ENCRYPTION_MODE: str = "per_record"
+    MASTER_KEY: Optional[str] = None
+    KEY_CACHE_SIZE: int = 10000
+    KEY_CACHE_TTL: float = 300.0
+
+    # Startup checks
+    ENSURE_INDEXES: bool = True
+    VERIFY_QUERY_PLANS: bool = False
+
+    # SSH execution
+    # "paramiko" (threads of SSH_WORKER_THREADS) or "asyncssh" (coroutines; needs the asyncssh package)
+    SSH_BACKEND: str = "paramiko"
+    SSH_PORT: int = 22
+    SSH_CONNECT_TIMEOUT: float = 10.0
+    SSH_COMMAND_TIMEOUT: float = 10.0
+    SSH_WORKER_THREADS: int = 64
+    SSH_POOL_MAX_SESSIONS_PER_DEVICE: int = 2
+    SSH_POOL_IDLE_TIMEOUT: float = 300.0
+    SSH_KEEPALIVE_INTERVAL: int = 30
+    # Characters of raw output kept when a request asks for raw_output="truncate"
+    RAW_OUTPUT_LIMIT: int = 4096
+    # Streaming execute: bytes read from the channel per chunk, and chunks buffered per stream
+    # before the SSH thread blocks waiting for the client to catch up
+    STREAM_CHUNK_SIZE: int = 32768
+    STREAM_QUEUE_SIZE: int = 64
+
+    # Command output history, compressed with gzip or zstd (which needs the optional zstandard
+    # package; without it gzip is used)
+    HISTORY_ENABLED: bool = True
+    HISTORY_CODEC: str = "gzip"
+    HISTORY_COMPRESSION_LEVEL: int = 6
+
+    # Scheduled polling: due schedules are checked every SCHEDULER_TICK seconds, and device polls
+    # start spread over the first SCHEDULER_SPREAD fraction of the schedule interval. Of all the
+    # processes with the scheduler enabled one runs polls at a time, holding a lease of
+    # SCHEDULER_LEASE_SECONDS that it renews every tick
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_TICK: float = 5.0
+    SCHEDULER_LEASE_SECONDS: float = 30.0
+    SCHEDULER_MAX_CONCURRENCY: int = 100
+    SCHEDULER_SUBNET_CONCURRENCY: int = 8
+    SCHEDULER_SPREAD: float = 0.5
+    SCHEDULER_MIN_INTERVAL: float = 60.0
+
+    # SSH governor: per-device and per-/24 caps on concurrent sessions and token-bucket limits on
+    # session starts per second (rate 0 disables a bucket), plus circuit breakers that fail calls to
+    # a device at once for GOVERNOR_COOLDOWN seconds after GOVERNOR_FAILURE_THRESHOLD consecutive failures
+    GOVERNOR_ENABLED: bool = True
+    GOVERNOR_DEVICE_CONCURRENCY: int = 4
+    GOVERNOR_SUBNET_CONCURRENCY: int = 32
+    GOVERNOR_DEVICE_RATE: float = 5.0
+    GOVERNOR_DEVICE_BURST: int = 10
+    GOVERNOR_SUBNET_RATE: float = 0.0
+    GOVERNOR_SUBNET_BURST: int = 100
+    GOVERNOR_FAILURE_THRESHOLD: int = 3
+    GOVERNOR_COOLDOWN: float = 60.0
+
+    # Device fingerprinting: results are cached per IP for FINGERPRINT_CACHE_TTL seconds (0 disables);
+    # FINGERPRINT_SIGNATURES_FILE is an optional JSON list of extra or replacement vendor signatures
+    FINGERPRINT_CACHE_TTL: float = 3600.0
+    FINGERPRINT_CACHE_SIZE: int = 10000
+    FINGERPRINT_SIGNATURES_FILE: Optional[str] = None
+
+    # Read endpoints (/devices/list, /credentials/list, /network/info) serve responses from memory until
+    # a write in this process changes their collections, or for at most READ_CACHE_TTL seconds (0 disables)
+    # to pick up writes made by other processes
+    READ_CACHE_TTL: float = 10.0
+    READ_CACHE_SIZE: int = 1000
+
+    # In-memory topology index of device IPs; rebuilt from Mongo every interval seconds (0 disables)
+    # to pick up devices added or deleted by other processes
+    TOPOLOGY_REFRESH_INTERVAL: float = 60.0
+
+    # Bulk execution
+    BULK_MAX_CONCURRENCY: int = 50
+    BULK_DEVICE_TIMEOUT: float = 120.0
+
+    # Bulk device import
+    IMPORT_BATCH_SIZE: int = 500
+
+    # Background jobs
+    JOB_CONCURRENCY: int = 20
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF: float = 5.0
+    JOB_RETRY_BACKOFF_MAX: float = 300.0
+    # Run job workers (and the poll scheduler) inside the API process. Disable to make the API
+    # enqueue-only and run `python -m src.worker` nodes instead.
+    JOB_WORKER_EMBEDDED: bool = True
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_HEARTBEAT_INTERVAL: float = 15.0
+    JOB_POLL_INTERVAL: float = 1.0
+
+    # Observability: /metrics on the API, a separate port on worker nodes; OpenTelemetry spans
+    # are emitted only when enabled and the opentelemetry package is installed
+    METRICS_ENABLED: bool = True
+    WORKER_METRICS_PORT: int = 9100
+    TRACING_ENABLED: bool = False
+
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
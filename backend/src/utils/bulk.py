@@ -0,0 +1,171 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.settings import settings
+from src.utils.encryptor import PasswordEncryptor
+from src.utils.governor import ssh_governor
+from src.utils.history import OutputHistoryStore
+from src.utils.logging import logger
+from src.utils.metrics import span
+from src.utils.networks import ips_in_cidr
+from src.utils.ssh import parse_outputs, ssh_execute_raw
+
+# How execute_with_history gets raw outputs for the commands it has to run: run_commands here, or
+# run_commands_on_worker in src.utils.jobs when SSH runs on worker nodes. The last argument is the
+# optional overall timeout of the SSH call.
+CommandRunner = Callable[[AsyncIOMotorDatabase, Dict[str, Any], List[str], str, Optional[float]], Awaitable[Dict[str, str]]]
+
+DEVICE_PROJECTION = {"_id": 0, "device_id": 1, "name": 1, "ip": 1, "username": 1, "encrypted_password": 1, "identified_type": 1, "health": 1}
+
+
+async def resolve_targets(
+    db: AsyncIOMotorDatabase,
+    names: Optional[List[str]] = None,
+    network_cidr: Optional[str] = None,
+    identified_type: Optional[str] = None,
+    allow_all: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Resolve a bulk target selector to device documents.
+    Selectors are combined with AND; at least one must be given unless allow_all is set,
+    in which case an empty selector means the whole inventory.
+    """
+    query: Dict[str, Any] = {}
+    if names:
+        query["name"] = {"$in": names}
+    if network_cidr:
+        query["ip"] = {"$in": await ips_in_cidr(db, network_cidr)}
+    if identified_type:
+        query["identified_type"] = identified_type
+    if not query and not allow_all:
+        raise ValueError("At least one of names, network_cidr or identified_type is required")
+    devices = await db["Devices"].find(query, DEVICE_PROJECTION).to_list(None)
+    # Devices another process found unreachable fail fast here too instead of each waiting out a connect timeout
+    for device in devices:
+        ssh_governor.seed(device)
+    return devices
+
+
+async def run_commands(
+    db: AsyncIOMotorDatabase, device: Dict[str, Any], commands: List[str], mode: str, timeout: Optional[float] = None
+) -> Dict[str, str]:
+    """
+    Run commands on device from this process and record their output in the history store.
+    """
+    encryptor = PasswordEncryptor(db)
+    password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+    with span("ssh.execute", device=device["name"], mode=mode):
+        outputs = await ssh_execute_raw(device["ip"], device["username"], password, commands, mode, device.get("identified_type"), timeout)
+    if settings.HISTORY_ENABLED:
+        with span("history.record", device=device["name"]):
+            await OutputHistoryStore(db).record(device, outputs)
+    return outputs
+
+
+async def execute_with_history(
+    db: AsyncIOMotorDatabase,
+    device: Dict[str, Any],
+    commands: List[str],
+    mode: str = "exec",
+    raw_output: str = "full",
+    max_age: Optional[float] = None,
+    run: CommandRunner = run_commands,
+    timeout: Optional[float] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Execute commands on device with run and record their output in the history store.
+    With max_age, commands whose latest stored output is younger than max_age seconds are
+    answered from the store; SSH is only opened for the rest, and not at all if none remain.
+    timeout bounds the SSH call.
+    """
+    store = OutputHistoryStore(db)
+    identified_type = device.get("identified_type")
+    raw: Dict[str, str] = {}
+    cached_at: Dict[str, datetime] = {}
+    if max_age and settings.HISTORY_ENABLED:
+        newer_than = datetime.utcnow() - timedelta(seconds=max_age)
+        for command in commands:
+            entry = await store.latest(device["device_id"], command, newer_than)
+            if entry:
+                raw[command] = entry["output"]
+                cached_at[command] = entry["executed_at"]
+
+    missing = [command for command in commands if command not in raw]
+    if missing:
+        raw.update(await run(db, device, missing, mode, timeout))
+    else:
+        logger.info(f"Served {len(commands)} commands for {device['name']} from history")
+
+    with span("parse", device=device["name"]):
+        output = await asyncio.to_thread(parse_outputs, {command: raw[command] for command in commands}, identified_type, raw_output)
+    for command, executed_at in cached_at.items():
+        output[command]["cached_at"] = executed_at.isoformat()
+    return output
+
+
+async def _execute_on_device(
+    db: AsyncIOMotorDatabase,
+    device: Dict[str, Any],
+    commands: List[str],
+    mode: str,
+    raw_output: str,
+    semaphore: asyncio.Semaphore,
+    device_timeout: float,
+    run: CommandRunner,
+) -> Dict[str, Any]:
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            # The deadline is enforced inside the SSH call, so the semaphore is only released once the
+            # session is, and devices that time out cannot push the real concurrency past the limit
+            output = await execute_with_history(db, device, commands, mode, raw_output, run=run, timeout=device_timeout)
+            return {"status": "success", "output": output, "error": None, "elapsed": time.perf_counter() - started}
+        except TimeoutError:
+            logger.warning(f"Bulk execute timed out on {device['name']} after {device_timeout}s")
+            return {"status": "timeout", "output": {}, "error": f"Timed out after {device_timeout}s", "elapsed": time.perf_counter() - started}
+        except Exception as e:
+            logger.warning(f"Bulk execute failed on {device['name']}: {e}")
+            return {"status": "failed", "output": {}, "error": str(e), "elapsed": time.perf_counter() - started}
+
+
+async def bulk_execute(
+    db: AsyncIOMotorDatabase,
+    devices: List[Dict[str, Any]],
+    commands: List[str],
+    mode: str = "exec",
+    raw_output: str = "full",
+    max_concurrency: Optional[int] = None,
+    device_timeout: Optional[float] = None,
+    run: CommandRunner = run_commands,
+) -> Dict[str, Any]:
+    """
+    Run the same commands on many devices concurrently.
+    Concurrency is capped by max_concurrency (never above BULK_MAX_CONCURRENCY) and each
+    device gets at most device_timeout seconds. Returns per-device results and a summary.
+    """
+    concurrency = min(max_concurrency or settings.BULK_MAX_CONCURRENCY, settings.BULK_MAX_CONCURRENCY)
+    timeout = device_timeout or settings.BULK_DEVICE_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(_execute_on_device(db, device, commands, mode, raw_output, semaphore, timeout, run) for device in devices)
+    )
+    elapsed = time.perf_counter() - started
+
+    per_device = {device["name"]: result for device, result in zip(devices, results)}
+    timings = [result["elapsed"] for result in results]
+    summary = {
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "success"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "timed_out": sum(1 for r in results if r["status"] == "timeout"),
+        "elapsed": elapsed,
+        "min_device_elapsed": min(timings) if timings else 0.0,
+        "max_device_elapsed": max(timings) if timings else 0.0,
+        "avg_device_elapsed": sum(timings) / len(timings) if timings else 0.0,
+    }
+    logger.info(f"Bulk execute finished: {summary['succeeded']}/{summary['total']} succeeded in {elapsed:.2f}s")
+    return {"results": per_device, "summary": summary}
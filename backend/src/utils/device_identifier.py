@@ -1,44 +1,216 @@
-import paramiko
-from src.utils.logging import logger
+import json
 import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+from src.settings import settings
+from src.utils.cache import TTLCache
+from src.utils.logging import logger
+from src.utils.metrics import FINGERPRINTS
+from src.utils.ssh import ssh_execute_raw, ssh_probe
+
+# Vendor signatures, tried in order. banner matches the SSH server version string or pre-auth
+# banner and prompt the first shell prompt, both seen before any command runs; markers confirm
+# the vendor in command output; command is the one whose output holds the fields (one group
+# each). Patterns are multiline. FINGERPRINT_SIGNATURES_FILE entries have the same shape.
+SIGNATURE_TABLE: List[Dict[str, Any]] = [
+    {
+        "identified_type": "palo_alto",
+        # admin@PA-3220> ; Junos prompts look the same, so the prompt alone does not decide
+        "prompt": r"^[\w.\-]+@[\w.\-()]+[>#]\s*$",
+        "command": "show system info",
+        "markers": r"PAN-OS|Palo Alto|^sw-version:",
+        "fields": {"model": r"^model:\s*(.*?)\s*$", "version": r"^sw-version:\s*(.*?)\s*$"},
+    },
+    {
+        "identified_type": "check_point",
+        # gw-01:0> (clish) / [Expert@gw-01:0]# (expert)
+        "prompt": r"^(\[Expert@[\w.\-]+:\d+\]#|[\w.\-]+:\d+[>#])\s*$",
+        "command": "show version all",
+        "markers": r"Check Point|Gaia",
+        "fields": {"model": r"^Product Name:\s*(.*?)\s*$", "version": r"^OS Major:\s*(.*?)\s*$"},
+    },
+    {
+        "identified_type": "fortinet",
+        "banner": r"^SSH-[\d.]+-FortiSSH",
+        # FGT-01 # / FGT-01 (console) #
+        "prompt": r"^[\w.\-]+( \([\w.\-]+\))? [#$]\s*$",
+        "command": "get system status",
+        "markers": r"FortiGate|Fortinet|FortiOS",
+        "fields": {"model": r"^Hostname:\s*(.*?)\s*$", "version": r"^Version:\s*(.*?)\s*$"},
+    },
+    {
+        "identified_type": "cisco_ios",
+        "banner": r"^SSH-[\d.]+-Cisco",
+        # Router> / Router#
+        "prompt": r"^[\w.\-]+[>#]\s*$",
+        "command": "show version",
+        "markers": r"Cisco IOS",
+        "fields": {"model": r"^[Cc]isco (\S+) \(.*\) processor", "version": r"Cisco IOS.*?Version ([^\s,]+)"},
+    },
+    {
+        "identified_type": "juniper_junos",
+        # user@router> / user@router#
+        "prompt": r"^[\w.\-]+@[\w.\-]+[>#%]\s*$",
+        "command": "show version",
+        "markers": r"JUNOS|^Junos:",
+        "fields": {"model": r"^Model:\s*(.*?)\s*$", "version": r"^Junos:\s*(.*?)\s*$"},
+    },
+]
+
+# Run when banner and prompt leave too many candidates; every signature's markers are checked against it
+PROBE_COMMAND = "show version"
+# Candidates left after banner and prompt that are tried directly with their own command
+MAX_DIRECT_CANDIDATES = 2
+# Cached for addresses that matched no signature, so they are not reconnected to until the TTL passes
+_UNKNOWN = object()
+
+
+@dataclass(frozen=True)
+class Signature:
+    identified_type: str
+    command: str
+    markers: Pattern
+    fields: Dict[str, Pattern]
+    banner: Optional[Pattern] = None
+    prompt: Optional[Pattern] = None
+
+    def extract(self, output: str) -> Dict[str, str]:
+        values = {}
+        for name, pattern in self.fields.items():
+            match = pattern.search(output)
+            values[name] = match.group(1).strip() if match else "Unknown"
+        return values
+
+
+def _compile(entry: Dict[str, Any]) -> Signature:
+    def pattern(source: Optional[str]) -> Optional[Pattern]:
+        return re.compile(source, re.MULTILINE) if source else None
 
-def identify_device_via_ssh(host: str, username: str, password: str) -> dict:
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     try:
-        client.connect(hostname=host, username=username, password=password, timeout=10)
-        stdin, stdout, stderr = client.exec_command("show version", timeout=10)
-        output = stdout.read().decode('utf-8').strip()
-        error = stderr.read().decode('utf-8').strip()
-        result = output if output else error
+        return Signature(
+            identified_type=entry["identified_type"],
+            command=entry["command"],
+            markers=pattern(entry["markers"]),
+            fields={name: pattern(source) for name, source in entry.get("fields", {}).items()},
+            banner=pattern(entry.get("banner")),
+            prompt=pattern(entry.get("prompt")),
+        )
+    except (KeyError, re.error) as e:
+        raise ValueError(f"Invalid device signature {entry.get('identified_type', entry)}: {e}")
 
-        if not result:
-            raise ValueError("No output from show version")
-
-        if "PAN-OS" in result or "Palo Alto" in result:
-            device_type = "palo_alto"
-            stdin, stdout, stderr = client.exec_command("show system info", timeout=10)
-            pa_output = stdout.read().decode('utf-8')
-            model = re.search(r"model:\s*(.*?)\n", pa_output).group(1) if re.search(r"model:\s*(.*?)\n", pa_output) else "Unknown"
-            version = re.search(r"sw-version:\s*(.*?)\n", pa_output).group(1) if re.search(r"sw-version:\s*(.*?)\n", pa_output) else "Unknown"
-        elif "Check Point" in result or "Gaia" in result:
-            device_type = "check_point"
-            stdin, stdout, stderr = client.exec_command("show version all", timeout=10)
-            cp_output = stdout.read().decode('utf-8')
-            model = re.search(r"Product Name:\s*(.*?)\n", cp_output).group(1) if re.search(r"Product Name:\s*(.*?)\n", cp_output) else "Unknown"
-            version = re.search(r"OS Major:\s*(.*?)\n", cp_output).group(1) if re.search(r"OS Major:\s*(.*?)\n", cp_output) else "Unknown"
-        elif "FortiGate" in result or "Fortinet" in result:
-            device_type = "fortinet"
-            stdin, stdout, stderr = client.exec_command("get system status", timeout=10)
-            ft_output = stdout.read().decode('utf-8')
-            model = re.search(r"Hostname:\s*(.*?)\n", ft_output).group(1) if re.search(r"Hostname:\s*(.*?)\n", ft_output) else "Unknown"
-            version = re.search(r"Version:\s*(.*?)\n", ft_output).group(1) if re.search(r"Version:\s*(.*?)\n", ft_output) else "Unknown"
-        else:
+
+def load_signatures(path: Optional[str] = None) -> List[Signature]:
+    """
+    Compile SIGNATURE_TABLE, with entries from the JSON file at path added to it or replacing
+    the built-in entry of the same identified_type.
+    """
+    table = list(SIGNATURE_TABLE)
+    if path:
+        with open(path) as f:
+            extra = json.load(f)
+        replaced = {entry.get("identified_type") for entry in extra}
+        table = [entry for entry in table if entry["identified_type"] not in replaced] + extra
+        logger.info(f"Loaded {len(extra)} device signatures from {path}")
+    return [_compile(entry) for entry in table]
+
+
+class DeviceFingerprinter:
+    """
+    Identifies devices from the signature table, cheapest evidence first: the SSH banner, then
+    the shell prompt, and only then commands. A device whose banner or prompt leaves one or two
+    candidates costs a single command (the one that also yields model and version); the rest
+    run PROBE_COMMAND first. Results, unknown devices included, are cached per IP.
+    """
+    def __init__(self, signatures: List[Signature], cache_ttl: float, cache_size: int):
+        self.signatures = signatures
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+
+    async def identify(self, host: str, username: str, password: str, refresh: bool = False) -> Dict[str, str]:
+        """
+        Returns {"type", "model", "version"}. Raises ValueError for a device no signature matches.
+        refresh skips the cached result for host.
+        """
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(host)
+            if cached is _UNKNOWN:
+                FINGERPRINTS.labels(stage="cache", identified_type="unknown").inc()
+                raise ValueError("Unknown device type")
+            if cached is not None:
+                FINGERPRINTS.labels(stage="cache", identified_type=cached["type"]).inc()
+                return dict(cached)
+        try:
+            signature, output, stage = await self._fingerprint(host, username, password)
+        except LookupError:
+            FINGERPRINTS.labels(stage="command", identified_type="unknown").inc()
+            if self.cache is not None:
+                self.cache.set(host, _UNKNOWN)
             raise ValueError("Unknown device type")
+        FINGERPRINTS.labels(stage=stage, identified_type=signature.identified_type).inc()
+        result = {"type": signature.identified_type, "model": "Unknown", "version": "Unknown", **signature.extract(output)}
+        if self.cache is not None:
+            self.cache.set(host, result)
+        return dict(result)
+
+    def invalidate(self, host: str):
+        if self.cache is not None:
+            self.cache.invalidate(host)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"signatures": len(self.signatures), "cache": self.cache.stats() if self.cache is not None else None}
+
+    @staticmethod
+    def _narrow(candidates: List[Signature], evidence: str, text: str) -> List[Signature]:
+        if not text:
+            return candidates
+        matched = [s for s in candidates if getattr(s, evidence) is not None and getattr(s, evidence).search(text)]
+        return matched or candidates
+
+    async def _fingerprint(self, host: str, username: str, password: str) -> Tuple[Signature, str, str]:
+        """
+        Returns the matching signature, the output of its command and the evidence that decided.
+        Raises LookupError when no signature matches.
+        """
+        outputs: Dict[str, str] = {}
+
+        async def run(command: str) -> str:
+            # Pooled by the SSH backend, so every step reuses the session the probe opened
+            if command not in outputs:
+                outputs[command] = (await ssh_execute_raw(host, username, password, [command]))[command]
+            return outputs[command]
+
+        evidence = await ssh_probe(host, username, password)
+        candidates = self._narrow(self.signatures, "banner", f"{evidence['server_version']}\n{evidence['banner']}".strip())
+        stage = "banner"
+        if len(candidates) > 1:
+            evidence = await ssh_probe(host, username, password, read_prompt=True)
+            candidates = self._narrow(candidates, "prompt", evidence["prompt"])
+            stage = "prompt"
+        if len(candidates) <= MAX_DIRECT_CANDIDATES:
+            for signature in candidates:
+                output = await run(signature.command)
+                if signature.markers.search(output):
+                    return signature, output, stage
+            logger.info(f"{host} matched {[s.identified_type for s in candidates]} before any command but none confirmed; probing")
 
-        return {"type": device_type, "model": model, "version": version}
+        result = (await run(PROBE_COMMAND)).strip()
+        if not result:
+            raise ValueError(f"No output from {PROBE_COMMAND}")
+        for signature in self.signatures:
+            if signature.markers.search(result):
+                return signature, await run(signature.command), "command"
+        raise LookupError(host)
+
+
+fingerprinter = DeviceFingerprinter(
+    load_signatures(settings.FINGERPRINT_SIGNATURES_FILE),
+    cache_ttl=settings.FINGERPRINT_CACHE_TTL,
+    cache_size=settings.FINGERPRINT_CACHE_SIZE,
+)
+
+
+async def identify_device_via_ssh(host: str, username: str, password: str, refresh: bool = False) -> dict:
+    try:
+        return await fingerprinter.identify(host, username, password, refresh)
     except Exception as e:
         logger.error(f"Device identification failed: {e}")
         raise
-    finally:
-        client.close()
\ No newline at end of file
@@ -0,0 +1,228 @@
+import codecs
+import csv
+import json
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
+from fastapi import UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from src.schemas import Device
+from src.settings import settings
+from src.utils.encryptor import PasswordEncryptor, invalidate_key
+from src.utils.jobs import job_runner
+from src.utils.logging import logger
+from src.utils.read_cache import read_cache
+from src.utils.topology import topology_index
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+async def _iter_lines(upload: UploadFile) -> AsyncIterator[str]:
+    """
+    Yield decoded lines from an upload without reading the whole file into memory.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+class _LineFeed:
+    """
+    The lines a csv.reader reads from, handed over as the upload arrives.
+    """
+    def __init__(self):
+        self.lines: Deque[str] = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def _iter_csv(upload: UploadFile) -> AsyncIterator[Union[List[str], csv.Error]]:
+    """
+    Yield the records of a CSV upload, or the csv.Error of a record that cannot be parsed.
+    One csv.reader parses the whole upload, so quoted fields may span lines; it is handed
+    lines only once every quote they open has been closed, so it never runs dry mid-record.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    pending: List[str] = []
+    quotes = 0
+    async for line in _iter_lines(upload):
+        pending.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        feed.lines.extend(pending)
+        pending, quotes = [], 0
+        while feed.lines:
+            try:
+                yield next(reader)
+            except csv.Error as e:
+                yield e
+    # An unterminated quote swallows the rest of the upload into its last record
+    feed.lines.extend(pending)
+    while feed.lines:
+        try:
+            yield next(reader)
+        except csv.Error as e:
+            yield e
+
+
+async def iter_rows(upload: UploadFile, file_format: str) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (row number, raw row) pairs from a CSV (with header) or NDJSON upload.
+    Rows that cannot be decoded are yielded as exceptions so they can be reported per row.
+    """
+    row_number = 0
+    if file_format == "csv":
+        header: Optional[List[str]] = None
+        async for record in _iter_csv(upload):
+            if isinstance(record, list) and not any(field.strip() for field in record):
+                continue
+            if header is None and isinstance(record, list):
+                header = [column.strip() for column in record]
+                continue
+            row_number += 1
+            if isinstance(record, csv.Error):
+                yield row_number, ValueError(f"Malformed row: {record}")
+            elif len(record) != len(header):
+                yield row_number, ValueError(f"Malformed row: expected {len(header)} columns, got {len(record)}")
+            else:
+                yield row_number, dict(zip(header, record))
+        return
+    async for line in _iter_lines(upload):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, ValueError(f"Malformed row: {e}")
+
+
+class DeviceImporter:
+    """
+    Validates rows against the Device schema and writes them in batches: one insert_many per
+    batch for keys, Devices and Credentials. Writes are unordered, so a bad row only fails
+    itself.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase, identify: bool):
+        self.db = db
+        self.identify = identify
+        self.encryptor = PasswordEncryptor(db)
+        self.batch: List[Tuple[int, Device]] = []
+        self.imported = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.identify_batch_id = str(uuid.uuid4()) if identify else None
+
+    async def add(self, row_number: int, row: Any):
+        if isinstance(row, Exception):
+            self.errors.append({"row": row_number, "error": str(row)})
+            return
+        try:
+            device = Device.model_validate(row)
+        except ValidationError as e:
+            self.errors.append({"row": row_number, "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+            return
+        self.batch.append((row_number, device))
+        if len(self.batch) >= settings.IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def _discard_keys(self, device_ids: List[str]):
+        """
+        Drop the per-device keys created for devices that were not stored.
+        """
+        if device_ids and settings.ENCRYPTION_MODE != "envelope":
+            await self.db["credentials_keys"].delete_many({"user_id": {"$in": device_ids}})
+            for device_id in device_ids:
+                invalidate_key(device_id)
+
+    async def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        device_ids = [str(uuid.uuid4()) for _ in batch]
+        tokens = await self.encryptor.encrypt_many([(device.password, device_id) for (_, device), device_id in zip(batch, device_ids)])
+        device_docs = [
+            {
+                "device_id": device_id,
+                "name": device.name,
+                "ip": str(device.ip),
+                "device_type": device.device_type,
+                "username": device.username,
+                "encrypted_password": token,
+                "identified_type": "pending" if self.identify else "unknown",
+                "model": "unknown",
+                "version": "unknown",
+            }
+            for (_, device), device_id, token in zip(batch, device_ids, tokens)
+        ]
+
+        failed_indexes = set()
+        try:
+            await self.db["Devices"].insert_many(device_docs, ordered=False)
+        except BulkWriteError as bwe:
+            for write_error in bwe.details.get("writeErrors", []):
+                index = write_error["index"]
+                failed_indexes.add(index)
+                message = "Duplicate device" if write_error.get("code") == 11000 else write_error.get("errmsg", "Write failed")
+                self.errors.append({"row": batch[index][0], "error": message})
+        await self._discard_keys([doc["device_id"] for index, doc in enumerate(device_docs) if index in failed_indexes])
+
+        stored = [(index, doc) for index, doc in enumerate(device_docs) if index not in failed_indexes]
+        if not stored:
+            return
+        try:
+            await self.db["Credentials"].insert_many(
+                [{"device_id": doc["device_id"], "username": doc["username"], "encrypted_password": doc["encrypted_password"]} for _, doc in stored],
+                ordered=False,
+            )
+        except BulkWriteError as bwe:
+            # A device without its credentials cannot be used: take it back out and reject its row
+            lost = set()
+            for write_error in bwe.details.get("writeErrors", []):
+                index, doc = stored[write_error["index"]]
+                lost.add(doc["device_id"])
+                self.errors.append({"row": batch[index][0], "error": write_error.get("errmsg", "Credentials write failed")})
+            await self.db["Devices"].delete_many({"device_id": {"$in": list(lost)}})
+            await self._discard_keys(list(lost))
+            stored = [(index, doc) for index, doc in stored if doc["device_id"] not in lost]
+            if not stored:
+                # The rolled-back devices were briefly visible to list reads
+                read_cache.bump("devices")
+                return
+
+        inserted = [doc for _, doc in stored]
+        for doc in inserted:
+            topology_index.add_device(doc)
+        read_cache.bump("devices")
+        if self.identify:
+            await job_runner.enqueue_batch(self.db, "identify", [{"device_id": doc["device_id"], "refresh": True} for doc in inserted], self.identify_batch_id)
+        self.imported += len(inserted)
+        logger.info(f"Imported batch of {len(inserted)} devices ({len(batch) - len(inserted)} rejected)")
+
+    def summary(self) -> Dict[str, Any]:
+        self.errors.sort(key=lambda error: error["row"])
+        return {
+            "imported": self.imported,
+            "failed": len(self.errors),
+            "errors": self.errors,
+            "identify_batch_id": self.identify_batch_id if self.imported else None,
+        }
@@ -0,0 +1,298 @@
+import asyncio
+import difflib
+import hashlib
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from src.utils.encryptor import PasswordEncryptor
+from src.utils.history import compress, decompress
+from src.utils.logging import logger
+from src.utils.ssh import ssh_execute_raw
+
+SNAPSHOTS_COLLECTION = "ConfigSnapshots"
+DELTAS_COLLECTION = "ConfigDeltas"
+
+# Command that prints the running configuration, per identified_type
+CONFIG_COMMANDS: Dict[str, str] = {
+    "palo_alto": "show config running",
+    "check_point": "show configuration",
+    "fortinet": "show",
+}
+
+# Lines that change on every export without the configuration changing
+VOLATILE_LINES: Dict[str, re.Pattern] = {
+    "check_point": re.compile(r"^# (Configuration of|Language version|Exported by)"),
+    "fortinet": re.compile(r"^#(config-version|conf_file_ver|buildno|global_vdom)="),
+}
+
+Sections = Dict[str, List[str]]
+# Run-length section names in line order: [[section, line count], ...]
+Layout = List[List[Any]]
+
+
+def _brace_sections(lines: List[str]) -> List[str]:
+    # PAN-OS: a line belongs to the path of the first two levels of "name {" blocks around it
+    keys = []
+    stack: List[str] = []
+    for line in lines:
+        stripped = line.strip()
+        if stripped.endswith("{"):
+            stack.append(stripped[:-1].strip())
+        keys.append(" / ".join(stack[:2]))
+        if stripped.endswith("}") and stack:
+            stack.pop()
+    return keys
+
+
+def _fortios_sections(lines: List[str]) -> List[str]:
+    # FortiOS: each top-level "config ..." block through its unindented "end"
+    keys = []
+    current = ""
+    for line in lines:
+        if line.startswith("config "):
+            current = line.strip()
+        keys.append(current)
+        if line.rstrip() == "end":
+            current = ""
+    return keys
+
+
+def _clish_sections(lines: List[str]) -> List[str]:
+    # Gaia clish: flat "set <feature> ..." / "add <feature> ..." commands keyed by feature
+    keys = []
+    for line in lines:
+        words = line.split()
+        keys.append(words[1] if len(words) > 1 and words[0] in ("set", "add", "delete") else "")
+    return keys
+
+
+SECTION_SPLITTERS = {
+    "palo_alto": _brace_sections,
+    "check_point": _clish_sections,
+    "fortinet": _fortios_sections,
+}
+
+
+def normalise_config(identified_type: Optional[str], config: str) -> str:
+    volatile = VOLATILE_LINES.get(identified_type or "")
+    lines = [line.rstrip() for line in config.replace("\r", "").split("\n")]
+    return "\n".join(line for line in lines if line and not (volatile and volatile.match(line)))
+
+
+def split_sections(identified_type: Optional[str], config: str) -> Tuple[Sections, Layout]:
+    """
+    Split a normalised configuration into named sections, in order of first appearance, plus
+    the layout needed to put the lines back in their original order with join_sections.
+    """
+    lines = config.split("\n") if config else []
+    splitter = SECTION_SPLITTERS.get(identified_type or "")
+    keys = splitter(lines) if splitter else [""] * len(lines)
+    sections: Sections = {}
+    layout: Layout = []
+    for key, line in zip(keys, lines):
+        sections.setdefault(key, []).append(line)
+        if layout and layout[-1][0] == key:
+            layout[-1][1] += 1
+        else:
+            layout.append([key, 1])
+    return sections, layout
+
+
+def join_sections(sections: Sections, layout: Layout) -> str:
+    remaining = {name: iter(lines) for name, lines in sections.items()}
+    return "\n".join(next(remaining[name]) for name, count in layout for _ in range(count))
+
+
+def _hash_lines(lines: List[str]) -> str:
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def diff_section(old: List[str], new: List[str]) -> List[Dict[str, Any]]:
+    """
+    Line diff of one section as hunks of removed/added lines at their positions in old and new.
+    The hunks are also a reverse delta: apply_reverse(new, hunks) rebuilds old.
+    """
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [
+        {"old_start": i1, "new_start": j1, "new_end": j2, "removed": old[i1:i2], "added": new[j1:j2]}
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_reverse(new: List[str], hunks: List[Dict[str, Any]]) -> List[str]:
+    old: List[str] = []
+    position = 0
+    for hunk in hunks:
+        old.extend(new[position:hunk["new_start"]])
+        old.extend(hunk["removed"])
+        position = hunk["new_end"]
+    old.extend(new[position:])
+    return old
+
+
+def diff_configs(old: Sections, old_hashes: Dict[str, str], new: Sections, new_hashes: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Section-aware diff: only sections whose hash changed are compared line by line.
+    """
+    changes = []
+    for name in list(new) + [name for name in old if name not in new]:
+        if old_hashes.get(name) == new_hashes.get(name):
+            continue
+        if name not in old:
+            change = "added"
+        elif name not in new:
+            change = "removed"
+        else:
+            change = "modified"
+        changes.append({"section": name, "change": change, "hunks": diff_section(old.get(name, []), new.get(name, []))})
+    return changes
+
+
+def _section_hashes(sections: Sections) -> List[Tuple[str, str]]:
+    # Stored as pairs rather than a dict: section names may contain "." or start with "$"
+    return [(name, _hash_lines(lines)) for name, lines in sections.items()]
+
+
+class DriftStore:
+    """
+    Configuration snapshots with reverse deltas.
+
+    ConfigSnapshots holds only the latest normalised configuration per device (compressed) with
+    a hash of the whole config and of each section. Every change adds a ConfigDeltas document
+    with the hunks of the changed sections, from which older versions are rebuilt by walking
+    back from the latest one. A capture whose hash matches the snapshot costs one small update.
+
+    A change is committed by a single compare-and-set on the snapshot that also carries the new
+    delta as pending_delta; it is then copied to ConfigDeltas and cleared. Whoever next touches
+    the device finishes that copy, so a crash between the writes never strands the snapshot.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.snapshots = db[SNAPSHOTS_COLLECTION]
+        self.deltas = db[DELTAS_COLLECTION]
+
+    async def _load(self, snapshot: Dict[str, Any]) -> Tuple[Sections, Layout]:
+        config = await asyncio.to_thread(decompress, snapshot["codec"], snapshot["config"])
+        return split_sections(snapshot["identified_type"], config)
+
+    async def _settle(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Copy a snapshot's pending delta into ConfigDeltas and clear it.
+        """
+        delta = snapshot.get("pending_delta")
+        if not delta:
+            return
+        # A replace, so a delta left behind by a capture that never advanced the snapshot is overwritten
+        await self.deltas.replace_one({"device_id": delta["device_id"], "version": delta["version"]}, delta, upsert=True)
+        await self.snapshots.update_one(
+            {"device_id": snapshot["device_id"], "version": delta["version"]}, {"$unset": {"pending_delta": ""}}
+        )
+
+    async def record(self, device: Dict[str, Any], config: str, captured_at: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Compare a captured configuration with the device's snapshot and store the change, if any.
+        Returns {"status": "new" | "unchanged" | "changed" | "conflict", "version", "sections_changed"}.
+        """
+        captured_at = captured_at or datetime.utcnow()
+        identified_type = device.get("identified_type")
+        config = normalise_config(identified_type, config)
+        content_hash = hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+        snapshot = await self.snapshots.find_one(
+            {"device_id": device["device_id"]}, {"_id": 0, "device_id": 1, "hash": 1, "version": 1, "pending_delta": 1}
+        )
+        if snapshot:
+            await self._settle(snapshot)
+        if snapshot and snapshot["hash"] == content_hash:
+            await self.snapshots.update_one({"device_id": device["device_id"]}, {"$set": {"checked_at": captured_at}})
+            return {"status": "unchanged", "version": snapshot["version"], "sections_changed": 0}
+
+        sections, layout = split_sections(identified_type, config)
+        new_hashes = _section_hashes(sections)
+        codec, data = await asyncio.to_thread(compress, config)
+        document = {
+            "device_id": device["device_id"],
+            "device": device["name"],
+            "identified_type": identified_type,
+            "hash": content_hash,
+            "section_hashes": new_hashes,
+            "codec": codec,
+            "config": data,
+            "captured_at": captured_at,
+            "checked_at": captured_at,
+        }
+        if not snapshot:
+            try:
+                await self.snapshots.insert_one({**document, "version": 1})
+            except DuplicateKeyError:
+                return {"status": "conflict", "version": None, "sections_changed": 0}
+            return {"status": "new", "version": 1, "sections_changed": len(sections)}
+
+        previous = await self.snapshots.find_one({"device_id": device["device_id"]})
+        old_sections, old_layout = await self._load(previous)
+        changes = diff_configs(old_sections, dict(previous["section_hashes"]), sections, dict(new_hashes))
+        version = previous["version"] + 1
+        delta = {
+            "device_id": device["device_id"],
+            "device": device["name"],
+            "version": version,
+            "from_hash": previous["hash"],
+            "to_hash": content_hash,
+            "captured_at": captured_at,
+            "changes": changes,
+            # The layout this change replaced, needed to rebuild older versions; None when it is unchanged
+            "previous_layout": old_layout if old_layout != layout else None,
+        }
+        # Conditional on the version read above: a concurrent capture of the same device loses here
+        result = await self.snapshots.update_one(
+            {"device_id": device["device_id"], "version": previous["version"]},
+            {"$set": {**document, "version": version, "pending_delta": delta}},
+        )
+        if not result.matched_count:
+            return {"status": "conflict", "version": None, "sections_changed": 0}
+        await self._settle({"device_id": device["device_id"], "pending_delta": delta})
+        logger.info(f"Config drift on {device['name']}: version {version}, {len(changes)} sections changed")
+        return {"status": "changed", "version": version, "sections_changed": len(changes)}
+
+    async def snapshot(self, device_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the configuration of a device at version (default: latest), rebuilt from deltas.
+        """
+        head = await self.snapshots.find_one({"device_id": device_id})
+        if head:
+            await self._settle(head)
+        if not head or (version is not None and not 1 <= version <= head["version"]):
+            return None
+        sections, layout = await self._load(head)
+        captured_at = head["captured_at"]
+        if version is not None and version < head["version"]:
+            async for delta in self.deltas.find({"device_id": device_id, "version": {"$gt": version}}).sort("version", -1):
+                for change in delta["changes"]:
+                    sections[change["section"]] = apply_reverse(sections.get(change["section"], []), change["hunks"])
+                if delta["previous_layout"] is not None:
+                    layout = delta["previous_layout"]
+            previous = await self.deltas.find_one({"device_id": device_id, "version": version}, {"captured_at": 1})
+            # Version 1 has no delta of its own; it was captured when the snapshot was created
+            captured_at = previous["captured_at"] if previous else None
+        return {"version": version or head["version"], "captured_at": captured_at, "config": join_sections(sections, layout)}
+
+
+async def capture_config(db: AsyncIOMotorDatabase, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Job handler: pull the running configuration of one device and record any drift.
+    """
+    device = await db["Devices"].find_one({"device_id": payload["device_id"]})
+    if not device:
+        raise ValueError(f"Device {payload['device_id']} no longer exists")
+    command = CONFIG_COMMANDS.get(device.get("identified_type"))
+    if not command:
+        return {"status": "unsupported", "version": None, "sections_changed": 0}
+    encryptor = PasswordEncryptor(db)
+    password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+    outputs = await ssh_execute_raw(device["ip"], device["username"], password, [command], "exec", device["identified_type"])
+    if not outputs[command].strip():
+        raise ValueError(f"Empty configuration returned by '{command}'")
+    return await DriftStore(db).record(device, outputs[command], datetime.utcnow())
@@ -1,8 +1,48 @@
+import asyncio
 import base64
+import re
+import sys
 import uuid
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from src.settings import settings
+from src.utils.cache import TTLCache
+from src.utils.logging import logger
+from src.utils.metrics import DECRYPT_SECONDS, span, timed
+
+# Envelope tokens carry their own wrapped data key: "env1$<wrapped data key>$<ciphertext>".
+# Fernet tokens are urlsafe base64, so "$" never appears inside either part.
+ENVELOPE_PREFIX = "env1$"
+
+# Decrypted per-record keys, so repeated decrypts for the same device skip the credentials_keys lookup
+key_cache = TTLCache(maxsize=settings.KEY_CACHE_SIZE, ttl=settings.KEY_CACHE_TTL)
+
+# Collections holding encrypted_password fields, with the id their key is stored under
+ENCRYPTED_COLLECTIONS = [("Devices", "device_id"), ("Credentials", "device_id"), ("credentials", "user_id")]
+
+
+def invalidate_key(user_id: str):
+    """
+    Drop a cached key; must be called whenever its credentials_keys document is deleted.
+    """
+    key_cache.invalidate(user_id)
+
+
+@lru_cache(maxsize=4)
+def _load_master_keys(master_key: str) -> MultiFernet:
+    # The first key encrypts; the others are accepted for decryption to allow rotation
+    return MultiFernet([Fernet(key.strip().encode()) for key in master_key.split(",")])
+
+
+def _master_fernet() -> MultiFernet:
+    if not settings.MASTER_KEY:
+        raise ValueError("MASTER_KEY is not configured")
+    return _load_master_keys(settings.MASTER_KEY)
 
 
 class PasswordEncryptor:
@@ -21,14 +61,125 @@ class PasswordEncryptor:
             raise ValueError(f"Key not found for user_id: {user_id}")
         return base64.urlsafe_b64decode(key_doc["key"])
 
+    async def _get_fernet(self, user_id: str) -> Fernet:
+        fernet = key_cache.get(user_id)
+        if fernet is None:
+            fernet = Fernet(await self.get_key(user_id))
+            key_cache.set(user_id, fernet)
+        return fernet
+
+    def _envelope_encrypt(self, password: str) -> str:
+        data_key = Fernet.generate_key()
+        wrapped_key = _master_fernet().encrypt(data_key).decode()
+        ciphertext = Fernet(data_key).encrypt(password.encode()).decode()
+        return f"{ENVELOPE_PREFIX}{wrapped_key}${ciphertext}"
+
+    def _envelope_decrypt(self, token: str) -> str:
+        wrapped_key, ciphertext = token[len(ENVELOPE_PREFIX):].split("$", 1)
+        data_key = _master_fernet().decrypt(wrapped_key.encode())
+        return Fernet(data_key).decrypt(ciphertext.encode()).decode()
+
     async def encrypt(self, password: str, user_id: str = None) -> str:
+        if settings.ENCRYPTION_MODE == "envelope":
+            return self._envelope_encrypt(password)
         if not user_id:
             user_id = str(uuid.uuid4())
         key = await self.generate_key(user_id)
         fernet = Fernet(key)
+        key_cache.set(user_id, fernet)
         return fernet.encrypt(password.encode()).decode()
 
+    async def encrypt_many(self, items: List[Tuple[str, str]]) -> List[str]:
+        """
+        Encrypt (password, user_id) pairs, writing all per-record keys with a single insert_many.
+        """
+        if settings.ENCRYPTION_MODE == "envelope":
+            return [self._envelope_encrypt(password) for password, _ in items]
+        keys = [Fernet.generate_key() for _ in items]
+        if keys:
+            await self.keys_collection.insert_many(
+                [{"user_id": user_id, "key": base64.urlsafe_b64encode(key).decode()} for (_, user_id), key in zip(items, keys)],
+                ordered=False,
+            )
+        tokens = []
+        for (password, user_id), key in zip(items, keys):
+            fernet = Fernet(key)
+            key_cache.set(user_id, fernet)
+            tokens.append(fernet.encrypt(password.encode()).decode())
+        return tokens
+
     async def decrypt(self, encrypted_password: str, user_id: str) -> str:
-        key = await self.get_key(user_id)
-        fernet = Fernet(key)
-        return fernet.decrypt(encrypted_password.encode()).decode()
\ No newline at end of file
+        with span("credentials.decrypt"), timed(DECRYPT_SECONDS):
+            if encrypted_password.startswith(ENVELOPE_PREFIX):
+                return self._envelope_decrypt(encrypted_password)
+            fernet = await self._get_fernet(user_id)
+            return fernet.decrypt(encrypted_password.encode()).decode()
+
+    async def migrate_to_envelope(self, collection: str, id_field: str, batch_size: int = 500) -> Dict[str, Set[str]]:
+        """
+        Re-encrypt every per-record token in collection under the master key.
+        Returns the ids that were migrated and the ids that failed; per-record keys are left
+        in place so callers can remove them once every collection sharing them is migrated.
+        """
+        migrated: Set[str] = set()
+        failed: Set[str] = set()
+        updates: List[UpdateOne] = []
+        cursor = self.db[collection].find(
+            {"encrypted_password": {"$not": re.compile("^" + re.escape(ENVELOPE_PREFIX))}},
+            {"_id": 1, id_field: 1, "encrypted_password": 1},
+        )
+        async for doc in cursor:
+            record_id = doc[id_field]
+            try:
+                password = await self.decrypt(doc["encrypted_password"], record_id)
+            except Exception as e:
+                logger.error(f"Cannot migrate {collection} record {record_id}: {e}")
+                failed.add(record_id)
+                continue
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"encrypted_password": self._envelope_encrypt(password)}}))
+            migrated.add(record_id)
+            if len(updates) >= batch_size:
+                await self.db[collection].bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            await self.db[collection].bulk_write(updates, ordered=False)
+        logger.info(f"Migrated {len(migrated)} {collection} records to envelope encryption ({len(failed)} failed)")
+        return {"migrated": migrated, "failed": failed}
+
+    async def migrate_all_to_envelope(self) -> int:
+        """
+        Migrate every collection holding encrypted passwords, then delete the per-record keys
+        no longer referenced by any legacy token. Returns the number of keys removed.
+        """
+        migrated: Set[str] = set()
+        failed: Set[str] = set()
+        for collection, id_field in ENCRYPTED_COLLECTIONS:
+            result = await self.migrate_to_envelope(collection, id_field)
+            migrated |= result["migrated"]
+            failed |= result["failed"]
+        obsolete = list(migrated - failed)
+        if not obsolete:
+            return 0
+        delete_result = await self.keys_collection.delete_many({"user_id": {"$in": obsolete}})
+        for user_id in obsolete:
+            invalidate_key(user_id)
+        return delete_result.deleted_count
+
+
+async def _main() -> int:
+    from src.dependencies import close_mongo_connection, connect_to_mongo, get_db
+
+    if settings.ENCRYPTION_MODE != "envelope" or not settings.MASTER_KEY:
+        print("Set ENCRYPTION_MODE=envelope and MASTER_KEY before migrating", file=sys.stderr)
+        return 1
+    connect_to_mongo()
+    try:
+        removed = await PasswordEncryptor(get_db()).migrate_all_to_envelope()
+    finally:
+        close_mongo_connection()
+    print(f"Migration complete; removed {removed} per-record keys")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
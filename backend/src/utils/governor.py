@@ -0,0 +1,356 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.settings import settings
+from src.utils.logging import logger
+from src.utils.metrics import SSH_CIRCUITS_OPEN, SSH_FAST_FAILURES
+from src.utils.networks import network_cidr_for
+
+
+class DeviceUnavailableError(Exception):
+    """
+    Raised without touching the network while a device's circuit breaker is open.
+    retry_in is the number of seconds until the breaker lets a trial call through.
+    """
+    def __init__(self, message: str, retry_in: float):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class SSHAuthenticationError(Exception):
+    """
+    The device answered but rejected the credentials. It is reachable, so this does not count
+    against its circuit breaker.
+    """
+
+
+class SSHConnectError(Exception):
+    """
+    The device could not be reached: connection refused, no route, or no SSH banner within
+    the connect timeout. The only kind of failure that counts against its circuit breaker.
+    """
+
+
+class SSHTimeoutError(TimeoutError):
+    """
+    An SSH call ran out of its overall time budget (a bulk device_timeout or a poll's deadline).
+    Raised only once the call has actually stopped, so the session and its thread are free again.
+    """
+
+
+class TokenBucket:
+    """
+    rate tokens per second, holding at most burst; acquire() waits for a token.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failures and fails fast for cooldown seconds. Then one
+    trial call is let through (half open): success closes the breaker, failure reopens it.
+    """
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.retry_at = 0.0
+        self._trial = False
+
+    def is_open(self) -> bool:
+        return (self.state == "open" and time.monotonic() < self.retry_at) or (self.state == "half_open" and self._trial)
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() >= self.retry_at:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self) -> bool:
+        """
+        Returns True if this closed the breaker.
+        """
+        changed = self.state != "closed"
+        self.state, self.failures, self.last_error, self._trial = "closed", 0, None, False
+        return changed
+
+    def record_failure(self, error: str) -> bool:
+        """
+        Returns True if this opened the breaker.
+        """
+        self.failures += 1
+        self.last_error = error
+        self._trial = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.open(self.cooldown)
+            return True
+        return False
+
+    def open(self, cooldown: float):
+        self.state = "open"
+        self.retry_at = time.monotonic() + cooldown
+
+    def release_trial(self):
+        # The trial call was cancelled before it said anything about the device
+        self._trial = False
+
+    def health(self) -> Dict[str, Any]:
+        retry_in = max(0.0, self.retry_at - time.monotonic())
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "retry_at": datetime.utcnow() + timedelta(seconds=retry_in) if self.state != "closed" else None,
+            "updated_at": datetime.utcnow(),
+        }
+
+
+# Seconds between sweeps of the per-device and per-subnet limits nobody has used for a while
+SWEEP_INTERVAL = 60.0
+
+
+class _Limits:
+    __slots__ = ("semaphore", "bucket", "users", "last_used")
+
+    def __init__(self, concurrency: int, rate: float, burst: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.users = 0
+        self.last_used = time.monotonic()
+
+    def idle(self, now: float) -> bool:
+        # burst / rate seconds after its last use the bucket is full again and behaves exactly like a new one
+        if self.users:
+            return False
+        return self.bucket is None or now - self.last_used >= self.bucket.burst / self.bucket.rate
+
+
+class SSHGovernor:
+    """
+    Admission control in front of every SSH session. Per device (host) and per /24
+    (network_cidr_for), it caps concurrent sessions and the rate at which sessions start, so
+    no fleet run floods one management plane or one WAN link. Per device, it keeps a
+    circuit breaker that fails calls to an unreachable host at once instead of letting each
+    wait out the connect timeout. Only SSHConnectError counts as a failure: a host that
+    rejects the credentials or is slow to answer a command did answer.
+
+    Breaker transitions are written to the device documents (health) when a database is
+    attached, which shows them in listings and lets other processes seed their own breakers
+    from resolved targets. generation counts transitions once they are stored, for caches of
+    device listings.
+    """
+    def __init__(
+        self,
+        enabled: bool,
+        device_concurrency: int,
+        subnet_concurrency: int,
+        device_rate: float,
+        device_burst: int,
+        subnet_rate: float,
+        subnet_burst: int,
+        failure_threshold: int,
+        cooldown: float,
+    ):
+        self.enabled = enabled
+        self.device_concurrency = device_concurrency
+        self.subnet_concurrency = subnet_concurrency
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.subnet_rate = subnet_rate
+        self.subnet_burst = subnet_burst
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._devices: Dict[str, _Limits] = {}
+        self._subnets: Dict[str, _Limits] = {}
+        # Only hosts with recent failures have a breaker; a closed one with no failures is dropped
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._writes: set = set()
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+        self.generation = 0
+        self.fast_failures = 0
+
+    async def attach(self, db: AsyncIOMotorDatabase):
+        """
+        Persist breaker transitions to db from now on, and start with the breakers other
+        processes left open.
+        """
+        self._db = db
+        async for device in db["Devices"].find({"health.state": "open", "health.retry_at": {"$gt": datetime.utcnow()}}, {"_id": 0, "ip": 1, "health": 1}):
+            self.seed(device)
+
+    def seed(self, device: Dict[str, Any]):
+        """
+        Open the breaker of device["ip"] if its stored health says another process opened it
+        and the cool-down has not passed.
+        """
+        health = device.get("health")
+        if not self.enabled or not health or health.get("state") != "open" or not health.get("retry_at"):
+            return
+        remaining = (health["retry_at"] - datetime.utcnow()).total_seconds()
+        breaker = self._breakers.get(device["ip"])
+        if remaining <= 0 or (breaker is not None and breaker.state != "closed"):
+            return
+        breaker = self._breakers.setdefault(device["ip"], CircuitBreaker(self.failure_threshold, self.cooldown))
+        breaker.failures, breaker.last_error = health.get("failures", 0), health.get("last_error")
+        breaker.open(remaining)
+
+    def _limits(self, table: Dict[str, _Limits], key: str, concurrency: int, rate: float, burst: int) -> _Limits:
+        limits = table.get(key)
+        if limits is None:
+            limits = table[key] = _Limits(concurrency, rate, burst)
+        return limits
+
+    def _fast_fail(self, host: str, breaker: CircuitBreaker):
+        self.fast_failures += 1
+        SSH_FAST_FAILURES.inc()
+        retry_in = max(0.0, breaker.retry_at - time.monotonic())
+        raise DeviceUnavailableError(f"Device {host} is unreachable ({breaker.last_error}); retrying in {retry_in:.0f}s", retry_in)
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        """
+        Hold one session slot for host for the duration of the block. Raises
+        DeviceUnavailableError at once while the host's breaker is open.
+        """
+        if not self.enabled:
+            yield
+            return
+        breaker = self._breakers.get(host)
+        if breaker is not None and breaker.is_open():
+            self._fast_fail(host, breaker)
+        cidr = network_cidr_for(host)
+        device = self._limits(self._devices, host, self.device_concurrency, self.device_rate, self.device_burst)
+        subnet = self._limits(self._subnets, cidr, self.subnet_concurrency, self.subnet_rate, self.subnet_burst)
+        device.users += 1
+        subnet.users += 1
+        try:
+            async with device.semaphore, subnet.semaphore:
+                # The breaker may have opened while this call was queued behind others to the same host
+                breaker = self._breakers.get(host)
+                if breaker is not None and not breaker.allow():
+                    self._fast_fail(host, breaker)
+                if device.bucket:
+                    await device.bucket.acquire()
+                if subnet.bucket:
+                    await subnet.bucket.acquire()
+                try:
+                    yield
+                except SSHConnectError as e:
+                    self._record(host, str(e))
+                    raise
+                except Exception:
+                    # Authentication failures, command and prompt timeouts: the device is reachable
+                    self._record(host, None)
+                    raise
+                except BaseException:
+                    if breaker is not None:
+                        breaker.release_trial()
+                    raise
+                else:
+                    self._record(host, None)
+        finally:
+            now = time.monotonic()
+            device.users -= 1
+            subnet.users -= 1
+            device.last_used = subnet.last_used = now
+            if device.idle(now):
+                del self._devices[host]
+            if subnet.idle(now):
+                del self._subnets[cidr]
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+    def _sweep(self, now: float):
+        for table in (self._devices, self._subnets):
+            for key in [key for key, limits in table.items() if limits.idle(now)]:
+                del table[key]
+        self._next_sweep = now + SWEEP_INTERVAL
+
+    def _record(self, host: str, error: Optional[str]):
+        breaker = self._breakers.get(host)
+        if error is None:
+            if breaker is None:
+                return
+            changed = breaker.record_success()
+            del self._breakers[host]
+            if changed:
+                logger.info(f"Circuit for {host} closed")
+        else:
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            changed = breaker.record_failure(error)
+            if changed:
+                logger.warning(f"Circuit for {host} opened for {self.cooldown}s after {breaker.failures} failures: {error}")
+        if changed:
+            self._persist(host, breaker.health())
+
+    def _persist(self, host: str, health: Dict[str, Any]):
+        if self._db is None:
+            self.generation += 1
+            return
+        task = asyncio.create_task(self._write(host, health))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, host: str, health: Dict[str, Any]):
+        try:
+            await self._db["Devices"].update_many({"ip": host}, {"$set": {"health": health}})
+        except Exception as e:
+            logger.error(f"Could not store health of {host}: {e}")
+        # Only now: a listing rebuilt at the new generation before the write landed would cache the old health
+        self.generation += 1
+
+    def open_circuits(self) -> int:
+        return sum(1 for breaker in self._breakers.values() if breaker.state != "closed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tracked_devices": len(self._devices),
+            "tracked_subnets": len(self._subnets),
+            "failing_devices": len(self._breakers),
+            "open_circuits": self.open_circuits(),
+            "fast_failures": self.fast_failures,
+            "generation": self.generation,
+        }
+
+
+ssh_governor = SSHGovernor(
+    enabled=settings.GOVERNOR_ENABLED,
+    device_concurrency=settings.GOVERNOR_DEVICE_CONCURRENCY,
+    subnet_concurrency=settings.GOVERNOR_SUBNET_CONCURRENCY,
+    device_rate=settings.GOVERNOR_DEVICE_RATE,
+    device_burst=settings.GOVERNOR_DEVICE_BURST,
+    subnet_rate=settings.GOVERNOR_SUBNET_RATE,
+    subnet_burst=settings.GOVERNOR_SUBNET_BURST,
+    failure_threshold=settings.GOVERNOR_FAILURE_THRESHOLD,
+    cooldown=settings.GOVERNOR_COOLDOWN,
+)
+SSH_CIRCUITS_OPEN.set_function(ssh_governor.open_circuits)
@@ -0,0 +1,192 @@
+import asyncio
+import gzip
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from src.settings import settings
+from src.utils.logging import logger
+from src.utils.pagination import decode_cursor, split_page
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+BLOBS_COLLECTION = "OutputBlobs"
+HISTORY_COLLECTION = "OutputHistory"
+
+HISTORY_PROJECTION = {"_id": 0, "command": 1, "hash": 1, "size": 1, "executed_at": 1}
+
+# How long a blob stays marked as orphaned before it may be deleted. A run that decided to
+# reuse it just before the mark has this long to write the history entry that references it.
+BLOB_GRACE = timedelta(minutes=10)
+
+
+def content_hash(output: str) -> str:
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+
+def compress(output: str) -> Tuple[str, bytes]:
+    """
+    Compress output with the configured codec; returns (codec, data).
+    """
+    data = output.encode("utf-8")
+    if settings.HISTORY_CODEC == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=settings.HISTORY_COMPRESSION_LEVEL).compress(data)
+    return "gzip", gzip.compress(data, compresslevel=min(settings.HISTORY_COMPRESSION_LEVEL, 9))
+
+
+def decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Output was stored with zstd but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return gzip.decompress(data).decode("utf-8")
+
+
+class OutputHistoryStore:
+    """
+    Command outputs kept per (device, command, executed_at).
+
+    Output text is stored once per content hash in OutputBlobs, compressed; each run only adds
+    a small OutputHistory row referencing the hash, so re-running a command whose output did
+    not change costs one tiny insert.
+
+    Blobs are garbage collected by mark and sweep: deleting a device marks the blobs nothing
+    else refers to, a run that reuses a blob clears its mark, and only blobs still marked and
+    unreferenced after BLOB_GRACE are removed.
+    """
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.blobs = db[BLOBS_COLLECTION]
+        self.history = db[HISTORY_COLLECTION]
+
+    async def record(self, device: Dict[str, Any], outputs: Dict[str, str], executed_at: Optional[datetime] = None) -> Dict[str, str]:
+        """
+        Store the outputs of one run on device. Returns the content hash per command.
+        """
+        if not outputs:
+            return {}
+        executed_at = executed_at or datetime.utcnow()
+        hashes = {command: content_hash(output) for command, output in outputs.items()}
+        # Claim blobs a device deletion has marked for collection before deciding to reuse them
+        await self.blobs.update_many(
+            {"hash": {"$in": list(set(hashes.values()))}, "orphaned_at": {"$exists": True}}, {"$unset": {"orphaned_at": ""}}
+        )
+        existing = {
+            blob["hash"]
+            async for blob in self.blobs.find({"hash": {"$in": list(set(hashes.values()))}}, {"_id": 0, "hash": 1})
+        }
+        new_blobs: Dict[str, str] = {digest: outputs[command] for command, digest in hashes.items() if digest not in existing}
+        if new_blobs:
+            # Compression is CPU-bound, so keep it off the event loop (and out of the SSH thread pool)
+            compressed = await asyncio.to_thread(lambda: {digest: compress(output) for digest, output in new_blobs.items()})
+            # Upserts make a concurrent writer of the same content harmless
+            await self.blobs.bulk_write(
+                [
+                    UpdateOne(
+                        {"hash": digest},
+                        {"$setOnInsert": {"hash": digest, "codec": codec, "data": data, "size": len(new_blobs[digest]), "created_at": executed_at}},
+                        upsert=True,
+                    )
+                    for digest, (codec, data) in compressed.items()
+                ],
+                ordered=False,
+            )
+        await self.history.insert_many(
+            [
+                {
+                    "device_id": device["device_id"],
+                    "device": device["name"],
+                    "command": command,
+                    "hash": digest,
+                    "size": len(outputs[command]),
+                    "executed_at": executed_at,
+                }
+                for command, digest in hashes.items()
+            ],
+            ordered=False,
+        )
+        logger.debug(f"Recorded {len(hashes)} outputs for {device['name']} ({len(new_blobs)} new blobs)")
+        return hashes
+
+    async def load(self, digest: str) -> Optional[str]:
+        """
+        Return a stored output, or None if its blob is gone (e.g. collected with a deleted device).
+        """
+        blob = await self.blobs.find_one({"hash": digest}, {"_id": 0, "codec": 1, "data": 1})
+        if not blob:
+            return None
+        return decompress(blob["codec"], blob["data"])
+
+    async def latest(self, device_id: str, command: str, newer_than: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the most recent history entry for command on device, with its output.
+        """
+        query: Dict[str, Any] = {"device_id": device_id, "command": command}
+        if newer_than:
+            query["executed_at"] = {"$gte": newer_than}
+        entry = await self.history.find_one(query, HISTORY_PROJECTION, sort=[("executed_at", -1)])
+        if not entry:
+            return None
+        entry["output"] = await self.load(entry["hash"])
+        return entry if entry["output"] is not None else None
+
+    async def entries(
+        self, device_id: str, command: Optional[str] = None, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return one page of history entries (without output), newest first, and the next cursor.
+        One run records every command with the same executed_at, so pages are keyed on _id.
+        """
+        query: Dict[str, Any] = {"device_id": device_id}
+        if command:
+            query["command"] = command
+        if cursor:
+            try:
+                query["_id"] = {"$lt": ObjectId(decode_cursor(cursor))}
+            except InvalidId as e:
+                raise ValueError("Invalid cursor") from e
+        docs = await self.history.find(query, {**HISTORY_PROJECTION, "_id": 1}).sort("_id", -1).limit(limit + 1).to_list(None)
+        page, next_cursor = split_page(docs, limit, "_id")
+        for doc in page:
+            del doc["_id"]
+        return page, next_cursor
+
+    async def delete_device(self, device_id: str) -> int:
+        """
+        Remove the history of a deleted device and mark the blobs no other entry refers to,
+        then sweep blobs marked earlier. Returns the number of history entries removed.
+        """
+        hashes = await self.history.distinct("hash", {"device_id": device_id})
+        deleted = await self.history.delete_many({"device_id": device_id})
+        now = datetime.utcnow()
+        if hashes:
+            shared = set(await self.history.distinct("hash", {"hash": {"$in": hashes}}))
+            await self.blobs.update_many(
+                {"hash": {"$in": [digest for digest in hashes if digest not in shared]}}, {"$set": {"orphaned_at": now}}
+            )
+        await self.sweep(now - BLOB_GRACE)
+        return deleted.deleted_count
+
+    async def sweep(self, marked_before: datetime) -> int:
+        """
+        Delete blobs marked as orphaned before marked_before that are still unreferenced.
+        Returns the number of blobs removed.
+        """
+        marked = {"orphaned_at": {"$lte": marked_before}}
+        candidates = await self.blobs.distinct("hash", marked)
+        if not candidates:
+            return 0
+        referenced = set(await self.history.distinct("hash", {"hash": {"$in": candidates}}))
+        if referenced:
+            await self.blobs.update_many({"hash": {"$in": list(referenced)}, **marked}, {"$unset": {"orphaned_at": ""}})
+        # Still conditional on the mark: a run that claimed the blob since has cleared it
+        result = await self.blobs.delete_many({"hash": {"$in": [digest for digest in candidates if digest not in referenced]}, **marked})
+        if result.deleted_count:
+            logger.info(f"Removed {result.deleted_count} unreferenced output blobs")
+        return result.deleted_count
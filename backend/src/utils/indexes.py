@@ -0,0 +1,194 @@
+import asyncio
+import sys
+from typing import Any, Dict, List, Set, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from src.utils.logging import logger
+
+# Indexes backing every lookup the routers and utilities run by key.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "Devices": [
+        IndexModel([("device_id", ASCENDING)], name="device_id_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        IndexModel([("ip", ASCENDING)], name="ip"),
+        IndexModel([("identified_type", ASCENDING)], name="identified_type"),
+    ],
+    "Credentials": [
+        IndexModel([("device_id", ASCENDING)], name="device_id_unique", unique=True),
+    ],
+    "credentials": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username"),
+    ],
+    "credentials_keys": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "Jobs": [
+        IndexModel([("job_id", ASCENDING)], name="job_id_unique", unique=True),
+        IndexModel([("batch_id", ASCENDING)], name="batch_id"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)], name="status_available_at"),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease_expires_at"),
+    ],
+    "Workers": [
+        IndexModel([("node_id", ASCENDING)], name="node_id_unique", unique=True),
+        # Nodes that died without deregistering disappear after a day
+        IndexModel([("heartbeat_at", ASCENDING)], name="heartbeat_at_ttl", expireAfterSeconds=86400),
+    ],
+    "OutputBlobs": [
+        IndexModel([("hash", ASCENDING)], name="hash_unique", unique=True),
+        # Only blobs marked for collection carry orphaned_at, so the sweep reads a tiny index
+        IndexModel([("orphaned_at", ASCENDING)], name="orphaned_at", sparse=True),
+    ],
+    "OutputHistory": [
+        IndexModel([("device_id", ASCENDING), ("command", ASCENDING), ("executed_at", DESCENDING)], name="device_command_executed_at"),
+        IndexModel([("device_id", ASCENDING), ("command", ASCENDING), ("_id", DESCENDING)], name="device_command_id"),
+        IndexModel([("device_id", ASCENDING), ("_id", DESCENDING)], name="device_id"),
+        # Finds the blobs still referenced when a device's history is deleted
+        IndexModel([("hash", ASCENDING)], name="hash"),
+    ],
+    "Schedules": [
+        IndexModel([("schedule_id", ASCENDING)], name="schedule_id_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name_unique", unique=True),
+        IndexModel([("enabled", ASCENDING), ("next_run_at", ASCENDING)], name="enabled_next_run_at"),
+    ],
+    "ConfigSnapshots": [
+        IndexModel([("device_id", ASCENDING)], name="device_id_unique", unique=True),
+    ],
+    "ConfigDeltas": [
+        IndexModel([("device_id", ASCENDING), ("version", DESCENDING)], name="device_version_unique", unique=True),
+        IndexModel([("captured_at", DESCENDING)], name="captured_at"),
+    ],
+}
+
+# Hot point queries that must never fall back to a collection scan: (collection, filter).
+HOT_QUERIES: List[Tuple[str, Dict[str, Any]]] = [
+    ("Devices", {"name": "__explain__"}),
+    ("Devices", {"device_id": "__explain__"}),
+    ("Devices", {"identified_type": "__explain__"}),
+    ("Credentials", {"device_id": "__explain__"}),
+    ("credentials", {"username": "__explain__"}),
+    ("credentials", {"user_id": "__explain__"}),
+    ("credentials_keys", {"user_id": "__explain__"}),
+    ("users", {"username": "__explain__"}),
+    ("Jobs", {"job_id": "__explain__"}),
+    ("OutputBlobs", {"hash": "__explain__"}),
+    ("OutputHistory", {"device_id": "__explain__", "command": "__explain__"}),
+    ("Schedules", {"schedule_id": "__explain__"}),
+    ("ConfigSnapshots", {"device_id": "__explain__"}),
+    ("ConfigDeltas", {"device_id": "__explain__"}),
+]
+
+
+# Duplicate keys quoted in the warning when a unique index cannot be built
+DUPLICATES_SHOWN = 5
+
+
+async def _ensure_unique(db: AsyncIOMotorDatabase, collection: str, model: IndexModel, existing: Dict[str, Any]) -> bool:
+    """
+    Build a missing unique index unless the collection already holds duplicate keys. Then a
+    plain index on the same keys stands in for it (so lookups stay indexed and the service
+    still starts) until a start after the duplicates have been resolved.
+    Returns False if the unique index was not built.
+    """
+    name = model.document["name"]
+    keys = list(model.document["key"].items())
+    stand_in = f"{name}_pending"
+    duplicates = await db[collection].aggregate([
+        {"$group": {"_id": {field: f"${field}" for field, _ in keys}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": DUPLICATES_SHOWN},
+    ]).to_list(DUPLICATES_SHOWN)
+    if duplicates:
+        shown = ", ".join(f"{duplicate['_id']} x{duplicate['count']}" for duplicate in duplicates)
+        logger.warning(
+            f"Unique index {collection}.{name} not created, duplicate keys exist: {shown}. "
+            f"Uniqueness is not enforced until they are resolved and the service restarted"
+        )
+        await db[collection].create_indexes([IndexModel(keys, name=stand_in)])
+        return False
+    if stand_in in existing:
+        # Same keys as the unique index, which MongoDB refuses to build next to it
+        await db[collection].drop_index(stand_in)
+    await db[collection].create_indexes([model])
+    return True
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """
+    Create any missing indexes, then check that every declared index exists.
+    A unique index that existing duplicates prevent is skipped with a warning (see
+    _ensure_unique). Raises RuntimeError if any other index could not be built.
+    """
+    skipped = set()
+    for collection, models in INDEXES.items():
+        try:
+            existing = await db[collection].index_information()
+            pending = [model for model in models if model.document.get("unique") and model.document["name"] not in existing]
+            ready = [model for model in models if model not in pending]
+            if ready:
+                await db[collection].create_indexes(ready)
+            for model in pending:
+                if not await _ensure_unique(db, collection, model, existing):
+                    skipped.add(f"{collection}.{model.document['name']}")
+        except Exception as e:
+            logger.error(f"Failed to create indexes on {collection}: {e}")
+            raise RuntimeError(f"Failed to create indexes on {collection}: {e}") from e
+    missing = []
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        names = [f"{collection}.{model.document['name']}" for model in models if model.document["name"] not in existing]
+        missing.extend(name for name in names if name not in skipped)
+    if missing:
+        raise RuntimeError(f"Missing indexes after bootstrap: {', '.join(missing)}")
+    logger.info(f"Indexes verified on {len(INDEXES)} collections")
+
+
+def _plan_stages(plan: Dict[str, Any]) -> Set[str]:
+    stages = {plan.get("stage", "")}
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages |= _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages |= _plan_stages(child)
+    return stages
+
+
+async def verify_query_plans(db: AsyncIOMotorDatabase):
+    """
+    Explain each hot query and raise RuntimeError if any winning plan contains a COLLSCAN.
+    """
+    collscans = []
+    for collection, query in HOT_QUERIES:
+        explain = await db[collection].find(query).explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        if "COLLSCAN" in stages:
+            collscans.append(f"{collection} {query}")
+    if collscans:
+        for entry in collscans:
+            logger.error(f"Query plan uses COLLSCAN: {entry}")
+        raise RuntimeError(f"Hot queries fall back to COLLSCAN: {'; '.join(collscans)}")
+    logger.info(f"Query plans verified for {len(HOT_QUERIES)} hot queries")
+
+
+async def _main() -> int:
+    from src.dependencies import close_mongo_connection, connect_to_mongo, get_db
+
+    connect_to_mongo()
+    try:
+        await ensure_indexes(get_db())
+        await verify_query_plans(get_db())
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        close_mongo_connection()
+    print("Indexes and query plans OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,440 @@
+import asyncio
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from src.settings import settings
+from src.utils.device_identifier import identify_device_via_ssh
+from src.utils.drift import capture_config
+from src.utils.encryptor import PasswordEncryptor
+from src.utils.governor import DeviceUnavailableError, ssh_governor
+from src.utils.history import OutputHistoryStore
+from src.utils.logging import logger
+from src.utils.metrics import JOBS_RUNNING, span
+from src.utils.read_cache import read_cache
+from src.utils.ssh import ssh_execute_raw
+
+JOBS_COLLECTION = "Jobs"
+WORKERS_COLLECTION = "Workers"
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+WAIT_PROJECTION = {"_id": 0, "job_id": 1, "status": 1, "result": 1, "error": 1, "retry_at": 1}
+
+JobHandler = Callable[[AsyncIOMotorDatabase, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _new_job(job_type: str, payload: Dict[str, Any], batch_id: Optional[str] = None, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "job_id": str(uuid.uuid4()),
+        "type": job_type,
+        "payload": payload,
+        "batch_id": batch_id,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "error": None,
+        "result": None,
+        "available_at": now,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def _identify_device(db: AsyncIOMotorDatabase, payload: Dict[str, Any]) -> Dict[str, Any]:
+    device = await db["Devices"].find_one({"device_id": payload["device_id"]})
+    if not device:
+        raise ValueError(f"Device {payload['device_id']} no longer exists")
+    ssh_governor.seed(device)
+    encryptor = PasswordEncryptor(db)
+    password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+    device_info = await identify_device_via_ssh(device["ip"], device["username"], password, payload.get("refresh", False))
+    await db["Devices"].update_one(
+        {"device_id": device["device_id"]},
+        {"$set": {"identified_type": device_info["type"], "model": device_info["model"], "version": device_info["version"]}},
+    )
+    read_cache.bump("devices")
+    logger.info(f"Identified device {device['name']} as {device_info['type']}")
+    return device_info
+
+
+async def _identify_device_failed(db: AsyncIOMotorDatabase, payload: Dict[str, Any]):
+    # Only clear the placeholder; a re-identify that fails keeps the last known identity
+    await db["Devices"].update_one(
+        {"device_id": payload["device_id"], "identified_type": "pending"},
+        {"$set": {"identified_type": "unknown", "model": "unknown", "version": "unknown"}},
+    )
+    read_cache.bump("devices")
+
+
+async def _execute_commands(db: AsyncIOMotorDatabase, payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Outputs travel through the history store rather than the job document, which keeps jobs
+    # small and reuses the blob dedup; the result only carries their hashes.
+    device = await db["Devices"].find_one({"device_id": payload["device_id"]})
+    if not device:
+        raise ValueError(f"Device {payload['device_id']} no longer exists")
+    ssh_governor.seed(device)
+    encryptor = PasswordEncryptor(db)
+    password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+    outputs = await ssh_execute_raw(
+        device["ip"], device["username"], password, payload["commands"], payload.get("mode", "exec"), device.get("identified_type"), payload.get("timeout")
+    )
+    if not settings.HISTORY_ENABLED:
+        # Nowhere to put the outputs but the job itself
+        return {"outputs": None, "raw_outputs": outputs}
+    hashes = await OutputHistoryStore(db).record(device, outputs)
+    return {"outputs": hashes}
+
+
+async def run_commands_on_worker(
+    db: AsyncIOMotorDatabase, device: Dict[str, Any], commands: List[str], mode: str, timeout: Optional[float] = None
+) -> Dict[str, str]:
+    """
+    The CommandRunner for API nodes without embedded workers: run commands as an "execute"
+    job on a worker node, wait for it and return the raw outputs. The worker enforces timeout
+    on the SSH call; a job still queued when the caller gives up is cancelled.
+    """
+    payload = {"device_id": device["device_id"], "commands": commands, "mode": mode, "timeout": timeout}
+    with span("job.execute", device=device["name"]):
+        job = await job_runner.enqueue(db, "execute", payload, max_attempts=1)
+        try:
+            job = await job_runner.wait(db, job["job_id"], timeout or settings.BULK_DEVICE_TIMEOUT)
+        except (TimeoutError, asyncio.CancelledError):
+            # The caller gave up (own timeout or a bulk device timeout); keep a worker from running it later
+            if not await job_runner.cancel(db, job["job_id"]):
+                logger.warning(f"Execute job {job['job_id']} on {device['name']} outlived its caller and is already running")
+            raise
+    if job["status"] != "succeeded":
+        if job.get("retry_at") is not None:
+            # The device's breaker was open on the worker; surface it as a local call would
+            raise DeviceUnavailableError(job["error"], max(0.0, (job["retry_at"] - datetime.utcnow()).total_seconds()))
+        raise Exception(job["error"])
+    if job["result"].get("raw_outputs") is not None:
+        return job["result"]["raw_outputs"]
+    store = OutputHistoryStore(db)
+    outputs = {command: await store.load(digest) for command, digest in job["result"]["outputs"].items()}
+    lost = [command for command, output in outputs.items() if output is None]
+    if lost:
+        # The device was deleted, and its blobs collected, between the worker's run and this read
+        raise Exception(f"Output of {', '.join(lost)} on {device['name']} is no longer stored")
+    return outputs
+
+
+class JobRunner:
+    """
+    Runs jobs from the Jobs collection, which acts as a queue shared by every process.
+
+    Each runner polls for work with concurrency workers. A job is claimed with an atomic
+    find_one_and_update that sets a lease (lease_owner, lease_expires_at); while the handler
+    runs the lease is extended every heartbeat_interval. If a node dies its leases expire and
+    the jobs are re-delivered to whichever node polls next. Nodes never own a backlog: idle
+    nodes take whatever is claimable, so work flows to the nodes with free capacity.
+    Failed attempts are retried with exponential backoff and jitter up to max_attempts by
+    making the job available again later.
+
+    Any process can enqueue; only processes that call start() run jobs. With
+    JOB_WORKER_EMBEDDED disabled the API only enqueues, and `python -m src.worker` nodes
+    do the work. Callers waiting on jobs share one poller per process, which checks every
+    pending job with a single query per wait_interval.
+    """
+    def __init__(
+        self,
+        concurrency: int,
+        backoff: float,
+        backoff_max: float,
+        lease: float,
+        heartbeat_interval: float,
+        poll_interval: float,
+        wait_interval: float = 0.2,
+    ):
+        self.concurrency = concurrency
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.wait_interval = wait_interval
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self.failure_handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._waiter: Optional[asyncio.Task] = None
+        self.running = 0
+        self.started_at: Optional[datetime] = None
+
+    def register(self, job_type: str, handler: JobHandler, on_failure: Optional[JobHandler] = None):
+        self.handlers[job_type] = handler
+        if on_failure:
+            self.failure_handlers[job_type] = on_failure
+
+    @property
+    def is_worker(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._wakeup = asyncio.Event()
+        self.started_at = datetime.utcnow()
+        # Jobs written before leases existed: make them claimable
+        await db[JOBS_COLLECTION].update_many({"status": "queued", "available_at": {"$exists": False}}, {"$set": {"available_at": self.started_at}})
+        await db[JOBS_COLLECTION].update_many({"status": "running", "lease_expires_at": {"$exists": False}}, {"$set": {"lease_expires_at": self.started_at}})
+        await self._register_node()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._heartbeat = asyncio.create_task(self._node_heartbeat())
+        logger.info(f"Job worker {self.node_id} started with {self.concurrency} slots for {', '.join(self.handlers)}")
+
+    async def stop(self):
+        tasks = [*self._workers, *([self._heartbeat] if self._heartbeat else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        if self._db is None:
+            return
+        # Hand unfinished jobs back right away instead of waiting for their leases to expire
+        released = await self._db[JOBS_COLLECTION].update_many(
+            {"status": "running", "lease_owner": self.node_id},
+            {"$set": {"status": "queued", "available_at": datetime.utcnow(), "lease_owner": None, "lease_expires_at": None}},
+        )
+        if released.modified_count:
+            logger.info(f"Released {released.modified_count} unfinished jobs")
+        await self._db[WORKERS_COLLECTION].delete_one({"node_id": self.node_id})
+        self._db = None
+
+    async def enqueue(self, db: AsyncIOMotorDatabase, job_type: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> Dict[str, Any]:
+        job = _new_job(job_type, payload, max_attempts=max_attempts)
+        await db[JOBS_COLLECTION].insert_one(job)
+        self._notify()
+        return job
+
+    async def enqueue_batch(
+        self, db: AsyncIOMotorDatabase, job_type: str, payloads: List[Dict[str, Any]], batch_id: Optional[str] = None
+    ) -> str:
+        batch_id = batch_id or str(uuid.uuid4())
+        jobs = [_new_job(job_type, payload, batch_id) for payload in payloads]
+        if jobs:
+            await db[JOBS_COLLECTION].insert_many(jobs, ordered=False)
+            self._notify()
+        return batch_id
+
+    async def wait(self, db: AsyncIOMotorDatabase, job_id: str, timeout: float) -> Dict[str, Any]:
+        """
+        Wait until a job has succeeded, finally failed or been cancelled and return it.
+        Raises TimeoutError if it is still queued or running after timeout seconds.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        if self._waiter is None or self._waiter.done() or self._waiter.get_loop() is not loop:
+            self._waiter = asyncio.create_task(self._poll_waiters(db))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout}s") from None
+        finally:
+            futures = self._waiters.get(job_id)
+            if futures and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self._waiters[job_id]
+
+    async def _poll_waiters(self, db: AsyncIOMotorDatabase):
+        # One query for every job someone in this process is waiting on; exits when nobody waits
+        while self._waiters:
+            try:
+                async for job in db[JOBS_COLLECTION].find({"job_id": {"$in": list(self._waiters)}, "status": {"$in": FINISHED_STATUSES}}, WAIT_PROJECTION):
+                    for future in self._waiters.pop(job.pop("job_id"), []):
+                        if not future.done():
+                            future.set_result(job)
+            except Exception as e:
+                logger.warning(f"Polling waited jobs failed: {e}")
+            await asyncio.sleep(self.wait_interval)
+
+    async def cancel(self, db: AsyncIOMotorDatabase, job_id: str) -> bool:
+        """
+        Cancel a job nobody has claimed yet. Returns False if it is already running or done;
+        a running job is not interrupted.
+        """
+        # Conditional on queued, so a worker claiming it at the same moment wins or loses atomically
+        result = await db[JOBS_COLLECTION].update_one(
+            {"job_id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "error": "Cancelled before it started", "updated_at": datetime.utcnow()}},
+        )
+        return bool(result.modified_count)
+
+    def _notify(self):
+        # Wake this process's idle workers; other nodes find the job on their next poll
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"node_id": self.node_id, "worker": self.is_worker, "slots": self.concurrency if self.is_worker else 0, "running": self.running}
+
+    async def _register_node(self):
+        await self._db[WORKERS_COLLECTION].update_one(
+            {"node_id": self.node_id},
+            {"$set": {
+                "node_id": self.node_id,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "concurrency": self.concurrency,
+                "job_types": list(self.handlers),
+                "started_at": self.started_at,
+                "heartbeat_at": datetime.utcnow(),
+                "running": self.running,
+            }},
+            upsert=True,
+        )
+
+    async def _node_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._register_node()
+            except Exception as e:
+                logger.warning(f"Worker heartbeat failed: {e}")
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self._db[JOBS_COLLECTION].find_one_and_update(
+            {
+                "type": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued", "available_at": {"$lte": now}},
+                    # Lease expired: the node running it died or stalled, so deliver it again
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {"status": "running", "lease_owner": self.node_id, "lease_expires_at": now + timedelta(seconds=self.lease), "updated_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Job worker could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # Jittered so idle nodes do not poll in lockstep
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval * random.uniform(0.5, 1.5))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.running += 1
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Job runner error on {job['job_id']}: {e}")
+            finally:
+                self.running -= 1
+
+    async def _keep_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = datetime.utcnow()
+            try:
+                result = await self._db[JOBS_COLLECTION].update_one(
+                    {"job_id": job_id, "status": "running", "lease_owner": self.node_id},
+                    {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease), "heartbeat_at": now}},
+                )
+            except Exception as e:
+                # Only a missing match means the lease is gone; a failed write is retried next beat
+                logger.warning(f"Could not extend the lease on job {job_id}: {e}")
+                continue
+            if not result.matched_count:
+                logger.warning(f"Lost the lease on job {job_id}; another node may be running it")
+                return
+
+    async def _run(self, job: Dict[str, Any]):
+        db = self._db
+        if job["attempts"] > job["max_attempts"]:
+            # Re-delivered after the lease of its final attempt expired
+            await self._handle_failure(job, RuntimeError("Lease expired on the final attempt"))
+            return
+        handler = self.handlers[job["type"]]
+        heartbeat = asyncio.create_task(self._keep_lease(job["job_id"]))
+        try:
+            result = await handler(db, job["payload"])
+        except Exception as e:
+            await self._handle_failure(job, e)
+            return
+        finally:
+            heartbeat.cancel()
+        done = await db[JOBS_COLLECTION].update_one(
+            {"job_id": job["job_id"], "lease_owner": self.node_id},
+            {"$set": {"status": "succeeded", "result": result, "error": None, "lease_owner": None, "lease_expires_at": None, "updated_at": datetime.utcnow()}},
+        )
+        if not done.matched_count:
+            logger.warning(f"Job {job['job_id']} finished after its lease was taken over; result discarded")
+
+    async def _handle_failure(self, job: Dict[str, Any], error: Exception):
+        db = self._db
+        owned = {"job_id": job["job_id"], "lease_owner": self.node_id}
+        if job["attempts"] < job["max_attempts"]:
+            delay = min(self.backoff * 2 ** (job["attempts"] - 1), self.backoff_max) * random.uniform(0.5, 1.5)
+            if isinstance(error, DeviceUnavailableError):
+                # Retrying before the device's breaker half-opens would only fail fast again
+                delay = max(delay, error.retry_in * random.uniform(1.0, 1.2))
+            logger.warning(f"Job {job['job_id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+            await db[JOBS_COLLECTION].update_one(
+                owned,
+                {"$set": {
+                    "status": "queued",
+                    "error": str(error),
+                    "available_at": datetime.utcnow() + timedelta(seconds=delay),
+                    "lease_owner": None,
+                    "lease_expires_at": None,
+                    "updated_at": datetime.utcnow(),
+                }},
+            )
+            return
+        logger.error(f"Job {job['job_id']} failed after {min(job['attempts'], job['max_attempts'])} attempts: {error}")
+        # Kept so whoever waits on the job can tell a device behind an open breaker from other failures
+        retry_at = datetime.utcnow() + timedelta(seconds=error.retry_in) if isinstance(error, DeviceUnavailableError) else None
+        failed = await db[JOBS_COLLECTION].update_one(
+            owned,
+            {"$set": {
+                "status": "failed",
+                "error": str(error),
+                "retry_at": retry_at,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "updated_at": datetime.utcnow(),
+            }},
+        )
+        on_failure = self.failure_handlers.get(job["type"])
+        if on_failure and failed.matched_count:
+            await on_failure(db, job["payload"])
+
+
+job_runner = JobRunner(
+    concurrency=settings.JOB_CONCURRENCY,
+    backoff=settings.JOB_RETRY_BACKOFF,
+    backoff_max=settings.JOB_RETRY_BACKOFF_MAX,
+    lease=settings.JOB_LEASE_SECONDS,
+    heartbeat_interval=settings.JOB_HEARTBEAT_INTERVAL,
+    poll_interval=settings.JOB_POLL_INTERVAL,
+)
+job_runner.register("identify", _identify_device, on_failure=_identify_device_failed)
+job_runner.register("drift", capture_config)
+job_runner.register("execute", _execute_commands)
+JOBS_RUNNING.set_function(lambda: job_runner.running)
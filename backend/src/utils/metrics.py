@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from src.settings import settings
+
+try:
+    from opentelemetry import trace
+except ImportError:  # optional; without it span() is a no-op
+    trace = None
+
+# Remote work (SSH) takes from milliseconds to minutes; local steps (decrypt, parse) far less
+REMOTE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LOCAL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body chunk is sent", ["method", "route", "status"],
+    buckets=REMOTE_BUCKETS,
+)
+SSH_CONNECT_SECONDS = Histogram(
+    "ssh_connect_duration_seconds", "TCP connect and SSH handshake time of new transports", ["device_type"], buckets=REMOTE_BUCKETS,
+)
+SSH_AUTH_SECONDS = Histogram(
+    "ssh_auth_duration_seconds", "SSH password authentication time of new transports", ["device_type"], buckets=REMOTE_BUCKETS,
+)
+SSH_COMMAND_SECONDS = Histogram(
+    "ssh_command_duration_seconds", "Command time; exec mode per command, shell mode per command batch", ["device_type", "mode"],
+    buckets=REMOTE_BUCKETS,
+)
+SSH_ERRORS = Counter("ssh_errors_total", "Failed SSH executions by error kind", ["device_type", "kind"])
+SSH_FAST_FAILURES = Counter("ssh_fast_failures_total", "SSH calls refused at once because the device's circuit breaker was open")
+SSH_CIRCUITS_OPEN = Gauge("ssh_circuits_open", "Devices whose circuit breaker is open or half open on this node")
+SSH_SESSIONS_IN_FLIGHT = Gauge("ssh_sessions_in_flight", "Pooled SSH sessions currently running commands")
+SSH_POOL_OPEN = Gauge("ssh_pool_open_sessions", "SSH transports open in the pool, idle or in use")
+MONGO_QUERY_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "Mongo command round trip time", ["collection", "command"], buckets=LOCAL_BUCKETS + REMOTE_BUCKETS[7:],
+)
+DECRYPT_SECONDS = Histogram("credential_decrypt_duration_seconds", "Device password decryption time, key lookup included", buckets=LOCAL_BUCKETS)
+PARSE_SECONDS = Histogram("output_parse_duration_seconds", "Command output parsing time per command", ["device_type"], buckets=LOCAL_BUCKETS)
+FINGERPRINTS = Counter(
+    "device_fingerprints_total", "Device identifications by the evidence that decided them (cache, banner, prompt, command)",
+    ["stage", "identified_type"],
+)
+READ_CACHE_REQUESTS = Counter(
+    "read_cache_requests_total", "Cached read endpoint requests by outcome (hit, miss, not_modified)", ["endpoint", "result"],
+)
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Jobs in the shared queue by status (sampled on scrape)", ["status"])
+JOBS_RUNNING = Gauge("jobs_running", "Jobs running on this node")
+SCHEDULER_POLLS_IN_FLIGHT = Gauge("scheduler_polls_in_flight", "Scheduled polls running on this node")
+
+
+def device_label(identified_type: Any) -> str:
+    return identified_type or "unknown"
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """
+    Observe the duration of the block, also when it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+
+_tracer = trace.get_tracer("firewall-manager") if trace is not None else None
+
+
+def span(name: str, **attributes: Any):
+    """
+    Open a trace span around a step when tracing is enabled and OpenTelemetry is installed.
+    Spans nest through contextvars, which run_blocking carries into the SSH threads, so the
+    spans of one execute request (decrypt, connect, auth, command, parse, history) share a trace.
+    """
+    if _tracer is None or not settings.TRACING_ENABLED:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={key: value for key, value in attributes.items() if value is not None})
+
+
+def render() -> bytes:
+    return generate_latest()
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    # Put the parameter names back into the matched path ("/devices/execute/{name}"). Built from
+    # path_params because the route object only knows its path relative to an included router.
+    if "route" not in scope:
+        return "unmatched"
+    names = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    return "/".join(f"{{{names[segment]}}}" if segment in names else segment for segment in scope["path"].split("/"))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template (not per raw path, which would
+    give one series per device name). Timing ends with the last body chunk, so streamed responses
+    count their full duration.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Dict[str, Any]):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        with span(f"{scope['method']} {scope['path']}"):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                REQUEST_SECONDS.labels(method=scope["method"], route=route_template(scope), status=str(status_code)).observe(
+                    time.perf_counter() - start
+                )
+
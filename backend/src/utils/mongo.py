@@ -0,0 +1,106 @@
+import threading
+from typing import Any, Dict, Tuple
+from pymongo import monitoring
+from src.utils.metrics import MONGO_QUERY_SECONDS
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Track connection pool activity of the shared Mongo client for /health.
+    pymongo calls these hooks from its own threads, so counters are guarded by a lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.created = 0
+        self.closed = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting -= 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "created_total": self.created,
+                "closed_total": self.closed,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """
+    Feed Mongo command durations into the mongo_command_duration_seconds histogram.
+    Only the started event names the collection, so it is remembered per request until the
+    matching succeeded/failed event.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else "", event.command_name,
+            )
+
+    def _finish(self, event):
+        with self._lock:
+            labels = self._pending.pop((event.connection_id, event.request_id), None)
+        if labels:
+            MONGO_QUERY_SECONDS.labels(collection=labels[0], command=labels[1]).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
@@ -0,0 +1,27 @@
+import ipaddress
+import re
+from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+def network_cidr_for(ip: str) -> str:
+    """
+    Return the /24 network that a device IP is grouped under.
+    """
+    return str(ipaddress.IPv4Interface(f"{ip}/24").network)
+
+
+async def ips_in_cidr(db: AsyncIOMotorDatabase, cidr: str) -> List[str]:
+    """
+    Return the IPs of the devices in the Devices collection that fall inside the given CIDR.
+    Raises ValueError if the CIDR is malformed.
+    """
+    try:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+    except ValueError as e:
+        raise ValueError(f"Invalid CIDR '{cidr}': {e}")
+    # The whole octets the prefix fixes become an anchored regex, which the ip index serves as a range
+    octets = str(network.network_address).split(".")[:min(network.prefixlen // 8, 3)]
+    query = {"ip": {"$regex": "^" + re.escape(".".join(octets) + ".")}} if octets else {}
+    ips = await db["Devices"].distinct("ip", query)
+    return [ip for ip in ips if ipaddress.IPv4Address(ip) in network]
@@ -0,0 +1,39 @@
+import base64
+import binascii
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def encode_cursor(value: str) -> str:
+    """
+    Turn the sort key of the last returned document into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    """
+    Reverse encode_cursor. Raises ValueError for cursors that were not produced by it.
+    """
+    try:
+        return base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def apply_cursor(query: Dict[str, Any], sort_field: str, cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Add the keyset condition for cursor to query. sort_field must be unique and indexed.
+    """
+    if cursor:
+        query = {**query, sort_field: {"$gt": decode_cursor(cursor)}}
+    return query
+
+
+def split_page(docs: List[Dict[str, Any]], limit: int, sort_field: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Given up to limit + 1 documents, return the page and the cursor for the next one, if any.
+    """
+    if len(docs) <= limit:
+        return docs, None
+    page = docs[:limit]
+    return page, encode_cursor(str(page[-1][sort_field]))
@@ -0,0 +1,277 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.utils.logging import logger
+
+ParserFunc = Callable[[str], Dict[str, Any]]
+
+# (identified_type, normalised command) -> parser. identified_type "*" matches any device.
+_registry: Dict[Tuple[str, str], ParserFunc] = {}
+
+KEY_VALUE_PATTERN = re.compile(r"^[ \t]*([^:\n]*?)[ \t]*:[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+COLUMN_SPLIT_PATTERN = re.compile(r"\s{2,}|\|")
+RULE_LINE_PATTERN = re.compile(r"^[\s\-=+|]+$")
+RULE_SEGMENT_PATTERN = re.compile(r"[-=]+")
+HEADER_SEGMENT_PATTERN = re.compile(r"\S+(?: \S+)*")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalise_command(command: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", command.strip().lower())
+
+
+def register_parser(identified_type: str, *commands: str):
+    """
+    Register the decorated function as the parser for commands on identified_type devices.
+    """
+    def decorator(func: ParserFunc) -> ParserFunc:
+        for command in commands:
+            _registry[(identified_type, normalise_command(command))] = func
+        return func
+    return decorator
+
+
+def get_parser(identified_type: Optional[str], command: str) -> ParserFunc:
+    key = normalise_command(command)
+    return _registry.get((identified_type or "", key)) or _registry.get(("*", key)) or parse_generic
+
+
+def parse_key_values(output: str) -> Dict[str, str]:
+    return {key: value for key, value in KEY_VALUE_PATTERN.findall(output) if key}
+
+
+def _spans(starts: List[int]) -> List[Tuple[int, Optional[int]]]:
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+
+def _column_spans(header: str, rule: Optional[str], columns: Optional[Tuple[str, ...]] = None) -> List[Tuple[int, Optional[int]]]:
+    # Known column names give exact offsets even when the header separates them by a single space.
+    # Otherwise a segmented dashed rule under the header gives the widths, and failing that
+    # columns start where header words (separated by two or more spaces) do.
+    if columns:
+        return _spans([header.find(column) for column in columns])
+    starts = [match.start() for match in RULE_SEGMENT_PATTERN.finditer(rule)] if rule else []
+    if len(starts) < 2:
+        starts = [match.start() for match in HEADER_SEGMENT_PATTERN.finditer(header)]
+    return _spans(starts)
+
+
+def slice_table(
+    lines: List[str], header_index: int = 0, stop_prefixes: Tuple[str, ...] = (), columns: Optional[Tuple[str, ...]] = None
+) -> List[Dict[str, str]]:
+    """
+    Parse a fixed-width table by slicing each row at the header's column offsets.
+    Unlike splitting on whitespace this keeps empty cells and values containing spaces intact.
+    The table ends at the first blank line or line starting with one of stop_prefixes.
+    """
+    header = lines[header_index]
+    rule = lines[header_index + 1] if header_index + 1 < len(lines) and RULE_LINE_PATTERN.match(lines[header_index + 1]) else None
+    spans = _column_spans(header, rule, columns)
+    names = list(columns) if columns else [header[start:end].strip() for start, end in spans]
+    rows = []
+    for line in lines[header_index + (2 if rule else 1):]:
+        if not line.strip() or line.startswith(stop_prefixes):
+            break
+        if RULE_LINE_PATTERN.match(line):
+            continue
+        rows.append({name: line[start:end].strip() for name, (start, end) in zip(names, spans)})
+    return rows
+
+
+def parse_generic(output: str) -> Dict[str, Any]:
+    """
+    Fallback for commands without a registered parser: key/value pairs plus a best-effort table.
+    """
+    parsed: Dict[str, Any] = parse_key_values(output)
+
+    lines = output.splitlines()
+    if any("|" in line or "\t" in line for line in lines):  # Assume table if | or tabs present
+        table_data = []
+        headers = None
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(("#", "-")):
+                continue
+            columns = [col.strip() for col in COLUMN_SPLIT_PATTERN.split(line) if col.strip()]
+            if not headers:
+                headers = columns
+            elif len(columns) == len(headers):
+                table_data.append(dict(zip(headers, columns)))
+        if table_data:
+            parsed["table"] = table_data
+    return parsed
+
+
+def _tables(
+    output: str, header_prefix: str, stop_prefixes: Tuple[str, ...] = (), columns: Optional[Tuple[str, ...]] = None
+) -> List[List[Dict[str, str]]]:
+    lines = output.splitlines()
+    return [slice_table(lines, index, stop_prefixes, columns) for index, line in enumerate(lines) if line.startswith(header_prefix)]
+
+
+@register_parser("palo_alto", "show system info")
+@register_parser("fortinet", "get system status")
+def parse_key_value_command(output: str) -> Dict[str, Any]:
+    return parse_key_values(output)
+
+
+@register_parser("palo_alto", "show interface all")
+def parse_pan_interfaces(output: str) -> Dict[str, Any]:
+    tables = _tables(output, "name ")
+    return {
+        "hardware": tables[0] if tables else [],
+        "logical": tables[1] if len(tables) > 1 else [],
+    }
+
+
+PAN_ROUTE_COLUMNS = ("destination", "nexthop", "metric", "flags", "age", "interface", "next-AS")
+
+
+@register_parser("palo_alto", "show routing route")
+def parse_pan_routes(output: str) -> Dict[str, Any]:
+    tables = _tables(output, "destination ", stop_prefixes=("total routes",), columns=PAN_ROUTE_COLUMNS)
+    return {"table": [row for table in tables for row in table]}
+
+
+PAN_SESSION_COLUMNS = ("ID", "Application", "State", "Type", "Flag", "Src[Sport]/Zone/Proto (translated IP[Port])")
+
+
+@register_parser("palo_alto", "show session all")
+def parse_pan_sessions(output: str) -> Dict[str, Any]:
+    # Each session spans two lines: ID/application/state/type/flag/source, then vsys and destination.
+    # Header words are single-space separated here, so offsets come from the known column names.
+    lines = output.splitlines()
+    header_index = next((i for i, line in enumerate(lines) if line.startswith("ID ")), None)
+    if header_index is None:
+        return {"table": []}
+    spans = _column_spans(lines[header_index], None, PAN_SESSION_COLUMNS)
+    destination_start = spans[-1][0]
+    body = [line for line in lines[header_index + 1:] if line.strip() and not RULE_LINE_PATTERN.match(line)]
+    # The second header line (Vsys / Dst) precedes the first session
+    if body and body[0].startswith("Vsys"):
+        body = body[1:]
+    sessions = []
+    for first, second in zip(body[::2], body[1::2]):
+        session = {column: first[start:end].strip() for column, (start, end) in zip(PAN_SESSION_COLUMNS, spans)}
+        session[PAN_SESSION_COLUMNS[-1]] = " ".join(session[PAN_SESSION_COLUMNS[-1]].split())
+        session["Vsys"] = second[:destination_start].strip()
+        session["Dst[Dport]/Zone (translated IP[Port])"] = " ".join(second[destination_start:].split())
+        sessions.append(session)
+    return {"table": sessions}
+
+
+GAIA_VERSION_PATTERN = re.compile(r"^(Product version|OS build|OS kernel version|OS edition)\s+(.*?)\s*$", re.MULTILINE)
+
+
+@register_parser("check_point", "show version all")
+def parse_gaia_version(output: str) -> Dict[str, Any]:
+    return dict(GAIA_VERSION_PATTERN.findall(output))
+
+
+GAIA_ROUTE_PATTERN = re.compile(
+    r"^(?P<codes>[A-Z][A-Za-z ]*?)\s+(?P<destination>\d+\.\d+\.\d+\.\d+/\d+)\s+"
+    r"(?:is directly connected, (?P<interface>\S+)|via (?P<gateway>\d+\.\d+\.\d+\.\d+), (?P<via_interface>[^,\s]+)(?:, cost (?P<cost>\d+))?)",
+    re.MULTILINE,
+)
+
+
+@register_parser("check_point", "show route", "show route all")
+def parse_gaia_routes(output: str) -> Dict[str, Any]:
+    routes = []
+    for match in GAIA_ROUTE_PATTERN.finditer(output):
+        routes.append({
+            "codes": match["codes"].strip(),
+            "destination": match["destination"],
+            "gateway": match["gateway"] or "",
+            "interface": match["interface"] or match["via_interface"],
+            "cost": match["cost"] or "",
+        })
+    return {"table": routes}
+
+
+@register_parser("check_point", "show interfaces all")
+def parse_gaia_interfaces(output: str) -> Dict[str, Any]:
+    interfaces: Dict[str, Dict[str, str]] = {}
+    current: Optional[Dict[str, str]] = None
+    for line in output.splitlines():
+        if line.startswith("Interface "):
+            current = interfaces.setdefault(line.split(None, 1)[1].strip(), {})
+        elif current is not None and line.startswith(" ") and line.strip():
+            key, _, value = line.strip().partition(" ")
+            current[key] = value.strip()
+    return {"interfaces": interfaces}
+
+
+FORTIOS_ROUTE_PATTERN = re.compile(
+    r"^(?P<codes>[A-Z*][A-Z0-9* ]*?)\s+(?P<destination>\d+\.\d+\.\d+\.\d+/\d+)\s+"
+    r"(?:\[(?P<distance>\d+)/(?P<metric>\d+)\]\s+via (?P<gateway>\d+\.\d+\.\d+\.\d+), (?P<via_interface>[^,\s]+)|is directly connected, (?P<interface>[^,\s]+))",
+    re.MULTILINE,
+)
+
+
+@register_parser("fortinet", "get router info routing-table all")
+def parse_fortios_routes(output: str) -> Dict[str, Any]:
+    routes = []
+    for match in FORTIOS_ROUTE_PATTERN.finditer(output):
+        routes.append({
+            "codes": match["codes"].strip(),
+            "destination": match["destination"],
+            "distance": match["distance"] or "",
+            "metric": match["metric"] or "",
+            "gateway": match["gateway"] or "",
+            "interface": match["interface"] or match["via_interface"],
+        })
+    return {"table": routes}
+
+
+# FortiOS lets the MAC overrun its column, so rows are matched field by field rather than sliced
+FORTIOS_ARP_PATTERN = re.compile(r"^(\d+\.\d+\.\d+\.\d+)\s+(\d+)\s+([0-9a-f:]{17})\s+(\S+)\s*$", re.MULTILINE)
+
+
+@register_parser("fortinet", "get system arp")
+def parse_fortios_arp(output: str) -> Dict[str, Any]:
+    return {
+        "table": [
+            {"Address": address, "Age(min)": age, "Hardware Addr": mac, "Interface": interface}
+            for address, age, mac, interface in FORTIOS_ARP_PATTERN.findall(output)
+        ]
+    }
+
+
+def parse_output_to_json(
+    output: str,
+    command: str,
+    identified_type: Optional[str] = None,
+    raw_output: str = "full",
+    raw_limit: int = 4096,
+) -> Dict[str, Any]:
+    """
+    Parse SSH command output into JSON with the parser registered for (identified_type, command).
+    raw_output controls the copy of the raw text kept in the result: "full", "truncate"
+    (first raw_limit characters) or "drop".
+    Returns a dictionary with parsed data or raw output if parsing fails.
+    """
+    parsed: Dict[str, Any] = {"command": command, "parsed": {}}
+    if raw_output == "full":
+        parsed["raw"] = output
+    elif raw_output == "truncate":
+        parsed["raw"] = output[:raw_limit]
+        if len(output) > raw_limit:
+            parsed["raw_truncated"] = True
+
+    # Handle empty output
+    if not output.strip():
+        parsed["error"] = "No output received"
+        return parsed
+
+    parser = get_parser(identified_type, command)
+    try:
+        parsed["parsed"] = parser(output)
+    except Exception as e:
+        logger.error(f"Error parsing output for command '{command}': {e}")
+        parsed["error"] = str(e)
+        return parsed
+
+    # If no parsing applied, keep raw output
+    if not any(parsed["parsed"].values()):
+        parsed["parsed"] = {"raw_output": output}
+    return parsed
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple, Type
+from fastapi import Request, Response
+from pydantic import BaseModel
+from src.settings import settings
+from src.utils.cache import TTLCache
+from src.utils.metrics import READ_CACHE_REQUESTS
+
+# Clients may keep responses but must revalidate them (If-None-Match) before every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def _serialize(content: Any) -> bytes:
+    # The same encoding as FastAPI's JSONResponse, so cached and uncached bodies are identical
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _etag(body: bytes) -> str:
+    # Derived from the body alone, so every API process hands out the same tag for the same data
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison (RFC 9110 13.1.2): W/"x" matches "x"
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class ReadCache:
+    """
+    Serialized responses of read endpoints, kept with the generations of the collections they
+    were built from. Writes bump a collection's generation, which makes every response built
+    from it stale without having to know which pages or filters it appears in. A response
+    whose generations still match is served from memory; a client sending its ETag back in
+    If-None-Match gets a bodyless 304.
+
+    Generations are per process: writes made by other processes (worker nodes, other API
+    replicas) are only picked up when entries expire, ttl seconds after they were built.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+        self.generations: Dict[str, int] = defaultdict(int)
+        # Counted here rather than by the TTLCache, which also reports entries of old generations as hits
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bump(self, *collections: str):
+        for collection in collections:
+            self.generations[collection] += 1
+
+    def version(self, collections: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.generations[collection] for collection in collections)
+
+    async def respond(
+        self,
+        request: Request,
+        key: Hashable,
+        collections: Tuple[str, ...],
+        build: Callable[[], Awaitable[Any]],
+        extra_version: Tuple[Any, ...] = (),
+        model: Optional[Type[BaseModel]] = None,
+    ) -> Response:
+        """
+        Response for key, built by build() (a JSON-serializable result) unless a response built
+        at the current generations of collections (and extra_version) is cached. With model
+        (the route's response_model), the result is validated and filtered through it first,
+        as FastAPI would for a route returning it directly.
+        """
+        # Taken before building, so a write landing mid-build leaves the entry already stale
+        version = self.version(collections) + extra_version
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None and entry[0] == version:
+            result = "hit"
+            self.hits += 1
+            etag, body = entry[1], entry[2]
+        else:
+            result = "miss"
+            self.misses += 1
+            content = await build()
+            if model is not None:
+                content = model.model_validate(content).model_dump(mode="json", by_alias=True)
+            body = _serialize(content)
+            etag = _etag(body)
+            if self.cache is not None:
+                self.cache.set(key, (version, etag, body))
+        endpoint = key[0] if isinstance(key, tuple) else str(key)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if _matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            READ_CACHE_REQUESTS.labels(endpoint=endpoint, result="not_modified").inc()
+            return Response(status_code=304, headers=headers)
+        READ_CACHE_REQUESTS.labels(endpoint=endpoint, result=result).inc()
+        return Response(body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.cache is not None,
+            "size": self.cache.stats()["size"] if self.cache is not None else 0,
+            "generations": dict(self.generations),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+        }
+
+
+read_cache = ReadCache(maxsize=settings.READ_CACHE_SIZE, ttl=settings.READ_CACHE_TTL)
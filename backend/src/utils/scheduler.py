@@ -0,0 +1,240 @@
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from src.settings import settings
+from src.utils.bulk import resolve_targets
+from src.utils.encryptor import PasswordEncryptor
+from src.utils.history import OutputHistoryStore
+from src.utils.logging import logger
+from src.utils.metrics import SCHEDULER_POLLS_IN_FLIGHT
+from src.utils.networks import network_cidr_for
+from src.utils.ssh import ssh_execute_raw
+
+SCHEDULES_COLLECTION = "Schedules"
+LEASE_COLLECTION = "SchedulerLease"
+LEASE_ID = "scheduler"
+
+
+def new_schedule(
+    name: str,
+    commands: List[str],
+    interval: float,
+    selector: Dict[str, Any],
+    mode: str = "exec",
+    enabled: bool = True,
+) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    return {
+        "schedule_id": str(uuid.uuid4()),
+        "name": name,
+        "commands": commands,
+        "mode": mode,
+        "interval": interval,
+        "selector": selector,
+        "enabled": enabled,
+        "next_run_at": now,
+        "last_run_at": None,
+        "last_summary": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class PollScheduler:
+    """
+    Runs the polls stored in the Schedules collection.
+
+    Only one process schedules at a time: the leader, holding the lease document in
+    SchedulerLease. It renews the lease every tick; the others keep trying to take it and do so
+    once it has expired. A leader that cannot renew in time steps down and cancels its runs
+    before another process can take over, so the limits below, kept in memory, hold across
+    every node. Due schedules are still claimed by moving next_run_at forward with a
+    compare-and-set update, so not even a change of leader starts the same run twice.
+
+    Each device of a run starts at a random offset within the first spread fraction of the
+    interval, and polls share one global concurrency limit plus a limit per /24
+    (network_cidr_for), so a subnet behind one firewall or WAN link never sees more than
+    subnet_concurrency scheduled sessions at once. A device whose previous poll for the same
+    schedule is still running is skipped. Outputs go to the output history.
+    """
+    def __init__(self, tick: float, max_concurrency: int, subnet_concurrency: int, spread: float, lease: float):
+        self.tick = tick
+        self.max_concurrency = max_concurrency
+        self.subnet_concurrency = subnet_concurrency
+        self.spread = spread
+        self.lease = lease
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.leader = False
+        self._lease_until = 0.0
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._runs: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Per /24, with the number of polls holding or waiting for it; dropped when that reaches zero
+        self._subnets: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+        self._in_flight: Set[Tuple[str, str]] = set()
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        tasks = [task for task in [self._loop_task, *self._runs] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._runs = set()
+        self._in_flight = set()
+        if self.leader:
+            self.leader = False
+            try:
+                # Hand over now instead of making the next leader wait out the lease
+                await self._db[LEASE_COLLECTION].update_one({"_id": LEASE_ID, "owner": self.node_id}, {"$set": {"expires_at": datetime.utcnow()}})
+            except Exception as e:
+                logger.warning(f"Could not release the scheduler lease: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"leader": self.leader, "running_schedules": len(self._runs), "in_flight_polls": len(self._in_flight)}
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._hold_lease():
+                    await self._claim_due()
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {e}")
+                # Another process may take the lease once it expires; be gone a tick before that
+                if self.leader and time.monotonic() >= self._lease_until - self.tick:
+                    self._step_down()
+            await asyncio.sleep(self.tick)
+
+    async def _hold_lease(self) -> bool:
+        """
+        Take or renew the scheduler lease; False if another process holds it.
+        """
+        renewed_at = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            await self._db[LEASE_COLLECTION].update_one(
+                {"_id": LEASE_ID, "$or": [{"owner": self.node_id}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.node_id, "expires_at": now + timedelta(seconds=self.lease)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The upsert found the lease held by another process
+            if self.leader:
+                self._step_down()
+            return False
+        if not self.leader:
+            logger.info(f"Scheduler {self.node_id} took the scheduler lease")
+        self.leader = True
+        self._lease_until = renewed_at + self.lease
+        return True
+
+    def _step_down(self):
+        logger.warning(f"Scheduler {self.node_id} lost the scheduler lease; cancelling {len(self._runs)} runs")
+        self.leader = False
+        for task in self._runs:
+            task.cancel()
+
+    async def _claim_due(self):
+        now = datetime.utcnow()
+        due = await self._db[SCHEDULES_COLLECTION].find(
+            {"enabled": True, "next_run_at": {"$lte": now}}, {"_id": 0, "schedule_id": 1, "next_run_at": 1, "interval": 1}
+        ).sort("next_run_at", 1).to_list(None)
+        for candidate in due:
+            # Compare-and-set on next_run_at: of several processes seeing the same due schedule, one wins
+            schedule = await self._db[SCHEDULES_COLLECTION].find_one_and_update(
+                {"schedule_id": candidate["schedule_id"], "enabled": True, "next_run_at": candidate["next_run_at"]},
+                {"$set": {"next_run_at": now + timedelta(seconds=candidate["interval"]), "last_run_at": now}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if not schedule:
+                continue
+            task = asyncio.create_task(self._run_schedule(schedule))
+            self._runs.add(task)
+            task.add_done_callback(self._runs.discard)
+
+    async def _run_schedule(self, schedule: Dict[str, Any]):
+        db = self._db
+        selector = schedule["selector"]
+        try:
+            devices = await resolve_targets(db, selector.get("names"), selector.get("network_cidr"), selector.get("identified_type"), allow_all=True)
+        except Exception as e:
+            logger.error(f"Schedule {schedule['name']} could not resolve targets: {e}")
+            await self._finish(schedule, {"error": str(e)})
+            return
+        window = schedule["interval"] * self.spread
+        results = await asyncio.gather(*(self._poll(schedule, device, random.uniform(0, window)) for device in devices))
+        summary = {status: results.count(status) for status in ("succeeded", "failed", "skipped")}
+        summary["total"] = len(results)
+        logger.info(f"Schedule {schedule['name']} run finished: {summary}")
+        await self._finish(schedule, summary)
+
+    async def _finish(self, schedule: Dict[str, Any], summary: Dict[str, Any]):
+        await self._db[SCHEDULES_COLLECTION].update_one(
+            {"schedule_id": schedule["schedule_id"]},
+            {"$set": {"last_summary": {**summary, "started_at": schedule["last_run_at"], "finished_at": datetime.utcnow()}}},
+        )
+
+    @asynccontextmanager
+    async def _subnet_slot(self, network_cidr: str) -> AsyncIterator[None]:
+        semaphore, users = self._subnets.get(network_cidr, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.subnet_concurrency)
+        self._subnets[network_cidr] = (semaphore, users + 1)
+        try:
+            async with semaphore:
+                yield
+        finally:
+            semaphore, users = self._subnets[network_cidr]
+            if users == 1:
+                del self._subnets[network_cidr]
+            else:
+                self._subnets[network_cidr] = (semaphore, users - 1)
+
+    async def _poll(self, schedule: Dict[str, Any], device: Dict[str, Any], delay: float) -> str:
+        await asyncio.sleep(delay)
+        key = (schedule["schedule_id"], device["device_id"])
+        if key in self._in_flight:
+            logger.warning(f"Skipping poll of {device['name']} for {schedule['name']}: previous poll still running")
+            return "skipped"
+        self._in_flight.add(key)
+        try:
+            async with self._semaphore, self._subnet_slot(network_cidr_for(device["ip"])):
+                encryptor = PasswordEncryptor(self._db)
+                password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+                # Bounded inside the SSH call, so the poll holds its semaphores until the session is free again
+                outputs = await ssh_execute_raw(
+                    device["ip"], device["username"], password, schedule["commands"], schedule["mode"], device.get("identified_type"),
+                    settings.BULK_DEVICE_TIMEOUT,
+                )
+                if settings.HISTORY_ENABLED:
+                    await OutputHistoryStore(self._db).record(device, outputs)
+            return "succeeded"
+        except Exception as e:
+            logger.warning(f"Poll of {device['name']} for {schedule['name']} failed: {e!r}")
+            return "failed"
+        finally:
+            self._in_flight.discard(key)
+
+
+poll_scheduler = PollScheduler(
+    tick=settings.SCHEDULER_TICK,
+    max_concurrency=settings.SCHEDULER_MAX_CONCURRENCY,
+    subnet_concurrency=settings.SCHEDULER_SUBNET_CONCURRENCY,
+    spread=settings.SCHEDULER_SPREAD,
+    lease=settings.SCHEDULER_LEASE_SECONDS,
+)
+SCHEDULER_POLLS_IN_FLIGHT.set_function(lambda: len(poll_scheduler._in_flight))
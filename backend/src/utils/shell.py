@@ -0,0 +1,196 @@
+import asyncio
+import re
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import paramiko
+from src.utils.logging import logger
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+
+@dataclass(frozen=True)
+class ShellProfile:
+    """
+    How to drive the interactive CLI of one identified_type.
+    prompt matches the final line of the buffer once the device is ready for the next command.
+    """
+    prompt: re.Pattern
+    pager_off: List[str] = field(default_factory=list)
+    pager_restore: List[str] = field(default_factory=list)
+
+
+SHELL_PROFILES: Dict[str, ShellProfile] = {
+    # admin@PA-3220> / admin@PA-3220#
+    "palo_alto": ShellProfile(
+        prompt=re.compile(r"^[\w.\-]+@[\w.\-()]+[>#]\s*$"),
+        pager_off=["set cli pager off"],
+    ),
+    # gw-01:0> (clish) / [Expert@gw-01:0]# (expert)
+    "check_point": ShellProfile(
+        prompt=re.compile(r"^(\[Expert@[\w.\-]+:\d+\]#|[\w.\-]+(:\d+)?[>#])\s*$"),
+        pager_off=["set clienv rows 0"],
+    ),
+    # FGT-01 # / FGT-01 (console) #
+    "fortinet": ShellProfile(
+        prompt=re.compile(r"^[\w.\-]+( \([\w.\-]+\))? ?[#$]\s*$"),
+        pager_off=["config system console", "set output standard", "end"],
+        pager_restore=["config system console", "set output more", "end"],
+    ),
+}
+
+DEFAULT_PROFILE = ShellProfile(prompt=re.compile(r"^\S.*[>#$%]\s*$"))
+
+
+class _PromptSplitter:
+    """
+    Prompt detection and output cleanup shared by the blocking and asyncio shells.
+    """
+    def __init__(self, identified_type: Optional[str], timeout: float):
+        self.profile = SHELL_PROFILES.get(identified_type or "", DEFAULT_PROFILE)
+        self.timeout = timeout
+        self.base_prompt = ""
+        self.prompt = ""
+
+    def _is_prompt(self, line: str) -> bool:
+        line = line.strip()
+        return bool(self.profile.prompt.match(line)) and line.startswith(self.base_prompt)
+
+    def _learn_prompt(self, banner: str):
+        self.prompt = banner.splitlines()[-1].strip()
+        self.base_prompt = self.prompt.rstrip(">#$% ").split(" ")[0]
+
+    @staticmethod
+    def _clean(text: str) -> str:
+        return ANSI_ESCAPE.sub("", text).replace("\r", "")
+
+    @staticmethod
+    def _command_output(command: str, text: str) -> str:
+        lines = text.split("\n")
+        # Drop the echoed command line and the prompt that follows the output
+        if lines and lines[0].strip().endswith(command.strip()):
+            lines = lines[1:]
+        return "\n".join(lines[:-1]).strip()
+
+
+class InteractiveShell(_PromptSplitter):
+    """
+    One invoke_shell channel that runs commands back to back, splitting output on the prompt.
+    Every wait for a prompt takes at most timeout seconds, and none runs past deadline (a
+    time.monotonic() value) if one is given.
+    """
+    def __init__(self, transport: paramiko.Transport, identified_type: Optional[str], timeout: float, deadline: Optional[float] = None):
+        super().__init__(identified_type, timeout)
+        self.deadline = deadline
+        self.channel = transport.open_session(timeout=self._wait_limit())
+        self.channel.settimeout(timeout)
+        self.channel.get_pty(term="vt100", width=511, height=1000)
+        self.channel.invoke_shell()
+        # Wait for the login banner to finish and learn the device prompt
+        self._learn_prompt(self._read_until_prompt())
+        for command in self.profile.pager_off:
+            self.send(command)
+
+    def _wait_limit(self) -> float:
+        if self.deadline is None:
+            return self.timeout
+        # Never zero: Paramiko treats a zero timeout as non-blocking rather than as already expired
+        return max(min(self.timeout, self.deadline - time.monotonic()), 0.001)
+
+    def _read_until_prompt(self) -> str:
+        chunks: List[str] = []
+        tail = ""
+        deadline = time.monotonic() + self._wait_limit()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No prompt after {self.timeout}s; last output: {tail[-200:]!r}")
+            self.channel.settimeout(remaining)
+            try:
+                data = self.channel.recv(65535)
+            except socket.timeout:
+                continue
+            if not data:
+                raise paramiko.SSHException("Shell channel closed before prompt was seen")
+            chunk = self._clean(data.decode("utf-8", errors="replace"))
+            chunks.append(chunk)
+            # Only the last line can be the prompt, so avoid rescanning the whole buffer
+            tail = chunk.rsplit("\n", 1)[-1] if "\n" in chunk else tail + chunk
+            if self._is_prompt(tail):
+                return "".join(chunks)
+
+    def send(self, command: str) -> str:
+        """
+        Send one command and return its output without the command echo and trailing prompt.
+        """
+        self.channel.sendall(f"{command}\n".encode())
+        return self._command_output(command, self._read_until_prompt())
+
+    def close(self):
+        try:
+            for command in self.profile.pager_restore:
+                self.send(command)
+        except Exception as e:
+            logger.debug(f"Could not restore pager settings: {e}")
+        finally:
+            self.channel.close()
+
+
+class AsyncInteractiveShell(_PromptSplitter):
+    """
+    InteractiveShell for the asyncssh backend: drives an SSH process opened with a PTY and
+    utf-8 decoding. Call await start() before send().
+    """
+    def __init__(self, process, identified_type: Optional[str], timeout: float):
+        super().__init__(identified_type, timeout)
+        self.process = process
+
+    async def start(self):
+        self._learn_prompt(await self._read_until_prompt())
+        for command in self.profile.pager_off:
+            await self.send(command)
+
+    async def _read_until_prompt(self) -> str:
+        chunks: List[str] = []
+        tail = ""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                data = await asyncio.wait_for(self.process.stdout.read(65535), max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"No prompt after {self.timeout}s; last output: {tail[-200:]!r}")
+            if not data:
+                raise ConnectionError("Shell channel closed before prompt was seen")
+            chunk = self._clean(data)
+            chunks.append(chunk)
+            tail = chunk.rsplit("\n", 1)[-1] if "\n" in chunk else tail + chunk
+            if self._is_prompt(tail):
+                return "".join(chunks)
+
+    async def send(self, command: str) -> str:
+        self.process.stdin.write(f"{command}\n")
+        return self._command_output(command, await self._read_until_prompt())
+
+    async def close(self):
+        try:
+            for command in self.profile.pager_restore:
+                await self.send(command)
+        except Exception as e:
+            logger.debug(f"Could not restore pager settings: {e}")
+        finally:
+            self.process.close()
+
+
+def run_shell_commands(
+    transport: paramiko.Transport, commands: List[str], identified_type: Optional[str], timeout: float, deadline: Optional[float] = None
+) -> Dict[str, str]:
+    """
+    Stream commands through a single interactive shell and return raw output per command.
+    """
+    shell = InteractiveShell(transport, identified_type, timeout, deadline)
+    try:
+        return {command: shell.send(command) for command in commands}
+    finally:
+        shell.close()
@@ -1,92 +1,725 @@
+import asyncio
+import codecs
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
 import paramiko
-import re
-from typing import Dict, Any
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Protocol, Tuple, TypeVar
+from src.settings import settings
+from src.utils.governor import SSHAuthenticationError, SSHConnectError, SSHTimeoutError, ssh_governor
 from src.utils.logging import logger
+from src.utils.metrics import (
+    PARSE_SECONDS,
+    SSH_AUTH_SECONDS,
+    SSH_COMMAND_SECONDS,
+    SSH_CONNECT_SECONDS,
+    SSH_ERRORS,
+    SSH_POOL_OPEN,
+    SSH_SESSIONS_IN_FLIGHT,
+    device_label,
+    span,
+    timed,
+)
+from src.utils.parsers import parse_output_to_json
+from src.utils.shell import InteractiveShell, run_shell_commands
 
-def parse_output_to_json(output: str, command: str) -> Dict[str, Any]:
+T = TypeVar("T")
+
+# Paramiko is blocking; all SSH work runs on this bounded pool instead of the event loop.
+ssh_executor = ThreadPoolExecutor(max_workers=settings.SSH_WORKER_THREADS, thread_name_prefix="ssh")
+
+def budget(deadline: Optional[float], limit: float) -> float:
     """
-    Parse SSH command output into JSON based on common network device output patterns.
-    Returns a dictionary with parsed data or raw output if parsing fails.
+    Seconds a blocking step may take: limit, cut to what is left before deadline (a
+    time.monotonic() value, or None for no overall deadline). Raises SSHTimeoutError once the
+    deadline has passed.
     """
-    try:
-        # Initialize result
-        parsed = {"command": command, "parsed": {}, "raw": output}
-
-        # Handle empty output
-        if not output.strip():
-            parsed["error"] = "No output received"
-            return parsed
-
-        # Example 1: Key-value pairs (e.g., "Version: 15.1", "Hostname: router1")
-        key_value_pattern = re.compile(r"^(.*?)\s*:\s*(.*?)$", re.MULTILINE)
-        key_value_matches = key_value_pattern.findall(output)
-        if key_value_matches:
-            for key, value in key_value_matches:
-                parsed["parsed"][key.strip()] = value.strip()
-
-        # Example 2: Tabular data (e.g., "show interfaces" with columns)
-        lines = output.splitlines()
-        if any("|" in line or "\t" in line for line in lines):  # Assume table if | or tabs present
-            table_data = []
-            headers = None
-            for line in lines:
-                line = line.strip()
-                if not line or line.startswith(("#", "-")):
-                    continue
-                # Split by | or multiple spaces/tabs
-                columns = [col.strip() for col in re.split(r"\s{2,}|\|", line) if col.strip()]
-                if not headers:
-                    headers = columns
-                elif len(columns) == len(headers):
-                    table_data.append(dict(zip(headers, columns)))
-            if table_data:
-                parsed["parsed"]["table"] = table_data
-
-        # If no parsing applied, keep raw output
-        if not parsed["parsed"]:
-            parsed["parsed"] = {"raw_output": output}
-
-        return parsed
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise SSHTimeoutError("Deadline exceeded")
+    return min(limit, remaining)
 
-    except Exception as e:
-        logger.error(f"Error parsing output for command '{command}': {e}")
-        return {"command": command, "error": str(e), "raw": output}
+class PooledSession:
+    """
+    An authenticated Paramiko transport owned by SSHConnectionPool.
+    """
+    def __init__(self, key: Tuple[str, str, str], transport: paramiko.Transport):
+        self.key = key
+        self.transport = transport
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+    def is_alive(self) -> bool:
+        return self.transport.is_active() and self.transport.is_authenticated()
 
-async def ssh_execute_commands(host: str, username: str, password: str, commands: list[str]) -> Dict[str, Dict[str, Any]]:
+    def close(self):
+        try:
+            self.transport.close()
+        except Exception as e:
+            logger.debug(f"Error closing SSH transport to {self.key[0]}: {e}")
+
+
+class SSHConnectionPool:
     """
-    Execute a list of commands on a remote device via SSH using Paramiko.
-    Returns a dictionary mapping commands to their parsed JSON outputs.
+    Process-wide pool of authenticated SSH transports keyed by (host, username, password digest).
+
+    Idle sessions are kept alive with SSH keepalives and closed after idle_timeout seconds.
+    At most max_sessions_per_device transports (idle or in use) exist per key; callers beyond
+    that wait for a session to be released. Dead transports are replaced transparently.
     """
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    output = {}
+    def __init__(self, max_sessions_per_device: int, idle_timeout: float, keepalive_interval: int, connect_timeout: float):
+        self.max_sessions_per_device = max_sessions_per_device
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self._cond = threading.Condition()
+        self._idle: Dict[Tuple[str, str, str], List[PooledSession]] = {}
+        self._open: Dict[Tuple[str, str, str], int] = {}
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
 
-    try:
-        # Connect to the device
-        client.connect(hostname=host, username=username, password=password, timeout=10)
+    def _connect(
+        self, host: str, username: str, password: str, device_type: Optional[str] = None, deadline: Optional[float] = None
+    ) -> paramiko.Transport:
+        label = device_label(device_type)
+        try:
+            with span("ssh.connect", host=host), timed(SSH_CONNECT_SECONDS, device_type=label):
+                sock = socket.create_connection((host, settings.SSH_PORT), timeout=budget(deadline, self.connect_timeout))
+                transport = paramiko.Transport(sock)
+                try:
+                    timeout = budget(deadline, self.connect_timeout)
+                    transport.banner_timeout = timeout
+                    transport.start_client(timeout=timeout)
+                except Exception:
+                    transport.close()
+                    raise
+        except SSHTimeoutError:
+            raise
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            # Refused, unroutable, or no banner: nothing on the other end speaks SSH right now
+            raise SSHConnectError(str(e) or type(e).__name__) from e
+        try:
+            with span("ssh.auth", host=host), timed(SSH_AUTH_SECONDS, device_type=label):
+                transport.auth_timeout = budget(deadline, transport.auth_timeout)
+                transport.auth_password(username, password)
+            transport.set_keepalive(self.keepalive_interval)
+        except Exception:
+            transport.close()
+            raise
         logger.info(f"SSH connected to {host}")
+        return transport
+
+    def acquire(
+        self, host: str, username: str, password: str, device_type: Optional[str] = None, deadline: Optional[float] = None
+    ) -> PooledSession:
+        # The password digest keeps a changed password from reusing a session authenticated with the old one
+        key = (host, username, hashlib.sha256(password.encode()).hexdigest())
+        wait_until = time.monotonic() + budget(deadline, self.connect_timeout)
+        with self._cond:
+            while True:
+                idle = self._idle.get(key)
+                while idle:
+                    session = idle.pop()
+                    if session.is_alive():
+                        self.hits += 1
+                        session.reused = True
+                        return session
+                    # Transport died while idle; drop it and try the next one or reconnect
+                    self.reconnects += 1
+                    self._open[key] -= 1
+                    session.close()
+                if self._open.get(key, 0) < self.max_sessions_per_device:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    self.misses += 1
+                    break
+                remaining = wait_until - time.monotonic()
+                if remaining <= 0:
+                    raise paramiko.SSHException(f"Timed out waiting for a free SSH session to {host}")
+                self._cond.wait(remaining)
+        try:
+            session = PooledSession(key, self._connect(host, username, password, device_type, deadline))
+        except Exception:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify_all()
+            raise
+        self._ensure_reaper()
+        return session
+
+    def release(self, session: PooledSession):
+        with self._cond:
+            if self._closed or not session.is_alive():
+                self._open[session.key] -= 1
+                session.close()
+            else:
+                session.last_used = time.monotonic()
+                self._idle.setdefault(session.key, []).append(session)
+            self._cond.notify_all()
+
+    def record_reconnect(self):
+        with self._cond:
+            self.reconnects += 1
+
+    def discard(self, session: PooledSession):
+        with self._cond:
+            self._open[session.key] -= 1
+            self._cond.notify_all()
+        session.close()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for key, idle in self._idle.items():
+                keep = []
+                for session in idle:
+                    if now - session.last_used > self.idle_timeout or not session.is_alive():
+                        expired.append(session)
+                        self._open[key] -= 1
+                    else:
+                        keep.append(session)
+                idle[:] = keep
+            self.evictions += len(expired)
+            if expired:
+                self._cond.notify_all()
+        for session in expired:
+            session.close()
+
+    def _ensure_reaper(self):
+        if self._reaper is not None:
+            return
+        with self._cond:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="ssh-pool-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while not self._closed:
+            time.sleep(max(self.idle_timeout / 2, 1))
+            self.evict_idle()
+
+    def close_all(self):
+        with self._cond:
+            self._closed = True
+            sessions = [session for idle in self._idle.values() for session in idle]
+            for session in sessions:
+                self._open[session.key] -= 1
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "reconnects": self.reconnects,
+                "evictions": self.evictions,
+                "open_sessions": sum(self._open.values()),
+                "idle_sessions": sum(len(idle) for idle in self._idle.values()),
+                "devices": sum(1 for count in self._open.values() if count),
+            }
+
+
+ssh_pool = SSHConnectionPool(
+    max_sessions_per_device=settings.SSH_POOL_MAX_SESSIONS_PER_DEVICE,
+    idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+    keepalive_interval=settings.SSH_KEEPALIVE_INTERVAL,
+    connect_timeout=settings.SSH_CONNECT_TIMEOUT,
+)
+
+def _recv_all(channel: paramiko.Channel, recv: Callable[[int], bytes], timeout: float, deadline: Optional[float]) -> bytes:
+    chunks = []
+    while True:
+        # Re-armed per read, so output trickling in cannot stretch the call past the deadline
+        channel.settimeout(budget(deadline, timeout))
+        data = recv(32768)
+        if not data:
+            return b"".join(chunks)
+        chunks.append(data)
+
+def run_command(transport: paramiko.Transport, command: str, timeout: float, strip: bool = True, deadline: Optional[float] = None) -> str:
+    """
+    Run a single command on its own exec channel and return stdout, or stderr if stdout is empty.
+    Every wait is bounded by timeout and by the overall deadline, if any.
+    """
+    channel = transport.open_session(timeout=budget(deadline, timeout))
+    try:
+        channel.settimeout(budget(deadline, timeout))
+        channel.exec_command(command)
+        cmd_output = _recv_all(channel, channel.recv, timeout, deadline).decode('utf-8')
+        cmd_error = _recv_all(channel, channel.recv_stderr, timeout, deadline).decode('utf-8')
+        if strip:
+            cmd_output, cmd_error = cmd_output.strip(), cmd_error.strip()
+        return cmd_output if cmd_output.strip() else cmd_error
+    finally:
+        channel.close()
+
+def with_pooled_session(
+    host: str,
+    username: str,
+    password: str,
+    func: Callable[[paramiko.Transport], T],
+    device_type: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """
+    Call func with a pooled transport. If a reused transport turns out to be dead (the device
+    dropped it since it was last used), reconnect once and retry.
+    """
+    for attempt in range(2):
+        session = ssh_pool.acquire(host, username, password, device_type, deadline)
+        try:
+            with SSH_SESSIONS_IN_FLIGHT.track_inprogress():
+                result = func(session.transport)
+        except (paramiko.SSHException, EOFError, socket.error):
+            stale = session.reused and not session.is_alive() and not attempt
+            ssh_pool.discard(session)
+            if not stale:
+                raise
+            ssh_pool.record_reconnect()
+            logger.info(f"Pooled SSH session to {host} was stale, reconnecting")
+            continue
+        except Exception:
+            # Not a transport failure (e.g. unexpected output); the session is still usable
+            ssh_pool.release(session)
+            raise
+        ssh_pool.release(session)
+        return result
+    raise paramiko.SSHException(f"Could not obtain a working SSH session to {host}")
+
+def _ssh_execute_raw_sync(
+    host: str,
+    username: str,
+    password: str,
+    commands: list[str],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, str]:
+    """
+    Blocking Paramiko implementation of ssh_execute_raw.
+    Must only be called from a worker thread, never directly on the event loop.
+    """
+    label = device_label(identified_type)
+    # Enforced here, in the thread: cancelling the awaiting coroutine would leave the thread and its session busy
+    deadline = time.monotonic() + timeout if timeout else None
 
-        # Execute each command
+    def execute(transport: paramiko.Transport) -> Dict[str, str]:
+        if mode == "shell":
+            with span("ssh.shell", host=host, commands=len(commands)), timed(SSH_COMMAND_SECONDS, device_type=label, mode=mode):
+                return run_shell_commands(transport, commands, identified_type, settings.SSH_COMMAND_TIMEOUT, deadline)
+        outputs = {}
         for cmd in commands:
-            stdin, stdout, stderr = client.exec_command(cmd, timeout=10)
-            cmd_output = stdout.read().decode('utf-8').strip()
-            cmd_error = stderr.read().decode('utf-8').strip()
-            result = cmd_output if cmd_output else cmd_error
-            # Parse output to JSON
-            output[cmd] = parse_output_to_json(result, cmd)
-            logger.debug(f"Command '{cmd}' executed on {host}: {output[cmd]}")
+            with span("ssh.command", host=host, command=cmd), timed(SSH_COMMAND_SECONDS, device_type=label, mode=mode):
+                outputs[cmd] = run_command(transport, cmd, settings.SSH_COMMAND_TIMEOUT, deadline=deadline)
+        return outputs
+
+    return _with_mapped_errors(host, username, password, execute, identified_type, deadline)
+
+def _ssh_probe_sync(host: str, username: str, password: str, read_prompt: bool = False) -> Dict[str, str]:
+    """
+    Blocking Paramiko implementation of SSHBackend.probe.
+    """
+    def probe(transport: paramiko.Transport) -> Dict[str, str]:
+        banner = transport.get_banner()
+        evidence = {
+            "server_version": transport.remote_version or "",
+            "banner": banner.decode("utf-8", errors="replace") if isinstance(banner, bytes) else banner or "",
+            "prompt": "",
+        }
+        if read_prompt:
+            evidence["prompt"] = _read_prompt(transport, host)
+        return evidence
+
+    return _with_mapped_errors(host, username, password, probe)
+
+def _read_prompt(transport: paramiko.Transport, host: str) -> str:
+    # A prompt that never settles is missing evidence, not a failed probe
+    try:
+        shell = InteractiveShell(transport, None, settings.SSH_COMMAND_TIMEOUT)
+    except (TimeoutError, paramiko.SSHException) as e:
+        logger.debug(f"No shell prompt from {host}: {e}")
+        return ""
+    shell.close()
+    return shell.prompt
 
-        return output
+def _with_mapped_errors(
+    host: str,
+    username: str,
+    password: str,
+    func: Callable[[paramiko.Transport], T],
+    identified_type: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """
+    with_pooled_session, with failures counted and turned into the messages API callers see.
+    """
+    label = device_label(identified_type)
+    try:
+        return with_pooled_session(host, username, password, func, identified_type, deadline)
+    except Exception as e:
+        raise _map_error(host, label, e, deadline)
+
+def _map_error(host: str, label: str, error: Exception, deadline: Optional[float] = None) -> Exception:
+    if isinstance(error, paramiko.AuthenticationException):
+        SSH_ERRORS.labels(device_type=label, kind="auth").inc()
+        logger.error(f"Authentication failed for {host}")
+        return SSHAuthenticationError("Authentication failed")
+    if isinstance(error, SSHTimeoutError) or (deadline is not None and time.monotonic() >= deadline):
+        # Whatever step was running when the overall deadline passed, the call timed out
+        SSH_ERRORS.labels(device_type=label, kind="timeout").inc()
+        logger.error(f"SSH call to {host} ran out of time: {error}")
+        return SSHTimeoutError("Deadline exceeded")
+    if isinstance(error, SSHConnectError):
+        SSH_ERRORS.labels(device_type=label, kind="connection").inc()
+        logger.error(f"Error connecting to {host}: {str(error)}")
+        return SSHConnectError(f"Connection error: {str(error)}")
+    if isinstance(error, paramiko.SSHException):
+        SSH_ERRORS.labels(device_type=label, kind="ssh").inc()
+        logger.error(f"SSH error for {host}: {str(error)}")
+        return Exception(f"SSH error: {str(error)}")
+    SSH_ERRORS.labels(device_type=label, kind="connection").inc()
+    logger.error(f"Error connecting to {host}: {str(error)}")
+    return Exception(f"Connection error: {str(error)}")
+
+def parse_outputs(
+    results: Dict[str, str], identified_type: Optional[str] = None, raw_output: str = "full"
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse raw outputs keyed by command into JSON results.
+    """
+    parsed = {}
+    for cmd, result in results.items():
+        with timed(PARSE_SECONDS, device_type=device_label(identified_type)):
+            parsed[cmd] = parse_output_to_json(result, cmd, identified_type, raw_output, settings.RAW_OUTPUT_LIMIT)
+    return parsed
 
+async def run_blocking(func: Callable[..., T], *args) -> T:
+    """
+    Run a blocking SSH call on the dedicated SSH thread pool so the event loop stays free.
+    The caller's contextvars (the current trace span) go along to the thread.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(ssh_executor, functools.partial(context.run, func, *args))
+
+
+class StreamCancelled(Exception):
+    """
+    Raised inside the SSH thread when the consumer of a stream has gone away.
+    """
+
+
+# Seconds between checks of a streaming channel that had nothing to read; Paramiko offers no
+# wait on stdout and stderr together
+STREAM_POLL_INTERVAL = 0.01
+
+
+def _stream_channel(channel: paramiko.Channel, command: str, emit: Callable[[Dict[str, Any]], None]):
+    # Both streams are read as data arrives, so a command filling its stderr window cannot stall
+    # behind a stdout that is only read to EOF (or vice versa), and chunks go out in arrival order.
+    # Decode incrementally so a multi-byte character split across reads is not mangled.
+    streams = [
+        ("stdout", channel.recv_ready, channel.recv, codecs.getincrementaldecoder("utf-8")(errors="replace")),
+        ("stderr", channel.recv_stderr_ready, channel.recv_stderr, codecs.getincrementaldecoder("utf-8")(errors="replace")),
+    ]
+    idle_since = time.monotonic()
+    while True:
+        received = False
+        for stream, ready, recv, decoder in streams:
+            if ready():
+                text = decoder.decode(recv(settings.STREAM_CHUNK_SIZE))
+                if text:
+                    emit({"event": "chunk", "command": command, "stream": stream, "data": text})
+                received = True
+        if received:
+            idle_since = time.monotonic()
+            continue
+        # Output is queued ahead of the exit status, so once it is in both buffers are final
+        if (channel.exit_status_ready() or channel.closed) and not channel.recv_ready() and not channel.recv_stderr_ready():
+            break
+        if time.monotonic() - idle_since > settings.SSH_COMMAND_TIMEOUT:
+            raise socket.timeout(f"No output for {settings.SSH_COMMAND_TIMEOUT}s")
+        time.sleep(STREAM_POLL_INTERVAL)
+    for stream, _, _, decoder in streams:
+        text = decoder.decode(b"", final=True)
+        if text:
+            emit({"event": "chunk", "command": command, "stream": stream, "data": text})
+
+
+def _ssh_stream_commands_sync(
+    host: str,
+    username: str,
+    password: str,
+    commands: List[str],
+    emit: Callable[[Dict[str, Any]], None],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+):
+    """
+    Blocking implementation of ssh_stream_commands: calls emit for every event instead of
+    collecting the output. In exec mode output is emitted as it is read from the channel;
+    in shell mode each command's output is emitted once its prompt is seen.
+    """
+    def stream(transport: paramiko.Transport):
+        if mode == "shell":
+            shell = InteractiveShell(transport, identified_type, settings.SSH_COMMAND_TIMEOUT)
+            try:
+                for command in commands:
+                    emit({"event": "command_start", "command": command})
+                    emit({"event": "chunk", "command": command, "stream": "stdout", "data": shell.send(command)})
+                    emit({"event": "command_end", "command": command, "exit_status": None})
+            finally:
+                shell.close()
+            return
+        for command in commands:
+            channel = transport.open_session(timeout=settings.SSH_COMMAND_TIMEOUT)
+            try:
+                channel.settimeout(settings.SSH_COMMAND_TIMEOUT)
+                channel.exec_command(command)
+                emit({"event": "command_start", "command": command})
+                _stream_channel(channel, command, emit)
+                emit({"event": "command_end", "command": command, "exit_status": channel.recv_exit_status()})
+            finally:
+                channel.close()
+
+    try:
+        with_pooled_session(host, username, password, stream, identified_type)
+    except StreamCancelled:
+        raise
     except paramiko.AuthenticationException:
         logger.error(f"Authentication failed for {host}")
-        raise Exception("Authentication failed")
+        raise SSHAuthenticationError("Authentication failed")
+    except SSHConnectError as e:
+        logger.error(f"Error connecting to {host}: {str(e)}")
+        raise SSHConnectError(f"Connection error: {str(e)}")
     except paramiko.SSHException as ssh_err:
         logger.error(f"SSH error for {host}: {str(ssh_err)}")
         raise Exception(f"SSH error: {str(ssh_err)}")
     except Exception as e:
         logger.error(f"Error connecting to {host}: {str(e)}")
         raise Exception(f"Connection error: {str(e)}")
+
+async def _paramiko_stream_commands(
+    host: str,
+    username: str,
+    password: str,
+    commands: List[str],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Paramiko implementation of ssh_stream_commands. Events pass through a queue of
+    STREAM_QUEUE_SIZE; when the consumer falls behind the SSH thread stops reading, so flow
+    control reaches the device instead of memory.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+    done = object()
+
+    def emit(event: Dict[str, Any]):
+        future = asyncio.run_coroutine_threadsafe(queue.put(event), loop)
+        while True:
+            if cancelled.is_set():
+                future.cancel()
+                raise StreamCancelled()
+            try:
+                future.result(timeout=0.5)
+                return
+            except concurrent.futures.TimeoutError:
+                continue
+
+    def finished(future: asyncio.Future):
+        if cancelled.is_set():
+            # Nobody is reading any more; just consume the StreamCancelled (or other) error
+            if not future.cancelled():
+                future.exception()
+            return
+        asyncio.ensure_future(queue.put(done))
+
+    task = loop.run_in_executor(ssh_executor, _ssh_stream_commands_sync, host, username, password, commands, emit, mode, identified_type)
+    task.add_done_callback(finished)
+    try:
+        while True:
+            event = await queue.get()
+            if event is done:
+                break
+            yield event
+        await task
     finally:
-        client.close()
-        logger.info(f"SSH connection to {host} closed")
\ No newline at end of file
+        cancelled.set()
+
+
+class SSHBackend(Protocol):
+    """
+    Transport layer behind ssh_execute_raw, ssh_execute_commands and ssh_stream_commands,
+    selected with SSH_BACKEND.
+    """
+    name: str
+
+    async def execute(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        commands: List[str],
+        mode: str = "exec",
+        identified_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, str]:
+        """
+        Raw output per command. With timeout, the whole call (session wait, connect and every
+        command) ends within timeout seconds and raises SSHTimeoutError when it does not finish,
+        after its session has been released.
+        """
+        ...
+
+    def stream(
+        self, host: str, username: str, password: str, commands: List[str], mode: str = "exec", identified_type: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]: ...
+
+    async def probe(self, host: str, username: str, password: str, read_prompt: bool = False) -> Dict[str, str]:
+        """
+        What the device reveals before any command runs: the SSH server version string, the
+        pre-auth banner and, with read_prompt, the prompt of a fresh shell. The session stays
+        pooled for the commands that follow.
+        """
+        ...
+
+    def stats(self) -> Dict[str, Any]: ...
+
+    async def close(self): ...
+
+
+class ParamikoBackend:
+    """
+    Blocking Paramiko sessions from ssh_pool, each occupying a thread of ssh_executor while it runs.
+    """
+    name = "paramiko"
+
+    async def execute(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        commands: List[str],
+        mode: str = "exec",
+        identified_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, str]:
+        return await run_blocking(_ssh_execute_raw_sync, host, username, password, commands, mode, identified_type, timeout)
+
+    def stream(
+        self, host: str, username: str, password: str, commands: List[str], mode: str = "exec", identified_type: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        return _paramiko_stream_commands(host, username, password, commands, mode, identified_type)
+
+    async def probe(self, host: str, username: str, password: str, read_prompt: bool = False) -> Dict[str, str]:
+        return await run_blocking(_ssh_probe_sync, host, username, password, read_prompt)
+
+    def stats(self) -> Dict[str, Any]:
+        return ssh_pool.stats()
+
+    async def close(self):
+        ssh_pool.close_all()
+
+
+def _create_backend(name: str) -> SSHBackend:
+    if name == "asyncssh":
+        try:
+            from src.utils.ssh_asyncssh import AsyncSSHBackend
+        except ImportError:  # optional; Paramiko is always available
+            logger.warning("SSH_BACKEND=asyncssh but the asyncssh package is not installed; using paramiko")
+        else:
+            return AsyncSSHBackend()
+    elif name != "paramiko":
+        raise ValueError(f"Unknown SSH_BACKEND '{name}' (expected 'paramiko' or 'asyncssh')")
+    return ParamikoBackend()
+
+
+ssh_backend = _create_backend(settings.SSH_BACKEND)
+SSH_POOL_OPEN.set_function(lambda: ssh_backend.stats()["open_sessions"])
+
+
+async def ssh_execute_raw(
+    host: str,
+    username: str,
+    password: str,
+    commands: list[str],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, str]:
+    """
+    Execute commands via SSH like ssh_execute_commands, but return the unparsed output per command.
+    timeout bounds the whole call; see SSHBackend.execute.
+    """
+    async with ssh_governor.slot(host):
+        return await ssh_backend.execute(host, username, password, commands, mode, identified_type, timeout)
+
+async def ssh_execute_commands(
+    host: str,
+    username: str,
+    password: str,
+    commands: list[str],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+    raw_output: str = "full",
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Execute a list of commands on a remote device via SSH with the configured backend.
+    mode "exec" opens one exec channel per command; mode "shell" streams all commands through
+    one interactive shell, using the prompt of identified_type to split the output.
+    Outputs are parsed with the parser registered for identified_type; raw_output controls
+    whether the raw text is kept in full, truncated or dropped.
+    Returns a dictionary mapping commands to their parsed JSON outputs.
+    """
+    async with ssh_governor.slot(host):
+        outputs = await ssh_backend.execute(host, username, password, commands, mode, identified_type)
+    return await run_blocking(parse_outputs, outputs, identified_type, raw_output)
+
+async def ssh_stream_commands(
+    host: str,
+    username: str,
+    password: str,
+    commands: List[str],
+    mode: str = "exec",
+    identified_type: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Execute commands via SSH and yield command_start, chunk and command_end events as output
+    arrives, with flow control back to the device when the consumer falls behind.
+    Closing the generator early cancels the remote commands.
+    """
+    async with ssh_governor.slot(host):
+        events = ssh_backend.stream(host, username, password, commands, mode, identified_type)
+        try:
+            async for event in events:
+                yield event
+        finally:
+            # Close the backend stream now, not when it is collected, so the cancel reaches the device
+            await events.aclose()
+
+async def ssh_probe(host: str, username: str, password: str, read_prompt: bool = False) -> Dict[str, str]:
+    """
+    Connect (or reuse a pooled session) and return what the device shows before any command
+    runs; see SSHBackend.probe.
+    """
+    async with ssh_governor.slot(host):
+        return await ssh_backend.probe(host, username, password, read_prompt)
@@ -0,0 +1,423 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncssh
+from src.settings import settings
+from src.utils.governor import SSHAuthenticationError, SSHConnectError, SSHTimeoutError
+from src.utils.logging import logger
+from src.utils.metrics import (
+    SSH_AUTH_SECONDS,
+    SSH_COMMAND_SECONDS,
+    SSH_CONNECT_SECONDS,
+    SSH_ERRORS,
+    SSH_SESSIONS_IN_FLIGHT,
+    device_label,
+    span,
+    timed,
+)
+from src.utils.shell import AsyncInteractiveShell
+
+T = TypeVar("T")
+
+# Failures of a connection that was fine when it went idle; worth one reconnect
+STALE_ERRORS = (asyncssh.ConnectionLost, asyncssh.DisconnectError, asyncssh.ChannelOpenError, ConnectionError)
+
+
+class _TimedClient(asyncssh.SSHClient):
+    """
+    Supplies the password on request, which is also the moment the handshake ends, so connect
+    and auth time can be observed separately as with the Paramiko backend.
+    """
+    def __init__(self, password: str, started: float, device_type: str):
+        self._password: Optional[str] = password
+        self._started = started
+        self._device_type = device_type
+        self._auth_started: Optional[float] = None
+        self.banner = ""
+
+    def auth_banner_received(self, msg: str, lang: str):
+        self.banner += msg
+
+    def password_auth_requested(self) -> Optional[str]:
+        if self._auth_started is None:
+            self._auth_started = time.perf_counter()
+            SSH_CONNECT_SECONDS.labels(device_type=self._device_type).observe(self._auth_started - self._started)
+        # Returning None after the first attempt ends password auth instead of retrying the same password
+        password, self._password = self._password, None
+        return password
+
+    def auth_completed(self):
+        # None when the server accepted the user without asking for the password
+        if self._auth_started is not None:
+            SSH_AUTH_SECONDS.labels(device_type=self._device_type).observe(time.perf_counter() - self._auth_started)
+
+
+class PooledConnection:
+    __slots__ = ("key", "connection", "created_at", "last_used", "reused")
+
+    def __init__(self, key: Tuple[str, str, str], connection: asyncssh.SSHClientConnection):
+        self.key = key
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.reused = False
+
+    def is_alive(self) -> bool:
+        return not self.connection.is_closed()
+
+    def close(self):
+        self.connection.close()
+
+
+class AsyncSSHPool:
+    """
+    asyncssh counterpart of SSHConnectionPool, with the same limits and statistics: at most
+    max_sessions_per_device connections per (host, username, password digest), idle ones closed
+    after idle_timeout. Everything runs on the event loop, so a waiting caller costs a
+    coroutine rather than a thread.
+    """
+    def __init__(self, max_sessions_per_device: int, idle_timeout: float, keepalive_interval: int, connect_timeout: float):
+        self.max_sessions_per_device = max_sessions_per_device
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self._cond: Optional[asyncio.Condition] = None
+        self._idle: Dict[Tuple[str, str, str], List[PooledConnection]] = {}
+        self._open: Dict[Tuple[str, str, str], int] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+            self._reaper = asyncio.create_task(self._reap())
+        return self._cond
+
+    async def _connect(self, host: str, username: str, password: str, device_type: Optional[str]) -> asyncssh.SSHClientConnection:
+        started = time.perf_counter()
+        try:
+            connection = await self._handshake(host, username, password, device_type, started)
+        except asyncssh.PermissionDenied:
+            raise
+        except (OSError, asyncssh.Error, TimeoutError) as e:
+            # Refused, unroutable, or no banner: nothing on the other end speaks SSH right now
+            raise SSHConnectError(str(e) or type(e).__name__) from e
+        logger.info(f"SSH connected to {host}")
+        return connection
+
+    async def _handshake(self, host: str, username: str, password: str, device_type: Optional[str], started: float) -> asyncssh.SSHClientConnection:
+        with span("ssh.connect", host=host):
+            connection, _ = await asyncssh.create_connection(
+                lambda: _TimedClient(password, started, device_label(device_type)),
+                host,
+                port=settings.SSH_PORT,
+                username=username,
+                known_hosts=None,
+                client_keys=None,
+                agent_path=None,
+                preferred_auth="password",
+                connect_timeout=self.connect_timeout,
+                login_timeout=self.connect_timeout,
+                keepalive_interval=self.keepalive_interval,
+            )
+        return connection
+
+    async def acquire(self, host: str, username: str, password: str, device_type: Optional[str] = None) -> PooledConnection:
+        key = (host, username, hashlib.sha256(password.encode()).hexdigest())
+        cond = self._condition()
+        async with cond:
+            while True:
+                idle = self._idle.get(key)
+                while idle:
+                    session = idle.pop()
+                    if session.is_alive():
+                        self.hits += 1
+                        session.reused = True
+                        return session
+                    self.reconnects += 1
+                    self._open[key] -= 1
+                    session.close()
+                if self._open.get(key, 0) < self.max_sessions_per_device:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    self.misses += 1
+                    break
+                try:
+                    await asyncio.wait_for(cond.wait(), self.connect_timeout)
+                except asyncio.TimeoutError:
+                    raise asyncssh.ChannelOpenError(asyncssh.OPEN_CONNECT_FAILED, f"Timed out waiting for a free SSH session to {host}")
+        try:
+            return PooledConnection(key, await self._connect(host, username, password, device_type))
+        except BaseException:
+            async with cond:
+                self._open[key] -= 1
+                cond.notify_all()
+            raise
+
+    async def release(self, session: PooledConnection):
+        async with self._condition():
+            if not session.is_alive():
+                self._open[session.key] -= 1
+                session.close()
+            else:
+                session.last_used = time.monotonic()
+                self._idle.setdefault(session.key, []).append(session)
+            self._cond.notify_all()
+
+    async def discard(self, session: PooledConnection):
+        session.close()
+        async with self._condition():
+            self._open[session.key] -= 1
+            self._cond.notify_all()
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        async with self._condition():
+            for key, idle in self._idle.items():
+                keep = []
+                for session in idle:
+                    if now - session.last_used > self.idle_timeout or not session.is_alive():
+                        session.close()
+                        self._open[key] -= 1
+                        self.evictions += 1
+                    else:
+                        keep.append(session)
+                idle[:] = keep
+            self._cond.notify_all()
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            await self.evict_idle()
+
+    async def close_all(self):
+        if self._reaper:
+            self._reaper.cancel()
+        for idle in self._idle.values():
+            for session in idle:
+                session.close()
+                self._open[session.key] -= 1
+        self._idle.clear()
+        self._cond = None
+        self._reaper = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "reconnects": self.reconnects,
+            "evictions": self.evictions,
+            "open_sessions": sum(self._open.values()),
+            "idle_sessions": sum(len(idle) for idle in self._idle.values()),
+            "devices": sum(1 for count in self._open.values() if count),
+        }
+
+
+def _map_error(host: str, label: str, error: Exception) -> Exception:
+    # Same messages as the Paramiko backend, so callers and API responses do not change
+    if isinstance(error, asyncssh.PermissionDenied):
+        SSH_ERRORS.labels(device_type=label, kind="auth").inc()
+        logger.error(f"Authentication failed for {host}")
+        return SSHAuthenticationError("Authentication failed")
+    if isinstance(error, SSHConnectError):
+        SSH_ERRORS.labels(device_type=label, kind="connection").inc()
+        logger.error(f"Error connecting to {host}: {str(error)}")
+        return SSHConnectError(f"Connection error: {str(error)}")
+    if isinstance(error, asyncssh.Error):
+        SSH_ERRORS.labels(device_type=label, kind="ssh").inc()
+        logger.error(f"SSH error for {host}: {str(error)}")
+        return Exception(f"SSH error: {str(error)}")
+    SSH_ERRORS.labels(device_type=label, kind="connection").inc()
+    logger.error(f"Error connecting to {host}: {str(error)}")
+    return Exception(f"Connection error: {str(error) or type(error).__name__}")
+
+
+async def run_command(connection: asyncssh.SSHClientConnection, command: str, timeout: float) -> str:
+    """
+    Run a single command on its own channel and return stdout, or stderr if stdout is empty.
+    """
+    result = await connection.run(command, check=False, timeout=timeout, encoding="utf-8", errors="replace")
+    output, error = (result.stdout or "").strip(), (result.stderr or "").strip()
+    return output if output else error
+
+
+async def _open_shell(connection: asyncssh.SSHClientConnection, identified_type: Optional[str]) -> AsyncInteractiveShell:
+    process = await connection.create_process(term_type="vt100", term_size=(511, 1000), encoding="utf-8", errors="replace")
+    shell = AsyncInteractiveShell(process, identified_type, settings.SSH_COMMAND_TIMEOUT)
+    try:
+        await shell.start()
+    except BaseException:
+        process.close()
+        raise
+    return shell
+
+
+class AsyncSSHBackend:
+    """
+    SSH backend on asyncssh: sessions are coroutines on the event loop instead of threads of
+    the SSH pool, so concurrency is bounded by the per-device session limit and the callers'
+    semaphores rather than SSH_WORKER_THREADS.
+    """
+    name = "asyncssh"
+
+    def __init__(self):
+        self.pool = AsyncSSHPool(
+            max_sessions_per_device=settings.SSH_POOL_MAX_SESSIONS_PER_DEVICE,
+            idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+            keepalive_interval=settings.SSH_KEEPALIVE_INTERVAL,
+            connect_timeout=settings.SSH_CONNECT_TIMEOUT,
+        )
+
+    async def _with_session(
+        self, host: str, username: str, password: str, func: Callable[[asyncssh.SSHClientConnection], Awaitable[T]], device_type: Optional[str]
+    ) -> T:
+        for attempt in range(2):
+            session = await self.pool.acquire(host, username, password, device_type)
+            try:
+                with SSH_SESSIONS_IN_FLIGHT.track_inprogress():
+                    result = await func(session.connection)
+            except STALE_ERRORS:
+                stale = session.reused and not session.is_alive() and not attempt
+                await self.pool.discard(session)
+                if not stale:
+                    raise
+                self.pool.reconnects += 1
+                logger.info(f"Pooled SSH session to {host} was stale, reconnecting")
+                continue
+            except BaseException:
+                await self.pool.release(session)
+                raise
+            await self.pool.release(session)
+            return result
+        raise asyncssh.ConnectionLost(f"Could not obtain a working SSH session to {host}")
+
+    async def execute(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        commands: List[str],
+        mode: str = "exec",
+        identified_type: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, str]:
+        label = device_label(identified_type)
+
+        async def execute(connection: asyncssh.SSHClientConnection) -> Dict[str, str]:
+            if mode == "shell":
+                with span("ssh.shell", host=host, commands=len(commands)), timed(SSH_COMMAND_SECONDS, device_type=label, mode=mode):
+                    shell = await _open_shell(connection, identified_type)
+                    try:
+                        return {command: await shell.send(command) for command in commands}
+                    finally:
+                        await shell.close()
+            outputs = {}
+            for command in commands:
+                with span("ssh.command", host=host, command=command), timed(SSH_COMMAND_SECONDS, device_type=label, mode=mode):
+                    outputs[command] = await run_command(connection, command, settings.SSH_COMMAND_TIMEOUT)
+            return outputs
+
+        # Cancellation stops a coroutine for real, and _with_session releases its connection on the way out
+        deadline = asyncio.timeout(timeout)
+        try:
+            async with deadline:
+                return await self._with_session(host, username, password, execute, identified_type)
+        except Exception as e:
+            if deadline.expired():
+                SSH_ERRORS.labels(device_type=label, kind="timeout").inc()
+                logger.error(f"SSH call to {host} ran out of time")
+                raise SSHTimeoutError("Deadline exceeded")
+            raise _map_error(host, label, e)
+
+    async def probe(self, host: str, username: str, password: str, read_prompt: bool = False) -> Dict[str, str]:
+        async def probe(connection: asyncssh.SSHClientConnection) -> Dict[str, str]:
+            evidence = {
+                "server_version": connection.get_extra_info("server_version") or "",
+                "banner": connection.get_owner().banner,
+                "prompt": "",
+            }
+            if read_prompt:
+                # A prompt that never settles is missing evidence, not a failed probe
+                try:
+                    shell = await _open_shell(connection, None)
+                except (TimeoutError, ConnectionError) as e:
+                    logger.debug(f"No shell prompt from {host}: {e}")
+                else:
+                    await shell.close()
+                    evidence["prompt"] = shell.prompt
+            return evidence
+
+        try:
+            return await self._with_session(host, username, password, probe, None)
+        except Exception as e:
+            raise _map_error(host, device_label(None), e)
+
+    async def stream(
+        self, host: str, username: str, password: str, commands: List[str], mode: str = "exec", identified_type: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Same events as the Paramiko backend. Flow control needs no queue here: output is only
+        read from the channel when the consumer asks for the next event.
+        """
+        label = device_label(identified_type)
+        try:
+            session = await self.pool.acquire(host, username, password, identified_type)
+        except Exception as e:
+            raise _map_error(host, label, e)
+        healthy = True
+        try:
+            with SSH_SESSIONS_IN_FLIGHT.track_inprogress():
+                if mode == "shell":
+                    shell = await _open_shell(session.connection, identified_type)
+                    try:
+                        for command in commands:
+                            yield {"event": "command_start", "command": command}
+                            yield {"event": "chunk", "command": command, "stream": "stdout", "data": await shell.send(command)}
+                            yield {"event": "command_end", "command": command, "exit_status": None}
+                    finally:
+                        await shell.close()
+                    return
+                for command in commands:
+                    async with await session.connection.create_process(command, encoding="utf-8", errors="replace") as process:
+                        yield {"event": "command_start", "command": command}
+                        # One read in flight per stream, so a command filling its stderr window
+                        # cannot stall behind a stdout that is only read to EOF (or vice versa)
+                        readers = {"stdout": process.stdout, "stderr": process.stderr}
+                        reads = {asyncio.ensure_future(reader.read(settings.STREAM_CHUNK_SIZE)): name for name, reader in readers.items()}
+                        try:
+                            while reads:
+                                done, _ = await asyncio.wait(reads, timeout=settings.SSH_COMMAND_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+                                if not done:
+                                    raise TimeoutError()
+                                for read in done:
+                                    stream_name = reads.pop(read)
+                                    data = read.result()
+                                    if data:
+                                        reads[asyncio.ensure_future(readers[stream_name].read(settings.STREAM_CHUNK_SIZE))] = stream_name
+                                        yield {"event": "chunk", "command": command, "stream": stream_name, "data": data}
+                        finally:
+                            for read in reads:
+                                read.cancel()
+                        await asyncio.wait_for(process.wait_closed(), settings.SSH_COMMAND_TIMEOUT)
+                        yield {"event": "command_end", "command": command, "exit_status": process.exit_status}
+        except STALE_ERRORS as e:
+            healthy = False
+            raise _map_error(host, label, e)
+        except Exception as e:
+            raise _map_error(host, label, e)
+        finally:
+            if healthy:
+                await self.pool.release(session)
+            else:
+                await self.pool.discard(session)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.pool.stats()
+
+    async def close(self):
+        await self.pool.close_all()
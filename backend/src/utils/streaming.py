@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.settings import settings
+from src.utils.encryptor import PasswordEncryptor
+from src.utils.logging import logger
+from src.utils.ssh import ssh_stream_commands
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: Dict[str, Any]) -> str:
+    """
+    Format an event as a Server-Sent Events message; the seq doubles as the SSE id.
+    """
+    return f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+class _Sequencer:
+    """
+    Stamps events with the shared per-stream sequence number and elapsed time.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seq = 0
+
+    def stamp(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.seq += 1
+        event["seq"] = self.seq
+        event["elapsed"] = round(time.perf_counter() - self.started, 4)
+        return event
+
+
+async def stream_execute(
+    db: AsyncIOMotorDatabase,
+    devices: List[Dict[str, Any]],
+    commands: List[str],
+    mode: str = "exec",
+    max_concurrency: Optional[int] = None,
+    device_timeout: Optional[float] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run commands on one or more devices and yield their events interleaved as they arrive,
+    each stamped with device, command, seq and elapsed, followed by a final "done" summary.
+    Concurrency and per-device timeouts follow the same limits as bulk_execute.
+    """
+    concurrency = min(max_concurrency or settings.BULK_MAX_CONCURRENCY, settings.BULK_MAX_CONCURRENCY)
+    timeout = device_timeout or settings.BULK_DEVICE_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_QUEUE_SIZE)
+    sequencer = _Sequencer()
+    counts = {"success": 0, "failed": 0, "timeout": 0}
+
+    async def pump(device: Dict[str, Any]):
+        # Every event is tagged with the device; failures become a device_end event rather than an exception.
+        # The deadline also covers waiting for queue space, so a slow client cannot hold a device past it.
+        name = device["name"]
+        async with semaphore:
+            await queue.put({"event": "device_start", "device": name})
+            started = time.perf_counter()
+            status, error = "failed", "Stopped"
+            try:
+                async with asyncio.timeout(timeout):
+                    encryptor = PasswordEncryptor(db)
+                    password = await encryptor.decrypt(device["encrypted_password"], device["device_id"])
+                    events = ssh_stream_commands(device["ip"], device["username"], password, commands, mode, device.get("identified_type"))
+                    try:
+                        async for event in events:
+                            event["device"] = name
+                            await queue.put(event)
+                    finally:
+                        await events.aclose()
+                status, error = "success", None
+            except TimeoutError:
+                logger.warning(f"Streaming execute timed out on {name} after {timeout}s")
+                status, error = "timeout", f"Timed out after {timeout}s"
+            except Exception as e:
+                logger.warning(f"Streaming execute failed on {name}: {e}")
+                status, error = "failed", str(e)
+            finally:
+                # Unless the stream itself is being torn down (client gone), the consumer counts on this event
+                if not asyncio.current_task().cancelling():
+                    await queue.put({"event": "device_end", "device": name, "status": status, "error": error, "device_elapsed": time.perf_counter() - started})
+
+    tasks = [asyncio.create_task(pump(device)) for device in devices]
+    remaining = len(devices)
+    try:
+        while remaining:
+            event = await queue.get()
+            if event["event"] == "device_end":
+                remaining -= 1
+                counts[event["status"]] += 1
+            yield sequencer.stamp(event)
+        yield sequencer.stamp({
+            "event": "done",
+            "total": len(devices),
+            "succeeded": counts["success"],
+            "failed": counts["failed"],
+            "timed_out": counts["timeout"],
+        })
+    finally:
+        # The client may disconnect mid-stream; stop every device still running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
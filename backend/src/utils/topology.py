@@ -0,0 +1,285 @@
+import asyncio
+import ipaddress
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from src.utils.logging import logger
+from src.utils.networks import network_cidr_for
+
+BITS = 32
+
+
+class _Node:
+    __slots__ = ("key", "length", "children", "value")
+
+    def __init__(self, key: int, length: int, value: Any = None):
+        self.key = key
+        self.length = length
+        self.children: List[Optional["_Node"]] = [None, None]
+        self.value = value
+
+
+def _mask(key: int, length: int) -> int:
+    return key & ~((1 << (BITS - length)) - 1) if length else 0
+
+
+def _bit(key: int, position: int) -> int:
+    return (key >> (BITS - 1 - position)) & 1
+
+
+def _common_length(a: int, b: int, limit: int) -> int:
+    return min(BITS - (a ^ b).bit_length(), limit)
+
+
+class PrefixTrie:
+    """
+    Path-compressed binary radix tree (Patricia trie) of IPv4 prefixes of any length.
+    A node exists only where a stored prefix sits or two branches split, so every operation
+    walks at most 32 nodes whatever the number of entries.
+    """
+    def __init__(self):
+        self.root = _Node(0, 0)
+        self.size = 0
+
+    def get(self, key: int, length: int) -> Any:
+        node = self._find(key, length)
+        return node.value if node else None
+
+    def setdefault(self, key: int, length: int, factory) -> Any:
+        """
+        Return the value stored at key/length, storing factory() there first if there is none.
+        """
+        key = _mask(key, length)
+        node = self.root
+        while True:
+            if node.length == length:
+                if node.value is None:
+                    node.value = factory()
+                    self.size += 1
+                return node.value
+            bit = _bit(key, node.length)
+            child = node.children[bit]
+            if child is None:
+                node.children[bit] = _Node(key, length, factory())
+                self.size += 1
+                return node.children[bit].value
+            common = _common_length(key, child.key, min(length, child.length))
+            if common == child.length:
+                node = child
+                continue
+            # The new prefix and child diverge (or the new one is shorter): insert a node at the split
+            split = _Node(_mask(key, common), common)
+            split.children[_bit(child.key, common)] = child
+            node.children[bit] = split
+            node = split
+
+    def remove(self, key: int, length: int) -> bool:
+        key = _mask(key, length)
+        path = [self.root]
+        node = self.root
+        while node.length < length:
+            node = node.children[_bit(key, node.length)]
+            if node is None or node.length > length or _mask(key, node.length) != node.key:
+                return False
+            path.append(node)
+        if node.key != key or node.value is None:
+            return False
+        node.value = None
+        self.size -= 1
+        # Drop nodes left without a value, and splice out ones that no longer split two branches
+        for index in range(len(path) - 1, 0, -1):
+            current, parent = path[index], path[index - 1]
+            if current.value is not None:
+                break
+            children = [child for child in current.children if child]
+            slot = parent.children.index(current)
+            if len(children) == 2:
+                break
+            parent.children[slot] = children[0] if children else None
+        return True
+
+    def _find(self, key: int, length: int) -> Optional[_Node]:
+        key = _mask(key, length)
+        node = self.root
+        while node is not None and node.length < length:
+            node = node.children[_bit(key, node.length)]
+            if node is not None and (node.length > length or _mask(key, node.length) != node.key):
+                return None
+        return node if node is not None and node.key == key and node.value is not None else None
+
+    def covering(self, key: int, length: int) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Yield (key, length, value) of stored prefixes containing key/length, shortest first.
+        """
+        key = _mask(key, length)
+        node = self.root
+        while node is not None and node.length <= length and _mask(key, node.length) == node.key:
+            if node.value is not None:
+                yield node.key, node.length, node.value
+            if node.length == BITS:
+                break
+            node = node.children[_bit(key, node.length)]
+
+    def within(self, key: int, length: int) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Yield (key, length, value) of stored prefixes inside key/length (itself included), in address order.
+        """
+        key = _mask(key, length)
+        node = self.root
+        while node is not None and node.length < length:
+            node = node.children[_bit(key, node.length)]
+            if node is not None and _common_length(key, node.key, min(length, node.length)) < min(length, node.length):
+                return
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.value is not None:
+                yield current.key, current.length, current.value
+            stack.extend(child for child in reversed(current.children) if child)
+
+
+def _parse_network(cidr: str) -> ipaddress.IPv4Network:
+    try:
+        return ipaddress.IPv4Network(cidr, strict=False)
+    except ValueError as e:
+        raise ValueError(f"Invalid CIDR '{cidr}': {e}")
+
+
+class TopologyIndex:
+    """
+    In-memory index of device IPs and their /24 networks (network_cidr_for) in one prefix
+    trie: devices sit at /32 entries, networks at shorter ones, counted by the devices in them.
+    Built from the Devices collection at startup and updated in place on add, import and delete;
+    other processes' changes arrive with the periodic rebuild.
+    """
+    def __init__(self):
+        self._trie = PrefixTrie()
+        self.built_at: Optional[float] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _add(self, trie: PrefixTrie, device: Dict[str, Any]):
+        address = int(ipaddress.IPv4Address(device["ip"]))
+        trie.setdefault(address, BITS, dict)[device["device_id"]] = device["name"]
+        network = ipaddress.IPv4Network(network_cidr_for(device["ip"]))
+        counter = trie.setdefault(int(network.network_address), network.prefixlen, lambda: {"devices": 0})
+        counter["devices"] += 1
+
+    def add_device(self, device: Dict[str, Any]):
+        self._add(self._trie, device)
+
+    def remove_device(self, device: Dict[str, Any]):
+        address = int(ipaddress.IPv4Address(device["ip"]))
+        devices = self._trie.get(address, BITS)
+        if not devices or devices.pop(device["device_id"], None) is None:
+            return
+        if not devices:
+            self._trie.remove(address, BITS)
+        network = ipaddress.IPv4Network(network_cidr_for(device["ip"]))
+        counter = self._trie.get(int(network.network_address), network.prefixlen)
+        if counter:
+            counter["devices"] -= 1
+            if counter["devices"] <= 0:
+                self._trie.remove(int(network.network_address), network.prefixlen)
+
+    async def rebuild(self, db: AsyncIOMotorDatabase):
+        """
+        Build a fresh trie from the Devices collection and swap it in.
+        """
+        started = time.perf_counter()
+        trie = PrefixTrie()
+        count = 0
+        async for device in db["Devices"].find({}, {"_id": 0, "device_id": 1, "name": 1, "ip": 1}):
+            try:
+                self._add(trie, device)
+                count += 1
+            except ValueError:
+                logger.warning(f"Skipping device {device.get('name')} with invalid IP {device.get('ip')} in topology index")
+        self._trie = trie
+        self.built_at = time.time()
+        logger.info(f"Topology index built with {count} devices in {time.perf_counter() - started:.3f}s")
+
+    async def start(self, db: AsyncIOMotorDatabase, refresh_interval: float):
+        await self.rebuild(db)
+        if refresh_interval > 0:
+            self._refresher = asyncio.create_task(self._refresh(db, refresh_interval))
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh(self, db: AsyncIOMotorDatabase, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.rebuild(db)
+            except Exception as e:
+                logger.error(f"Topology index rebuild failed: {e}")
+
+    def _entries(self, entries: Iterator[Tuple[int, int, Any]]) -> Iterator[Tuple[str, int, Any]]:
+        for key, length, value in entries:
+            yield str(ipaddress.IPv4Address(key)), length, value
+
+    def devices_in(self, cidr: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Devices whose IP falls inside cidr, in address order. Raises ValueError for a malformed CIDR.
+        """
+        network = _parse_network(cidr)
+        devices = []
+        for ip, length, value in self._entries(self._trie.within(int(network.network_address), network.prefixlen)):
+            if length != BITS:
+                continue
+            devices.extend({"device_id": device_id, "name": name, "ip": ip} for device_id, name in sorted(value.items(), key=lambda item: item[1]))
+            if limit is not None and len(devices) >= limit:
+                return devices[:limit]
+        return devices
+
+    def ips_in(self, cidr: str) -> List[str]:
+        network = _parse_network(cidr)
+        return [ip for ip, length, _ in self._entries(self._trie.within(int(network.network_address), network.prefixlen)) if length == BITS]
+
+    def subnets(self, cidr: str) -> List[Dict[str, Any]]:
+        """
+        Known networks inside cidr (itself included), in address order.
+        """
+        network = _parse_network(cidr)
+        return [
+            {"network_cidr": f"{ip}/{length}", "devices": value["devices"]}
+            for ip, length, value in self._entries(self._trie.within(int(network.network_address), network.prefixlen))
+            if length != BITS
+        ]
+
+    def supernets(self, cidr: str) -> List[Dict[str, Any]]:
+        """
+        Known networks containing cidr (itself included), most specific first.
+        """
+        network = _parse_network(cidr)
+        covering = self._entries(self._trie.covering(int(network.network_address), network.prefixlen))
+        return [{"network_cidr": f"{ip}/{length}", "devices": value["devices"]} for ip, length, value in covering if length != BITS][::-1]
+
+    def lookup(self, ip: str) -> Dict[str, Any]:
+        """
+        Longest-prefix match of an address: the most specific known network containing it, every
+        network containing it, and the devices with exactly this IP.
+        """
+        try:
+            address = ipaddress.IPv4Address(ip)
+        except ValueError as e:
+            raise ValueError(f"Invalid IP address '{ip}': {e}")
+        networks = self.supernets(f"{address}/32")
+        devices = self._trie.get(int(address), BITS) or {}
+        return {
+            "ip": str(address),
+            "network": networks[0] if networks else None,
+            "supernets": networks,
+            "devices": [{"device_id": device_id, "name": name, "ip": str(address)} for device_id, name in sorted(devices.items(), key=lambda item: item[1])],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": self._trie.size, "built_at": self.built_at}
+
+
+topology_index = TopologyIndex()
@@ -0,0 +1,46 @@
+import asyncio
+import signal
+from prometheus_client import start_http_server
+from src.dependencies import close_mongo_connection, connect_to_mongo, get_db
+from src.settings import settings
+from src.utils.governor import ssh_governor
+from src.utils.indexes import ensure_indexes
+from src.utils.jobs import job_runner
+from src.utils.logging import logger
+from src.utils.scheduler import poll_scheduler
+from src.utils.ssh import ssh_backend
+
+
+async def run_worker():
+    """
+    Run a worker node: lease jobs from the shared Jobs collection (and run due schedules)
+    until SIGINT/SIGTERM. Start as many as needed with `python -m src.worker`; set
+    JOB_WORKER_EMBEDDED=false on the API so it only enqueues.
+    """
+    connect_to_mongo()
+    if settings.METRICS_ENABLED:
+        # Workers serve no API, so their metrics get a port of their own
+        start_http_server(settings.WORKER_METRICS_PORT)
+    if settings.ENSURE_INDEXES:
+        await ensure_indexes(get_db())
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await ssh_governor.attach(get_db())
+    await job_runner.start(get_db())
+    if settings.SCHEDULER_ENABLED:
+        await poll_scheduler.start(get_db())
+    logger.info(f"Worker {job_runner.node_id} started with {job_runner.concurrency} slots")
+    try:
+        await stopping.wait()
+    finally:
+        logger.info(f"Worker {job_runner.node_id} stopping")
+        await poll_scheduler.stop()
+        await job_runner.stop()
+        await ssh_backend.close()
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())